@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# Load generator and latency benchmark for the protectEvent.py webhook receiver.
+#
+# Replays realistic LPR alarm payloads (unique eventIds, plates and timestamps)
+# at a fixed rate and concurrency, then reports throughput, ack latency
+# percentiles and how much the job queue grew during the run.
+#
+# Examples:
+#   python bench_webhook.py --rate 50 --duration 30 --concurrency 8
+#   python bench_webhook.py --requests 5000 --concurrency 16 --triggers 2 --output bench_output.txt
+#   python bench_webhook.py --duration 60 --queue-db /tmp/bench/queue.db   (test server's queue)
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import string
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from event_queue import EventQueue
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.getenv("CONFIG_FILE", os.path.join(SCRIPT_DIR, "config.json"))
+
+DEVICES = ["F4E2C6700BFE", "68D79AE5ABE9", "E063DA01A4CE", "942A6F0B1C11"]
+
+
+def load_config():
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def random_plate(rng):
+    # Dutch-style side codes without dashes, as Protect reports them
+    letters = "BDFGHJKLNPRSTVXZ"
+    pattern = rng.choice(["LLDDDL", "DLLLDD", "LLLDDL", "DDLLLD", "LDDDLL"])
+    return "".join(rng.choice(letters) if c == "L" else rng.choice(string.digits) for c in pattern)
+
+
+def make_payload(rng, triggers, duplicate_of=None):
+    """Build a Protect alarm webhook body with `triggers` license plate triggers."""
+    if duplicate_of is not None:
+        return duplicate_of
+    now_ms = int(time.time() * 1000)
+    trigger_list = []
+    for _ in range(triggers):
+        event_id = "%024x" % rng.getrandbits(96)
+        plate = random_plate(rng)
+        trigger_list.append({
+            "device": rng.choice(DEVICES),
+            "value": plate,
+            "key": "license_plate_unknown",
+            "group": {"name": plate},
+            "eventId": event_id,
+            "timestamp": now_ms,
+        })
+    first_event = trigger_list[0]["eventId"]
+    return json.dumps({
+        "alarm": {
+            "name": "LPR benchmark",
+            "sources": [{"device": d, "type": "include"} for d in DEVICES],
+            "conditions": [{"condition": {"type": "is", "source": "license_plate_unknown"}}],
+            "triggers": trigger_list,
+            "eventPath": f"/protect/events/event/{first_event}",
+            "eventLocalLink": f"https://127.0.0.1/protect/events/event/{first_event}",
+        },
+        "timestamp": now_ms + 1000,
+    }).encode()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def queue_stats(queue):
+    if queue is None:
+        return None
+    try:
+        return queue.stats()
+    except Exception as e:
+        print(f"Could not read queue statistics: {e}", file=sys.stderr)
+        return None
+
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        url = urlparse(args.url)
+        self.host = url.hostname or "localhost"
+        self.port = url.port or 80
+        self.path = url.path or "/"
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.latencies = []
+        self.outcomes = {}
+        self.queue_samples = []
+        self.stop = threading.Event()
+
+    def claim(self):
+        """Return the index and scheduled send time of the next request, or None when done."""
+        with self.lock:
+            index = self.next_index
+            self.next_index += 1
+        if self.args.requests and index >= self.args.requests:
+            return None
+        if self.args.rate:
+            scheduled = self.started + index / self.args.rate
+        else:
+            scheduled = time.monotonic()
+        if self.args.duration and scheduled - self.started >= self.args.duration:
+            return None
+        return index, scheduled
+
+    def record(self, outcome, latency):
+        with self.lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def worker(self, seed):
+        rng = random.Random(seed)
+        conn = None
+        last_body = None
+        while not self.stop.is_set():
+            claimed = self.claim()
+            if claimed is None:
+                break
+            _, scheduled = claimed
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            duplicate = last_body if last_body and rng.random() < self.args.duplicate_ratio else None
+            body = make_payload(rng, self.args.triggers, duplicate_of=duplicate)
+            last_body = body
+            # With a fixed rate, latency is measured from the scheduled send time so a
+            # slow server cannot hide its queueing delay (coordinated omission)
+            start = scheduled if self.args.rate else time.monotonic()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection(self.host, self.port, timeout=self.args.timeout)
+                conn.request("POST", self.path, body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                latency = time.monotonic() - start
+                self.record(str(response.status), latency)
+                if response.getheader("Connection", "").lower() == "close":
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException) as e:
+                self.record(type(e).__name__, None)
+                if conn is not None:
+                    conn.close()
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def sample_queue(self, queue):
+        while not self.stop.wait(self.args.sample_interval):
+            stats = queue_stats(queue)
+            if stats is not None:
+                self.queue_samples.append(stats["pending"] + stats["leased"])
+
+    def run(self, queue):
+        queue_before = queue_stats(queue)
+        self.started = time.monotonic()
+        threads = [
+            threading.Thread(target=self.worker, args=(self.args.seed + i,), daemon=True)
+            for i in range(self.args.concurrency)
+        ]
+        sampler = None
+        if queue is not None:
+            sampler = threading.Thread(target=self.sample_queue, args=(queue,), daemon=True)
+            sampler.start()
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                t.join()
+        except KeyboardInterrupt:
+            self.stop.set()
+            for t in threads:
+                t.join()
+        elapsed = time.monotonic() - self.started
+        self.stop.set()
+        if sampler is not None:
+            sampler.join()
+        queue_after = queue_stats(queue)
+        return self.report(elapsed, queue_before, queue_after)
+
+    def report(self, elapsed, queue_before, queue_after):
+        latencies = sorted(self.latencies)
+        completed = len(latencies)
+        ms = lambda v: round(v * 1000, 2) if v is not None else None
+        result = {
+            "url": self.args.url,
+            "concurrency": self.args.concurrency,
+            "target_rate": self.args.rate or None,
+            "triggers_per_request": self.args.triggers,
+            "elapsed_seconds": round(elapsed, 3),
+            "requests_completed": completed,
+            "throughput_rps": round(completed / elapsed, 2) if elapsed > 0 else None,
+            "outcomes": self.outcomes,
+            "latency_ms": {
+                "min": ms(latencies[0]) if latencies else None,
+                "p50": ms(percentile(latencies, 50)),
+                "p95": ms(percentile(latencies, 95)),
+                "p99": ms(percentile(latencies, 99)),
+                "max": ms(latencies[-1]) if latencies else None,
+            },
+        }
+        if queue_before is not None and queue_after is not None:
+            open_before = queue_before["pending"] + queue_before["leased"]
+            open_after = queue_after["pending"] + queue_after["leased"]
+            result["queue"] = {
+                "open_before": open_before,
+                "open_after": open_after,
+                "growth": open_after - open_before,
+                "max_open": max(self.queue_samples + [open_before, open_after]),
+                "oldest_open_age_seconds": queue_after["oldest_open_age_seconds"],
+            }
+        return result
+
+
+def format_report(result):
+    lines = [
+        f"Target:       {result['url']} (concurrency {result['concurrency']}, "
+        f"rate {result['target_rate'] or 'unlimited'}/s, {result['triggers_per_request']} trigger(s)/request)",
+        f"Completed:    {result['requests_completed']} requests in {result['elapsed_seconds']}s "
+        f"({result['throughput_rps']} req/s)",
+        f"Outcomes:     {', '.join(f'{k}: {v}' for k, v in sorted(result['outcomes'].items()))}",
+        "Ack latency:  " + ", ".join(f"{k} {v} ms" for k, v in result["latency_ms"].items()),
+    ]
+    if "queue" in result:
+        q = result["queue"]
+        lines.append(
+            f"Queue:        {q['open_before']} -> {q['open_after']} open jobs "
+            f"(growth {q['growth']}, max {q['max_open']}, oldest {q['oldest_open_age_seconds']}s)"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    config = load_config()
+    default_port = config.get("server", {}).get("webhook_port", 1025)
+
+    parser = argparse.ArgumentParser(description="Benchmark the protectEvent.py webhook receiver")
+    parser.add_argument("--url", default=f"http://localhost:{default_port}/", help="Webhook URL")
+    parser.add_argument("--rate", type=float, default=0, help="Requests per second (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=positive_int, default=4, help="Number of concurrent connections")
+    parser.add_argument("--duration", type=float, default=10, help="Run time in seconds (0 = use --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="Total number of requests (0 = use --duration)")
+    parser.add_argument("--triggers", type=positive_int, default=1, help="License plate triggers per alarm payload")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0,
+                        help="Fraction of requests that resend the previous payload (exercises de-duplication)")
+    parser.add_argument("--timeout", type=float, default=10, help="Per-request timeout in seconds")
+    # Opening the queue creates its schema and sets its PRAGMAs, so it is never taken from
+    # config.json: that would be the production queue
+    parser.add_argument("--queue-db",
+                        help="Queue database of the webhook under test to watch for growth (default: none)")
+    parser.add_argument("--no-queue", action="store_true", help="Do not report queue growth")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="Queue sampling interval in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for payload generation")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--output", help="Append the JSON report to this file")
+    args = parser.parse_args()
+
+    if not args.duration and not args.requests:
+        parser.error("either --duration or --requests must be set")
+
+    queue = None
+    if not args.no_queue and args.queue_db and os.path.exists(args.queue_db):
+        queue = EventQueue(args.queue_db)
+
+    result = Benchmark(args).run(queue)
+    print(json.dumps(result, indent=2) if args.json else format_report(result))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
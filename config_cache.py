@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+from plate_matcher import PlateMatcher
+
+
+def ignored_plates_from_config(config):
+    """Return a PlateMatcher for the ignored plate patterns in a config dict."""
+    # Entries are {"plate": ..., "comment": ...} dicts; older configs use plain strings
+    return PlateMatcher(
+        str(item["plate"] if isinstance(item, dict) else item)
+        for item in config.get("ignored_plates", [])
+        if (isinstance(item, dict) and item.get("plate")) or (isinstance(item, str) and item)
+    )
+
+
+class ConfigCache:
+    """Parsed copy of config.json that is only reloaded when the file changes.
+
+    The file is stat()'ed at most once per check_interval seconds and re-parsed when
+    its mtime, size or inode changed, which is also when the ignored-plates matcher
+    is rebuilt. SIGHUP forces a reload on the next access.
+    If a changed file cannot be parsed (e.g. the web UI is halfway through saving
+    it) the last good config stays active and the reload is retried on the next check.
+    """
+
+    def __init__(self, path, check_interval=0.5, logger=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._config = None
+        self._signature = None
+        self._next_check = 0.0
+        self._force_reload = False
+        self.ignored_plates = PlateMatcher()
+
+    def _stat_signature(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load(self, signature):
+        with open(self.path, 'r') as f:
+            config = json.load(f)
+        self.ignored_plates = ignored_plates_from_config(config)
+        self._config = config
+        self._signature = signature
+
+    def get(self):
+        """Return the current config dict, reloading it first if config.json changed.
+
+        Raises FileNotFoundError / json.JSONDecodeError only if no config was ever loaded.
+        """
+        now = time.monotonic()
+        if self._config is not None and now < self._next_check and not self._force_reload:
+            return self._config
+
+        with self._lock:
+            if self._config is not None and now < self._next_check and not self._force_reload:
+                return self._config
+            self._next_check = now + self.check_interval
+            force = self._force_reload
+            self._force_reload = False
+            try:
+                signature = self._stat_signature()
+                if force or signature != self._signature:
+                    self._load(signature)
+                    self.logger.info(f"Loaded configuration from {self.path}")
+            except (OSError, ValueError) as e:
+                if self._config is None:
+                    raise
+                self.logger.warning(f"Could not reload {self.path}, keeping previous configuration: {e}")
+            return self._config
+
+    def invalidate(self):
+        """Force a reload on the next get()."""
+        self._force_reload = True
+
+    def install_sighup_handler(self):
+        """Reload the config on SIGHUP. Must be called from the main thread."""
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.invalidate())
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def delivery_key(trigger):
+    """Return the de-duplication key for a webhook trigger, or None if it has no eventId."""
+    event_id = trigger.get("eventId")
+    if not event_id:
+        return None
+    return f"{event_id}|{trigger.get('device')}|{trigger.get('value')}"
+
+
+class DedupCache:
+    """TTL + LRU set of recently seen webhook deliveries.
+
+    Lookups are a dict access. When a store is given (an EventQueue) new keys are
+    written through to it and the cache is warmed from it on startup, so a
+    redelivery right after a restart is still recognised.
+    """
+
+    def __init__(self, ttl=3600, max_entries=10000, store=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()
+        self._next_purge = 0.0
+        if store is not None:
+            now = time.time()
+            store.purge_delivery_keys(now - ttl)
+            for key, seen_at in store.load_delivery_keys(now - ttl):
+                self._seen[key] = seen_at
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            self._next_purge = now + ttl
+
+    def __len__(self):
+        return len(self._seen)
+
+    def check_and_add(self, key, persist=True):
+        """Record key and return True if it was already seen within the TTL.
+
+        With persist=False the caller is responsible for saving new keys to the store,
+        e.g. in the same transaction as the jobs they belong to.
+        """
+        if key is None:
+            return False
+        now = time.time()
+        with self._lock:
+            seen_at = self._seen.get(key)
+            if seen_at is not None and now - seen_at < self.ttl:
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            purge = now >= self._next_purge
+            if purge:
+                self._next_purge = now + self.ttl
+        if self.store is not None:
+            if persist:
+                self.store.save_delivery_key(key, now)
+            if purge:
+                self.store.purge_delivery_keys(now - self.ttl)
+        return False
+
+    def discard(self, key):
+        """Forget key, e.g. when the delivery could not be queued and a redelivery must be accepted."""
+        if key is None:
+            return
+        with self._lock:
+            self._seen.pop(key, None)
+        if self.store is not None:
+            self.store.delete_delivery_key(key)
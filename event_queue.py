@@ -0,0 +1,649 @@
+import os
+import json
+import select
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# Job states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_QUEUE_DB_NAME = "queue.db"
+DEFAULT_NOTIFY_SOCKET_NAME = "queue.sock"
+
+
+def queue_db_path(config):
+    """Return the queue database path for a config dict.
+
+    Uses paths.queue_db_file if set, otherwise queue.db next to the event database.
+    """
+    path = config.get("paths", {}).get("queue_db_file")
+    if path:
+        return path
+    db_file = config.get("sqlite3_db_file", "/var/lib/protect-lpr/mysql/protect-lpr.db")
+    return os.path.join(os.path.dirname(db_file), DEFAULT_QUEUE_DB_NAME)
+
+
+def queue_notify_socket_path(config):
+    """Return the Unix socket path used to wake the media worker.
+
+    Uses paths.queue_notify_socket if set, otherwise queue.sock next to the queue database.
+    """
+    path = config.get("paths", {}).get("queue_notify_socket")
+    if path:
+        return path
+    return os.path.join(os.path.dirname(queue_db_path(config)), DEFAULT_NOTIFY_SOCKET_NAME)
+
+
+def notify_worker(socket_path):
+    """Tell the media worker that new jobs were queued.
+
+    Best effort: if the worker is not running or its socket buffer is full the
+    notification is dropped, and the worker picks the job up on its next poll.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.sendto(b"1", socket_path)
+    except OSError:
+        return False
+    return True
+
+
+class QueueWaker:
+    """Receiving end of notify_worker(): a Unix datagram socket the worker sleeps on."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        if os.path.exists(socket_path):
+            # Stale socket from a previous run
+            os.unlink(socket_path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(socket_path)
+        self.sock.setblocking(False)
+        os.chmod(socket_path, 0o660)
+
+    def wait(self, timeout):
+        """Sleep until notified or timeout seconds passed. Returns True if notified."""
+        readable, _, _ = select.select([self.sock], [], [], max(0.0, timeout))
+        if not readable:
+            return False
+        # Collapse a burst of notifications into a single wake-up
+        while True:
+            try:
+                self.sock.recv(64)
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+class EventQueue:
+    """Durable work queue between the webhook (producer) and the media worker (consumer).
+
+    Jobs live in a WAL-mode SQLite table. A job is ready when its status is pending
+    and not_before has passed. Leasing a job marks it leased and pushes not_before
+    to the end of the visibility timeout: if the worker dies before ack()/retry(),
+    the job simply becomes ready again. Claiming is a single probe of a partial index
+    on not_before, so it does not depend on the size of the backlog.
+
+    A lease is identified by its leased_at time: ack_many(), retry() and defer() only
+    act on a job while the lease it was returned with is still its current one. A worker
+    that ran past the visibility timeout, after which the job was leased again, cannot
+    finish or reschedule the job under the newer attempt.
+    """
+
+    def __init__(self, db_file, visibility_timeout=600, max_attempts=5, synchronous="FULL"):
+        self.db_file = db_file
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly where needed
+        self.conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # FULL survives power loss; NORMAL (WAL) survives process crashes but may lose
+        # the last commits on power loss
+        if synchronous.upper() not in ("FULL", "NORMAL"):
+            raise ValueError(f"Unsupported synchronous mode: {synchronous}")
+        self.conn.execute(f"PRAGMA synchronous={synchronous.upper()}")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS event_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    log_time TEXT NOT NULL,
+                    license_plate TEXT NOT NULL,
+                    timestamp_ms INTEGER NOT NULL,
+                    received_at REAL NOT NULL,
+                    not_before REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    leased_at REAL,
+                    finished_at REAL,
+                    last_error TEXT
+                )"""
+            )
+            # Partial index over open jobs only, so claiming stays a single index probe
+            # no matter how many finished jobs are kept for reporting
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_event_queue_open ON event_queue (not_before) "
+                "WHERE status IN ('pending', 'leased')"
+            )
+            # Open jobs by event time, for lease_overlapping()
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_event_queue_open_ts ON event_queue (timestamp_ms) "
+                "WHERE status IN ('pending', 'leased')"
+            )
+            # Progress reported by the media worker (backlog size, ETA), read by the webhook's /metrics
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS worker_status (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            # Finished processing steps of open jobs (downloaded cameras, trimmed clips), so a
+            # restarted worker resumes a job instead of starting over. Removed on ack.
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS job_checkpoint (
+                    job_id INTEGER NOT NULL,
+                    step TEXT NOT NULL,
+                    item TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, step, item)
+                )"""
+            )
+            # Recently seen webhook deliveries, see dedup_cache.DedupCache
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS webhook_delivery (
+                    delivery_key TEXT PRIMARY KEY,
+                    seen_at REAL NOT NULL
+                )"""
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_webhook_delivery_seen_at ON webhook_delivery (seen_at)"
+            )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def enqueue(self, log_time, license_plate, timestamp_ms, not_before=None):
+        """Add a job and return its id. not_before defaults to now."""
+        return self.enqueue_many([(log_time, license_plate, timestamp_ms, not_before)])[0]
+
+    def enqueue_many(self, jobs, delivery_keys=()):
+        """Add (log_time, license_plate, timestamp_ms, not_before) jobs in one transaction.
+
+        delivery_keys are saved in the same transaction (see save_delivery_key).
+        Returns the new job ids in order.
+        """
+        now = time.time()
+        job_ids = []
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for log_time, license_plate, timestamp_ms, not_before in jobs:
+                    cur = self.conn.execute(
+                        "INSERT INTO event_queue (log_time, license_plate, timestamp_ms, received_at, not_before) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (log_time, license_plate, int(timestamp_ms), now, now if not_before is None else not_before),
+                    )
+                    job_ids.append(cur.lastrowid)
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO webhook_delivery (delivery_key, seen_at) VALUES (?, ?)",
+                    [(key, now) for key in delivery_keys],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return job_ids
+
+    def _next_ready(self, now, min_timestamp_ms=None, max_timestamp_ms=None):
+        """Return the next ready row, optionally only for events in [min_timestamp_ms, max_timestamp_ms).
+
+        Without bounds this is the job that has been due longest; with bounds it is the
+        oldest event in that range (using the timestamp index, so a large backlog outside
+        the range is not scanned).
+        """
+        if min_timestamp_ms is None and max_timestamp_ms is None:
+            return self.conn.execute(
+                "SELECT * FROM event_queue WHERE status IN ('pending', 'leased') AND not_before <= ? "
+                "ORDER BY not_before LIMIT 1",
+                (now,),
+            ).fetchone()
+        return self.conn.execute(
+            "SELECT * FROM event_queue WHERE status IN ('pending', 'leased') AND not_before <= ? "
+            "AND timestamp_ms >= ? AND timestamp_ms < ? ORDER BY timestamp_ms LIMIT 1",
+            (
+                now,
+                -2**63 if min_timestamp_ms is None else int(min_timestamp_ms),
+                2**63 - 1 if max_timestamp_ms is None else int(max_timestamp_ms),
+            ),
+        ).fetchone()
+
+    def lease(self, now=None, min_timestamp_ms=None, max_timestamp_ms=None):
+        """Claim the next ready job and return it as a dict, or None if nothing is ready.
+
+        min_timestamp_ms / max_timestamp_ms restrict it to events in that time range.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._next_ready(now, min_timestamp_ms, max_timestamp_ms)
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE event_queue SET status = ?, attempts = attempts + 1, leased_at = ?, not_before = ? "
+                    "WHERE id = ?",
+                    (LEASED, now, now + self.visibility_timeout, row["id"]),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return self._leased(row, now)
+
+    def lease_overlapping(self, window_start_ms, window_end_ms, max_span_ms, max_jobs=20, now=None,
+                          min_timestamp_ms=None, max_timestamp_ms=None):
+        """Claim the next ready job plus the open jobs whose footage windows overlap it.
+
+        A job's window is [timestamp_ms + window_start_ms, timestamp_ms + window_end_ms].
+        Starting from the next ready job, overlapping jobs are added as long as the merged
+        window stays within max_span_ms. Ready jobs may extend the merged window; jobs that
+        are not ready yet are only added when their window lies inside it (that footage is
+        already recorded). Returns the leased jobs, the first one being the job that was
+        due, or an empty list if nothing is ready. min_timestamp_ms / max_timestamp_ms
+        restrict the first job as in lease().
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                leader = self._next_ready(now, min_timestamp_ms, max_timestamp_ms)
+                if leader is None:
+                    self.conn.execute("COMMIT")
+                    return []
+                group = [leader]
+                start = leader["timestamp_ms"] + window_start_ms
+                end = leader["timestamp_ms"] + window_end_ms
+                candidates = self.conn.execute(
+                    "SELECT * FROM event_queue WHERE status IN ('pending', 'leased') "
+                    "AND timestamp_ms BETWEEN ? AND ? AND id != ? ORDER BY timestamp_ms",
+                    (leader["timestamp_ms"] - max_span_ms, leader["timestamp_ms"] + max_span_ms, leader["id"]),
+                ).fetchall()
+                candidates = [
+                    row for row in candidates
+                    # Skip jobs leased by someone else and jobs waiting out a retry delay
+                    if row["not_before"] <= now or (row["status"] == PENDING and row["attempts"] == 0)
+                ]
+                added = True
+                while added and len(group) < max_jobs:
+                    added = False
+                    for row in candidates:
+                        if len(group) >= max_jobs:
+                            break
+                        row_start = row["timestamp_ms"] + window_start_ms
+                        row_end = row["timestamp_ms"] + window_end_ms
+                        if row_end < start or row_start > end:
+                            continue
+                        if row["not_before"] > now and (row_start < start or row_end > end):
+                            continue
+                        new_start, new_end = min(start, row_start), max(end, row_end)
+                        if new_end - new_start > max_span_ms:
+                            continue
+                        group.append(row)
+                        start, end = new_start, new_end
+                        added = True
+                    candidates = [row for row in candidates if row not in group]
+                self.conn.executemany(
+                    "UPDATE event_queue SET status = ?, attempts = attempts + 1, leased_at = ?, not_before = ? "
+                    "WHERE id = ?",
+                    [(LEASED, now, now + self.visibility_timeout, row["id"]) for row in group],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [self._leased(row, now) for row in group]
+
+    def _leased(self, row, now):
+        """Return a leased row as a dict with the values the lease just wrote."""
+        job = dict(row)
+        job["status"] = LEASED
+        job["attempts"] += 1
+        job["leased_at"] = now
+        job["not_before"] = now + self.visibility_timeout
+        return job
+
+    def ack(self, job):
+        """Mark a leased job as done. Returns False if the job was leased again since."""
+        return bool(self.ack_many([job]))
+
+    def ack_many(self, jobs):
+        """Mark leased jobs (as returned by lease()) as done in one transaction.
+
+        Jobs that were leased again after their lease expired are left to the newer
+        lease. Returns the ids of the jobs marked done.
+        """
+        now = time.time()
+        acked = []
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job in jobs:
+                    cur = self.conn.execute(
+                        "UPDATE event_queue SET status = ?, finished_at = ?, last_error = NULL "
+                        "WHERE id = ? AND status = ? AND leased_at = ?",
+                        (DONE, now, job["id"], LEASED, job["leased_at"]),
+                    )
+                    if cur.rowcount:
+                        acked.append(job["id"])
+                self.conn.executemany(
+                    "DELETE FROM job_checkpoint WHERE job_id = ?", [(job_id,) for job_id in acked]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return acked
+
+    def retry(self, job, error, delay=30):
+        """Return a failed job to the queue after delay seconds, or mark it failed
+        once it has used up max_attempts. Returns True if the job will be retried,
+        False if it failed for good, or None if it was leased again since (the newer
+        lease decides)."""
+        now = time.time()
+        give_up = job["attempts"] >= self.max_attempts
+        with self._lock:
+            if give_up:
+                cur = self.conn.execute(
+                    "UPDATE event_queue SET status = ?, finished_at = ?, last_error = ? "
+                    "WHERE id = ? AND status = ? AND leased_at = ?",
+                    (FAILED, now, str(error), job["id"], LEASED, job["leased_at"]),
+                )
+                if cur.rowcount:
+                    self.conn.execute("DELETE FROM job_checkpoint WHERE job_id = ?", (job["id"],))
+            else:
+                cur = self.conn.execute(
+                    "UPDATE event_queue SET status = ?, not_before = ?, last_error = ? "
+                    "WHERE id = ? AND status = ? AND leased_at = ?",
+                    (PENDING, now + delay, str(error), job["id"], LEASED, job["leased_at"]),
+                )
+        if not cur.rowcount:
+            return None
+        return not give_up
+
+    def defer(self, job, delay, reason=None):
+        """Return a leased job to the queue for another try after delay seconds, without
+        counting the attempt (e.g. because its footage is not recorded yet).
+        Returns False if the job was leased again since."""
+        with self._lock:
+            return bool(self.conn.execute(
+                "UPDATE event_queue SET status = ?, attempts = MAX(attempts - 1, 0), not_before = ?, last_error = ? "
+                "WHERE id = ? AND status = ? AND leased_at = ?",
+                (PENDING, time.time() + delay, reason, job["id"], LEASED, job["leased_at"]),
+            ).rowcount)
+
+    def release_leases(self):
+        """Make all leased jobs ready again now. Called by the worker at startup: leases
+        still held then belong to a worker that died, and the jobs can be resumed from
+        their checkpoints instead of waiting out the visibility timeout.
+        Returns the number of released jobs."""
+        with self._lock:
+            return self.conn.execute(
+                "UPDATE event_queue SET status = ?, not_before = ? WHERE status = ?",
+                (PENDING, time.time(), LEASED),
+            ).rowcount
+
+    def checkpoint(self, job_ids, step, item, value):
+        """Record that step is done for item (e.g. a camera or a clip) of these jobs.
+
+        value is JSON-serializable, typically the files the step produced.
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO job_checkpoint (job_id, step, item, value, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, step, item, json.dumps(value), now) for job_id in job_ids],
+            )
+
+    def checkpoints(self, job_ids, step):
+        """Return {job_id: {item: value}} as recorded by checkpoint() for step."""
+        found = {}
+        with self._lock:
+            for job_id in job_ids:
+                rows = self.conn.execute(
+                    "SELECT item, value FROM job_checkpoint WHERE job_id = ? AND step = ?", (job_id, step)
+                ).fetchall()
+                if rows:
+                    found[job_id] = {row["item"]: json.loads(row["value"]) for row in rows}
+        return found
+
+    def purge(self, older_than_seconds):
+        """Delete done and failed jobs that finished more than older_than_seconds ago."""
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            cur = self.conn.execute(
+                "DELETE FROM event_queue WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, cutoff),
+            )
+            # Checkpoints of jobs that no longer exist
+            self.conn.execute(
+                "DELETE FROM job_checkpoint WHERE job_id NOT IN "
+                "(SELECT id FROM event_queue WHERE status IN ('pending', 'leased'))"
+            )
+            return cur.rowcount
+
+    def save_delivery_key(self, delivery_key, seen_at):
+        """Remember a webhook delivery so duplicates are recognised across restarts."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO webhook_delivery (delivery_key, seen_at) VALUES (?, ?)",
+                (delivery_key, seen_at),
+            )
+
+    def load_delivery_keys(self, since):
+        """Return (delivery_key, seen_at) pairs seen after since, oldest first."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT delivery_key, seen_at FROM webhook_delivery WHERE seen_at >= ? ORDER BY seen_at",
+                (since,),
+            ).fetchall()
+
+    def delete_delivery_key(self, delivery_key):
+        with self._lock:
+            self.conn.execute("DELETE FROM webhook_delivery WHERE delivery_key = ?", (delivery_key,))
+
+    def purge_delivery_keys(self, before):
+        with self._lock:
+            return self.conn.execute(
+                "DELETE FROM webhook_delivery WHERE seen_at < ?", (before,)
+            ).rowcount
+
+    def next_ready_in(self, now=None, min_timestamp_ms=None, max_timestamp_ms=None):
+        """Seconds until the next open job becomes ready (0 if one is ready now), or None if the queue is empty.
+
+        min_timestamp_ms / max_timestamp_ms restrict it to events in that time range.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if min_timestamp_ms is None and max_timestamp_ms is None:
+                next_not_before = self.conn.execute(
+                    "SELECT MIN(not_before) FROM event_queue WHERE status IN ('pending', 'leased')"
+                ).fetchone()[0]
+            else:
+                next_not_before = self.conn.execute(
+                    "SELECT MIN(not_before) FROM event_queue WHERE status IN ('pending', 'leased') "
+                    "AND timestamp_ms >= ? AND timestamp_ms < ?",
+                    (
+                        -2**63 if min_timestamp_ms is None else int(min_timestamp_ms),
+                        2**63 - 1 if max_timestamp_ms is None else int(max_timestamp_ms),
+                    ),
+                ).fetchone()[0]
+        if next_not_before is None:
+            return None
+        return max(0.0, next_not_before - now)
+
+    def depth(self, max_timestamp_ms=None):
+        """Number of jobs that still have to be processed (pending or leased), optionally
+        only for events before max_timestamp_ms."""
+        with self._lock:
+            if max_timestamp_ms is None:
+                return self.conn.execute(
+                    "SELECT COUNT(*) FROM event_queue WHERE status IN ('pending', 'leased')"
+                ).fetchone()[0]
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM event_queue WHERE status IN ('pending', 'leased') AND timestamp_ms < ?",
+                (int(max_timestamp_ms),),
+            ).fetchone()[0]
+
+    def set_worker_status(self, name, value):
+        """Store a JSON-serializable status dict for name (e.g. the media worker's backlog ETA)."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO worker_status (name, value, updated_at) VALUES (?, ?, ?)",
+                (name, json.dumps(value), time.time()),
+            )
+
+    def get_worker_status(self, name):
+        """Return (value, updated_at) as stored by set_worker_status, or (None, None)."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, updated_at FROM worker_status WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row["value"]), row["updated_at"]
+
+    def stats(self):
+        """Return a dict with job counts per status and the age of the oldest open job."""
+        now = time.time()
+        with self._lock:
+            counts = {
+                status: count
+                for status, count in self.conn.execute(
+                    "SELECT status, COUNT(*) FROM event_queue GROUP BY status"
+                )
+            }
+            oldest = self.conn.execute(
+                "SELECT MIN(received_at) FROM event_queue WHERE status IN ('pending', 'leased')"
+            ).fetchone()[0]
+        return {
+            "pending": counts.get(PENDING, 0),
+            "leased": counts.get(LEASED, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_open_age_seconds": round(now - oldest, 3) if oldest is not None else None,
+        }
+
+
+class GroupCommitter:
+    """Collects enqueue_many() calls from many threads and commits them together.
+
+    submit() returns immediately with a Future that resolves to the job ids once the
+    batch containing them is committed. A background thread commits whatever was
+    submitted every interval seconds, so concurrent webhooks share one transaction
+    (and one fsync) instead of paying for one each.
+    """
+
+    def __init__(self, queue, interval=0.005, on_commit=None, logger=None):
+        self.queue = queue
+        self.interval = interval
+        self.on_commit = on_commit
+        self.logger = logger
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, jobs, delivery_keys=()):
+        future = Future()
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("GroupCommitter is closed")
+            self._pending.append((list(jobs), list(delivery_keys), future))
+            self._cond.notify()
+        return future
+
+    def backlog(self):
+        """Number of submissions waiting for the next commit."""
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending and self._closing:
+                    return
+            # Give concurrent requests a moment to join this batch
+            time.sleep(self.interval)
+            with self._cond:
+                batch, self._pending = self._pending, []
+            self._commit(batch)
+
+    def _commit(self, batch):
+        jobs = [job for job_list, _, _ in batch for job in job_list]
+        keys = [key for _, key_list, _ in batch for key in key_list]
+        try:
+            job_ids = self.queue.enqueue_many(jobs, delivery_keys=keys)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            # Commit submissions one by one so a single bad event does not fail the others
+            if self.logger:
+                self.logger.warning(f"Group commit of {len(batch)} submissions failed ({e}), retrying individually")
+            for submission in batch:
+                self._commit([submission])
+            return
+
+        offset = 0
+        for job_list, _, future in batch:
+            future.set_result(job_ids[offset:offset + len(job_list)])
+            offset += len(job_list)
+        if self.on_commit and job_ids:
+            try:
+                self.on_commit(job_ids)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Group commit callback failed: {e}")
+
+    def close(self):
+        """Commit everything still pending and stop the writer thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    # Print queue statistics for the configured queue database
+    config_file = os.getenv("CONFIG_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json"))
+    with open(config_file, "r") as f:
+        config = json.load(f)
+    queue = EventQueue(queue_db_path(config))
+    print(json.dumps(queue.stats(), indent=2))
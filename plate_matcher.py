@@ -0,0 +1,97 @@
+import re
+
+# Ignored-plate patterns use the same syntax as the plate search in web.py:
+#   *  any number of characters
+#   %  exactly one character
+# Matching is case-insensitive and ignores dashes, spaces and other punctuation,
+# so "AB-123-C", "ab 123 c" and "AB123C" are the same plate.
+
+_PLATE_JUNK = re.compile(r'[^a-z0-9]')
+_PATTERN_JUNK = re.compile(r'[^a-z0-9*%]')
+
+
+def normalize_plate(plate):
+    """Return plate lower-cased with everything but letters and digits removed."""
+    return _PLATE_JUNK.sub('', str(plate).lower())
+
+
+def normalize_pattern(pattern):
+    """Return pattern lower-cased with everything but letters, digits, * and % removed."""
+    return _PATTERN_JUNK.sub('', str(pattern).lower())
+
+
+def _pattern_to_regex(pattern):
+    return ''.join('.*' if c == '*' else '.' if c == '%' else c for c in pattern)
+
+
+class PlateMatcher:
+    """Matches license plates against a list of ignored-plate patterns.
+
+    Patterns are split once at construction:
+      - exact plates go into a dict,
+      - prefix patterns ("ab12*", the usual fleet entry) into a dict keyed by prefix,
+        checked with one lookup per prefix length of the plate,
+      - anything else is compiled into a single combined regex.
+    A lookup therefore costs a few dict probes regardless of the number of exact
+    and prefix entries; only free-form wildcard patterns go through the regex.
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = []
+        self._exact = {}
+        self._prefixes = {}
+        self._prefix_lengths = ()
+        self._wildcards = []
+        for original in patterns:
+            pattern = normalize_pattern(original)
+            if not pattern or not pattern.strip('*'):
+                # Empty or match-everything patterns are almost certainly typos
+                continue
+            self.patterns.append(original)
+            if '*' not in pattern and '%' not in pattern:
+                self._exact.setdefault(pattern, []).append(original)
+            elif pattern.endswith('*') and not any(c in pattern.rstrip('*') for c in '*%'):
+                self._prefixes.setdefault(pattern.rstrip('*'), []).append(original)
+            else:
+                self._wildcards.append((re.compile(_pattern_to_regex(pattern)), original))
+        self._prefix_lengths = tuple(sorted({len(p) for p in self._prefixes}))
+        self._combined = None
+        if self._wildcards:
+            self._combined = re.compile('|'.join(f'(?:{rx.pattern})' for rx, _ in self._wildcards))
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __contains__(self, plate):
+        return self.matches(plate)
+
+    def matches(self, plate):
+        """Return True if plate matches any pattern."""
+        plate = normalize_plate(plate)
+        if not plate:
+            return False
+        if plate in self._exact:
+            return True
+        for length in self._prefix_lengths:
+            if length > len(plate):
+                break
+            if plate[:length] in self._prefixes:
+                return True
+        return self._combined is not None and self._combined.fullmatch(plate) is not None
+
+    def matching_patterns(self, plate):
+        """Return the original patterns that match plate, in no particular order."""
+        plate = normalize_plate(plate)
+        if not plate:
+            return []
+        found = list(self._exact.get(plate, ()))
+        for length in self._prefix_lengths:
+            if length > len(plate):
+                break
+            found.extend(self._prefixes.get(plate[:length], ()))
+        if self._combined is not None and self._combined.fullmatch(plate):
+            found.extend(original for rx, original in self._wildcards if rx.fullmatch(plate))
+        return found
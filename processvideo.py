@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 import subprocess
 import os
+import time
 
 from logger_setup import logger
 
@@ -11,8 +12,12 @@ def trim_motion_video(
     motion_threshold=1.0,
     motion_min_frames=5,
     ffmpeg_compress=True,
-    backup_original=True  # New parameter
+    backup_original=True,  # New parameter
+    timings=None  # dict, receives seconds spent in motion_scan / ffmpeg_trim / thumbnails
 ):
+    if timings is None:
+        timings = {}
+    stage_start = time.monotonic()
     # Open the video file
     cap = cv2.VideoCapture(video_path)
     logger.info(f"Opening video: {video_path}")
@@ -99,6 +104,7 @@ def trim_motion_video(
         return first_end + 1, last_start - 1
 
     start_idx, end_idx = find_motionless_segments(motion_levels, motion_threshold, motion_min_frames)
+    timings["motion_scan"] = time.monotonic() - stage_start
     if start_idx >= end_idx:
         logger.info("No motion detected or video is mostly motionless.")
         return False
@@ -124,14 +130,17 @@ def trim_motion_video(
         temp_trimmed_path
     ]
     logger.info(f"Trimming with ffmpeg: {' '.join(ffmpeg_trim_cmd)}")
+    stage_start = time.monotonic()
     try:
         subprocess.run(ffmpeg_trim_cmd, check=True)
         logger.info(f"Trimmed video saved to {temp_trimmed_path}")
     except Exception as e:
         logger.warning(f"ffmpeg trim failed: {e}")
         return False
+    timings["ffmpeg_trim"] = time.monotonic() - stage_start
 
     # --- Save center frame and thumbnail using ffmpeg ---
+    stage_start = time.monotonic()
     center_idx = start_idx + (end_idx - start_idx) // 4
     center_time = center_idx / fps
     jpg_path = video_path.replace('.mp4', '_center.jpg')
@@ -159,6 +168,7 @@ def trim_motion_video(
     except Exception as e:
         logger.warning(f"Could not extract center frame or thumbnail: {e}")
         saved_center = False
+    timings["thumbnails"] = time.monotonic() - stage_start
 
     # --- Move trimmed output to original filename ---
     if backup_original:
@@ -176,6 +186,7 @@ def trim_motion_video(
         logger.warning(f"Could not move trimmed file to original name: {e}")
 
     # Create thumbnail for trimmed video (first frame)
+    stage_start = time.monotonic()
     cap_thumb = cv2.VideoCapture(final_output_path)
     ret, frame_thumb = cap_thumb.read()
     cap_thumb.release()
@@ -187,9 +198,49 @@ def trim_motion_video(
     else:
         video_thumb_path = None
         logger.warning("Could not extract thumbnail from trimmed video.")
+    timings["thumbnails"] += time.monotonic() - stage_start
 
     return [final_output_path, jpg_path]
 
+def extract_subclip(video_path, output_path, start_seconds, duration_seconds):
+    """Copy part of a video to output_path without re-encoding.
+
+    Used to cut each event's own clip out of a shared export. Returns output_path,
+    or False if ffmpeg failed.
+    """
+    ffmpeg_cut_cmd = [
+        'ffmpeg', '-y',
+        '-ss', f"{max(0.0, start_seconds):.3f}",
+        '-i', video_path,
+        '-t', f"{duration_seconds:.3f}",
+        '-c', 'copy',
+        '-avoid_negative_ts', 'make_zero',
+        '-fflags', '+genpts',
+        output_path
+    ]
+    logger.info(f"Extracting sub-clip with ffmpeg: {' '.join(ffmpeg_cut_cmd)}")
+    try:
+        subprocess.run(ffmpeg_cut_cmd, check=True)
+    except Exception as e:
+        logger.warning(f"ffmpeg sub-clip extraction failed: {e}")
+        return False
+    return output_path
+
+def video_duration(video_path):
+    """Return the duration of a video in seconds from its container header, or None
+    if it cannot be read. Cheap enough to check every download."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        if not fps or frames <= 0:
+            return None
+        return frames / fps
+    finally:
+        cap.release()
+
 def store_file_in_db(filepath):
     # Placeholder for storing a file in the database
     logger.info(f"Storing {filepath} in the database...")
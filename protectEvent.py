@@ -1,6 +1,20 @@
 #!/usr/bin/env python3
-# File version: 1.0.0
+# File version: 1.11.3
 # Version history:
+# 1.11.3 - Read the queue statistics once per /metrics scrape. (2026-10-17)
+# 1.11.2 - With webhook_durability "async", count events as queued only once they are committed. (2026-10-17)
+# 1.11.1 - Give idle keep-alive connections' workers back as soon as a new connection waits. (2026-10-17)
+# 1.11.0 - With readiness_mode "probe", queue events for when their video window ends. (2026-10-17)
+# 1.10.0 - Report the media worker's backlog size and ETA on /metrics. (2026-10-16)
+# 1.9.0 - Match ignored plates against wildcard patterns (* and %), ignoring dashes and spaces. (2026-10-16)
+# 1.8.0 - Expose Prometheus metrics on GET /metrics. (2026-10-16)
+# 1.7.0 - Group-commit queued events from a background writer; add webhook_durability modes. (2026-10-16)
+# 1.6.0 - Queue every trigger of an alarm in one batch; add the /bulk ingest endpoint. (2026-10-16)
+# 1.5.0 - Drop duplicate deliveries of the same eventId/device/plate. (2026-10-16)
+# 1.4.0 - Wake the media worker over a Unix socket when an event is queued. (2026-10-16)
+# 1.3.0 - Queue events in the SQLite job queue instead of writing event_*.log files. (2026-10-16)
+# 1.2.0 - Cache config.json and reload it only when the file changes or on SIGHUP. (2026-10-16)
+# 1.1.0 - Serve webhooks on a bounded worker pool with keep-alive and graceful shutdown. (2026-10-16)
 # 1.0.0 - First production release.
 #
 # (c) 2025 monsultancy.eu. Author: Martijn Jongen
@@ -10,20 +24,26 @@
 import os
 import json
 import logging
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import signal
 from datetime import datetime
-import uuid
 import sys
+import time
+from urllib.parse import urlparse
+from config_cache import ConfigCache
+from dedup_cache import DedupCache, delivery_key
+from event_queue import EventQueue, GroupCommitter, notify_worker, queue_db_path, queue_notify_socket_path
+import metrics
+from webhook_server import PooledHTTPServer, PooledRequestHandler
 
 # Configuration file path (always relative to script location)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(SCRIPT_DIR, "config.json")
 
+CONFIG_CACHE = ConfigCache(CONFIG_FILE)
+
 def load_config():
     try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-        return config
+        return CONFIG_CACHE.get()
     except FileNotFoundError:
         print(f"Configuration file {CONFIG_FILE} not found", file=sys.stderr)
         sys.exit(1)
@@ -32,12 +52,7 @@ def load_config():
         sys.exit(1)
 
 # Load configuration from JSON file
-try:
-    config = load_config()
-except FileNotFoundError:
-    raise FileNotFoundError(f"Configuration file {CONFIG_FILE} not found")
-except json.JSONDecodeError:
-    raise ValueError(f"Invalid JSON in configuration file {CONFIG_FILE}")
+config = load_config()
 
 # Retrieve configuration values
 PATHS = config.get('paths', {})
@@ -48,11 +63,20 @@ LOGGING_CONFIG = config.get('logging', {})
 LOG_LEVEL = getattr(logging, LOGGING_CONFIG.get('level', 'INFO'), logging.INFO)
 LOG_FORMAT = LOGGING_CONFIG.get('format', '%(asctime)s - %(levelname)s - %(message)s')
 SERVER_PORT = config.get('server', {}).get('webhook_port', 1025)
-IGNORED_PLATES = [
-    str(item["plate"]).lower().strip()
-    for item in config.get('ignored_plates', [])
-    if isinstance(item, dict) and "plate" in item and item["plate"]
-]
+WEBHOOK_WORKERS = config.get('server', {}).get('webhook_workers', 8)
+WEBHOOK_KEEPALIVE_TIMEOUT = config.get('server', {}).get('webhook_keepalive_timeout', 15)
+WEBHOOK_DEDUP_TTL = config.get('server', {}).get('webhook_dedup_ttl_seconds', 3600)
+WEBHOOK_DEDUP_MAX_ENTRIES = config.get('server', {}).get('webhook_dedup_max_entries', 10000)
+# Durability of queued events:
+#   full   - respond after the event is committed to the queue with synchronous=FULL
+#   normal - respond after commit with synchronous=NORMAL (may lose the last events on power loss)
+#   async  - respond right after validation; events are committed within webhook_group_commit_ms
+WEBHOOK_DURABILITY = config.get('server', {}).get('webhook_durability', 'full')
+WEBHOOK_GROUP_COMMIT_MS = config.get('server', {}).get('webhook_group_commit_ms', 5)
+QUEUE_DB_FILE = queue_db_path(config)
+BULK_PATH = '/bulk'
+METRICS_PATH = '/metrics'
+QUEUE_NOTIFY_SOCKET = queue_notify_socket_path(config)
 
 # Ensure log directory exists
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -73,6 +97,60 @@ except Exception as e:
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
 logger.addHandler(console_handler)
+CONFIG_CACHE.logger = logger
+
+# Durable queue shared with protectStoremedia
+if WEBHOOK_DURABILITY not in ('full', 'normal', 'async'):
+    logger.warning(f"Unknown webhook_durability '{WEBHOOK_DURABILITY}', using 'full'")
+    WEBHOOK_DURABILITY = 'full'
+EVENT_QUEUE = EventQueue(QUEUE_DB_FILE, synchronous='FULL' if WEBHOOK_DURABILITY == 'full' else 'NORMAL')
+
+# Background writer that commits queued events from all request threads in batches
+GROUP_COMMITTER = GroupCommitter(
+    EVENT_QUEUE,
+    interval=WEBHOOK_GROUP_COMMIT_MS / 1000.0,
+    on_commit=lambda job_ids: notify_worker(QUEUE_NOTIFY_SOCKET),
+    logger=logger,
+)
+
+# Recently seen (eventId, device, value) deliveries, persisted in the queue database
+DEDUP_CACHE = DedupCache(ttl=WEBHOOK_DEDUP_TTL, max_entries=WEBHOOK_DEDUP_MAX_ENTRIES, store=EVENT_QUEUE)
+
+# Prometheus metrics served on GET /metrics
+METRICS = metrics.Registry()
+REQUESTS_TOTAL = METRICS.counter(
+    'protect_lpr_webhook_requests_total', 'Webhook requests by path and HTTP status.', ('path', 'status'))
+ACK_SECONDS = METRICS.histogram(
+    'protect_lpr_webhook_ack_seconds', 'Time from reading a webhook request to sending its response.')
+EVENTS_TOTAL = METRICS.counter(
+    'protect_lpr_webhook_events_total', 'Webhook events by outcome (queued, ignored, duplicate, invalid, failed).', ('outcome',))
+
+# stats() scans the queue table; both queue gauges share one call per scrape
+QUEUE_STATS = metrics.cached(EVENT_QUEUE.stats)
+
+def queue_job_counts():
+    stats = QUEUE_STATS()
+    return [({'status': status}, stats[status]) for status in ('pending', 'leased', 'done', 'failed')]
+
+METRICS.gauge('protect_lpr_queue_jobs', 'Jobs in the media download queue by status.', queue_job_counts)
+METRICS.gauge(
+    'protect_lpr_queue_oldest_open_age_seconds', 'Age of the oldest pending or leased job.',
+    lambda: QUEUE_STATS()['oldest_open_age_seconds'])
+METRICS.gauge(
+    'protect_lpr_group_commit_backlog', 'Events waiting for the group-commit writer.', GROUP_COMMITTER.backlog)
+METRICS.gauge('protect_lpr_dedup_cache_entries', 'Deliveries held in the de-duplication cache.', lambda: len(DEDUP_CACHE))
+
+def storemedia_status(key):
+    # Written by protectStoremedia.py every 30 seconds, see Scheduler.report()
+    status, _ = EVENT_QUEUE.get_worker_status('storemedia')
+    return status.get(key) if status else None
+
+METRICS.gauge(
+    'protect_lpr_backlog_jobs', 'Queued events older than backlog_age_seconds, drained behind live events.',
+    lambda: storemedia_status('backlog_jobs'))
+METRICS.gauge(
+    'protect_lpr_backlog_eta_seconds', 'Estimated time for the media worker to clear the backlog.',
+    lambda: storemedia_status('backlog_eta_seconds'))
 
 # Function to operate the barrier (stub for actual hardware/API call)
 def operate_barrier(license_plate, device_id):
@@ -84,35 +162,179 @@ def operate_barrier(license_plate, device_id):
         logger.error(f"Failed to operate barrier for {license_plate}: {str(e)}")
         return {"status": "error", "error": str(e)}
 
+def event_from_trigger(trigger, default_timestamp=None):
+    """Return the fields we need from a single alarm trigger."""
+    timestamp_ms = trigger.get('timestamp', default_timestamp)
+    event_timestamp = None
+    try:
+        if timestamp_ms:
+            event_timestamp = datetime.fromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d_%H-%M-%S-%f')[:-3]
+    except (TypeError, ValueError, OverflowError, OSError):
+        timestamp_ms = None
+    return {
+        "device_id": trigger.get('device'),
+        "source": trigger.get('key'),
+        "license_plate": trigger.get('value'),
+        "timestamp_ms": timestamp_ms,
+        "event_timestamp": event_timestamp,
+        "delivery": delivery_key(trigger),
+    }
+
+def extract_events(message):
+    """Return one event per trigger in a Protect alarm webhook payload."""
+    triggers = (message.get('alarm') or {}).get('triggers') or []
+    return [
+        event_from_trigger(trigger, message.get('timestamp'))
+        for trigger in triggers
+        if isinstance(trigger, dict)
+    ]
+
+def queue_events(events, bulk=False):
+    """Validate, de-duplicate and queue a batch of events in a single transaction.
+
+    Returns one result dict per event, in order. For bulk ingest the barrier is not
+    operated and queued events are only logged as a summary.
+    """
+    # Cached config, re-parsed only when config.json changes or on SIGHUP
+    config = CONFIG_CACHE.get()
+    AGE_SECONDS = config.get('age_seconds', 20)
+    READINESS_MODE = config.get('readiness_mode', 'fixed')
+    VIDEO_WINDOW_END = config.get('video_window_end_seconds', 15)
+    READINESS_MARGIN = config.get('readiness_margin_seconds', 2)
+    IGNORED_PLATES = CONFIG_CACHE.ignored_plates
+    now_str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    now_time_str = datetime.now().strftime('%H:%M:%S')
+    now = time.time()
+    not_before = now + AGE_SECONDS
+
+    results = []
+    jobs = []
+    new_deliveries = []
+    for event in events:
+        device_id = event["device_id"]
+        license_plate = event["license_plate"]
+        # Check if all required data is present
+        if not all([device_id, event["source"], event["event_timestamp"], license_plate]):
+            logger.warning(f"Missing required data: device_id={device_id}, source={event['source']}, event_timestamp={event['event_timestamp']}, license_plate={license_plate}")
+            results.append({"status": "received", "images": [], "videos": [], "barrier": None, "error": "Missing required webhook data"})
+            EVENTS_TOTAL.inc(outcome='invalid')
+            continue
+        license_plate = str(license_plate)
+        if DEDUP_CACHE.check_and_add(event["delivery"], persist=False):
+            # Protect re-sent an alarm we already handled
+            logger.info(f"Ignoring duplicate delivery {event['delivery']}")
+            results.append({"status": "duplicate", "message": f"license {license_plate} already received"})
+            EVENTS_TOTAL.inc(outcome='duplicate')
+            continue
+        if event["delivery"]:
+            new_deliveries.append(event["delivery"])
+
+        # Operate the barrier if all data is present
+        barrier_result = None if bulk else operate_barrier(license_plate, device_id)
+        result = {
+            "status": "received",
+            "message": f"license {license_plate} received at {now_time_str}",
+            "barrier": barrier_result,
+            "queued": False,
+            "job_id": None
+        }
+        results.append(result)
+        # Queue the event for media download if not ignored (exact plates or * / % patterns)
+        if license_plate not in IGNORED_PLATES:
+            job_not_before = not_before
+            if READINESS_MODE == 'probe':
+                # The media worker asks Protect whether the footage is there once the window has ended
+                job_not_before = max(now, event["timestamp_ms"] / 1000 + VIDEO_WINDOW_END + READINESS_MARGIN)
+            jobs.append((result, (now_str, license_plate, event["timestamp_ms"], job_not_before)))
+        else:
+            EVENTS_TOTAL.inc(outcome='ignored')
+
+    if jobs or new_deliveries:
+        def queue_failed(e):
+            logger.error(f"Failed to queue events: {e}")
+            EVENTS_TOTAL.inc(len(jobs), outcome='failed')
+            # Accept redeliveries of these events, since they were not queued
+            for key in new_deliveries:
+                DEDUP_CACHE.discard(key)
+
+        try:
+            future = GROUP_COMMITTER.submit([job for _, job in jobs], new_deliveries)
+        except Exception as e:
+            queue_failed(e)
+            return results
+
+        if WEBHOOK_DURABILITY == 'async':
+            # Ack first: the writer commits the batch in the background
+            def queue_committed(f):
+                if f.exception() is not None:
+                    queue_failed(f.exception())
+                else:
+                    EVENTS_TOTAL.inc(len(jobs), outcome='queued')
+
+            future.add_done_callback(queue_committed)
+            for result, job in jobs:
+                result["queued"] = True
+                if not bulk:
+                    logger.info(f"Event queued for {job[1]}")
+        else:
+            try:
+                job_ids = future.result()
+            except Exception as e:
+                queue_failed(e)
+            else:
+                EVENTS_TOTAL.inc(len(jobs), outcome='queued')
+                for (result, job), job_id in zip(jobs, job_ids):
+                    result["queued"] = True
+                    result["job_id"] = job_id
+                    if not bulk:
+                        logger.info(f"Event queued for {job[1]} as job {job_id}")
+    return results
+
 # HTTP request handler for webhook server
-class WebhookHandler(BaseHTTPRequestHandler):
+class WebhookHandler(PooledRequestHandler):
+    # HTTP/1.1 keeps connections from Protect open between alarms. Stalled clients are
+    # dropped after the keep-alive timeout; idle ones also as soon as another connection
+    # needs their worker (see webhook_server.py).
+    timeout = WEBHOOK_KEEPALIVE_TIMEOUT
+    idle_timeout = WEBHOOK_KEEPALIVE_TIMEOUT
+
+    def send_json(self, status, payload):
+        self.send_body(status, json.dumps(payload).encode(), 'application/json')
+
+    def send_body(self, status, body, content_type):
+        # Hand the worker back when shutting down or when other connections are waiting for one
+        if self.should_close():
+            self.close_connection = True
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        REQUESTS_TOTAL.inc(path=self.metrics_path(), status=str(status))
+
+    def metrics_path(self):
+        # Known paths only, so scanners cannot create unbounded label values
+        path = urlparse(self.path).path.rstrip('/') or '/'
+        return path if path in (BULK_PATH, METRICS_PATH) else '/'
+
     def do_GET(self):
+        if urlparse(self.path).path.rstrip('/') == METRICS_PATH:
+            self.send_body(200, METRICS.render().encode(), metrics.CONTENT_TYPE)
+            return
         logger.info("Received GET request")
-        self.send_response(405)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps({"error": "only post allowed"}).encode())
+        self.send_json(405, {"error": "only post allowed"})
 
     def do_POST(self):
-        # Reload config on every event
-        config = load_config()
-        PATHS = config.get('paths', {})
-        LOG_DIR = PATHS.get('log_dir')
-        LOG_FILE = os.path.join(LOG_DIR, 'protect-lpr.log')
-        LOGGING_CONFIG = config.get('logging', {})
-        LOG_LEVEL = getattr(logging, LOGGING_CONFIG.get('level', 'INFO'), logging.INFO)
-        IMAGE_DIR = PATHS.get('image_dir')
-        LOGGING_CONFIG = config.get('logging', {})
-        IGNORED_PLATES = [
-            str(item["plate"]).lower().strip()
-            for item in config.get('ignored_plates', [])
-            if isinstance(item, dict) and "plate" in item and item["plate"]
-        ]
-
         # Handle POST requests (webhook events)
+        started = time.monotonic()
         try:
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
+            if urlparse(self.path).path.rstrip('/') == BULK_PATH:
+                self.handle_bulk(post_data)
+                return
             try:
                 message = json.loads(post_data.decode())
             except json.JSONDecodeError:
@@ -121,81 +343,82 @@ class WebhookHandler(BaseHTTPRequestHandler):
 
             logger.info(f"Received POST webhook: {message}")
 
-            # Extract relevant data from webhook payload
-            device_id = None
-            source = None
-            event_timestamp = None
-            license_plate = None
-            timestamp_ms = None
-            try:
-                triggers = message.get('alarm', {}).get('triggers', [])
-                if triggers:
-                    device_id = triggers[0].get('device')
-                    source = triggers[0].get('key')
-                    license_plate = triggers[0].get('value')
-                    timestamp_ms = triggers[0].get('timestamp', message.get('timestamp'))
-                    if timestamp_ms:
-                        event_timestamp = datetime.fromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d_%H-%M-%S-%f')[:-3]
-            except (KeyError, IndexError, TypeError):
+            # Extract one event per trigger from the webhook payload
+            events = extract_events(message) if isinstance(message, dict) else []
+            if not events:
                 logger.warning("Could not extract device ID, source, timestamp, or license plate from webhook payload")
-
-            # Check if all required data is present
-            if not all([device_id, source, event_timestamp, license_plate]):
-                logger.warning(f"Missing required data: device_id={device_id}, source={source}, event_timestamp={event_timestamp}, license_plate={license_plate}")
                 response = {"status": "received", "images": [], "videos": [], "barrier": None, "error": "Missing required webhook data"}
             else:
-                # Operate the barrier if all data is present
-                barrier_result = operate_barrier(license_plate, device_id)
-                skip_imaging = license_plate.lower() in IGNORED_PLATES
-
-                log_file_created = False
-                log_file_path = None
-                # Optionally log event to file if not ignored
-                if not skip_imaging:
-                    try:
-                        now_str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-                        unique_id = str(uuid.uuid4())
-                        log_filename = f"event_{license_plate}_{unique_id}.log"
-                        log_filepath = os.path.join(IMAGE_DIR, log_filename)
-                        with open(log_filepath, 'w') as logf:
-                            logf.write(f"{now_str},{license_plate},{timestamp_ms}\n")
-                        logger.info(f"Event log file created: {log_filepath}")
-                        log_file_created = True
-                        log_file_path = log_filepath
-                    except Exception as e:
-                        logger.error(f"Failed to create event log file: {e}")
-
-                now_time_str = datetime.now().strftime('%H:%M:%S')
-                response = {
-                    "status": "received",
-                    "message": f"license {license_plate} received at {now_time_str}",
-                    "barrier": barrier_result,
-                    "log_file_created": log_file_created,
-                    "log_file_path": log_file_path
-                }
+                results = queue_events(events)
+                # A single trigger keeps the original response shape
+                response = results[0] if len(results) == 1 else {"status": "received", "events": results}
 
             # Send JSON response
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(200, response)
 
         except Exception as e:
             logger.error(f"Error processing POST request: {str(e)}")
-            self.send_response(500)
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            # The request body may not have been consumed, so never reuse this connection
+            self.close_connection = True
+            self.send_json(500, {"error": str(e)})
+        finally:
+            ACK_SECONDS.observe(time.monotonic() - started)
+
+    def handle_bulk(self, post_data):
+        """Ingest a JSON array of events for simulators and backfills.
+
+        Each item is either a full Protect alarm payload or a single trigger-like
+        object ({"device", "key", "value", "timestamp", "eventId"}). The barrier is
+        not operated for bulk events.
+        """
+        try:
+            items = json.loads(post_data.decode())
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": "invalid JSON"})
+            return
+        if not isinstance(items, list):
+            self.send_json(400, {"error": "expected a JSON array of events"})
+            return
+
+        events = []
+        for item in items:
+            if isinstance(item, dict) and 'alarm' in item:
+                events.extend(extract_events(item))
+            elif isinstance(item, dict):
+                events.append(event_from_trigger(item))
+        results = queue_events(events, bulk=True)
+        summary = {
+            "status": "received",
+            "received": len(results),
+            "queued": sum(1 for r in results if r.get("queued")),
+            "duplicates": sum(1 for r in results if r["status"] == "duplicate"),
+            "invalid": sum(1 for r in results if "error" in r),
+        }
+        logger.info(f"Bulk ingest: {summary}")
+        self.send_json(200, summary)
 
 # Function to start the HTTP server
-def run_server(port=SERVER_PORT):
+def run_server(port=SERVER_PORT, workers=WEBHOOK_WORKERS):
     server_address = ('', port)
-    httpd = HTTPServer(server_address, WebhookHandler)
-    logger.info(f"Starting webhook server on port {port}")
+    httpd = PooledHTTPServer(server_address, WebhookHandler, workers=workers)
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down webhook server")
+        httpd.begin_shutdown()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    CONFIG_CACHE.install_sighup_handler()
+    logger.info(f"Starting webhook server on port {port} with {httpd.workers} workers")
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         logger.info("Shutting down webhook server")
+    finally:
         httpd.server_close()
+        # Commit events that were acknowledged but not yet written
+        GROUP_COMMITTER.close()
+        EVENT_QUEUE.close()
+        logger.info("Webhook server stopped")
 
 # Entry point for running the server
 if __name__ == '__main__':
@@ -3,20 +3,26 @@ import sys
 import time
 import json
 import sqlite3
+import threading
 import logging
 import logging.handlers
-import schedule
 import tenacity
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Callable, Iterable, Optional
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import closing
 from pathlib import Path
 from logger_setup import logger
 logger.propagate = False
-from processvideo import trim_motion_video
+from processvideo import extract_subclip, trim_motion_video, video_duration
 from protect_archiver.downloader import Downloader
 from protect_archiver.client import ProtectClient
 from protect_archiver.errors import ProtectError
 from protect_archiver.utils import print_download_stats
+from config_cache import ConfigCache
+from stage_timings import StageTimer, init_timing_table, purge_timings, store_timings
+from event_queue import EventQueue, QueueWaker, notify_worker, queue_db_path, queue_notify_socket_path
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -26,9 +32,13 @@ load_dotenv()
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.getenv("CONFIG_FILE", os.path.join(SCRIPT_DIR, "config.json"))
 
+CONFIG_CACHE = ConfigCache(CONFIG_FILE, logger=logger)
+
 def load_config(config_path: str) -> dict:
-    """Load configuration from a JSON file."""
+    """Load configuration from a JSON file (cached, reloaded when the file changes)."""
     try:
+        if config_path == CONFIG_CACHE.path:
+            return CONFIG_CACHE.get()
         with open(config_path, 'r') as f:
             return json.load(f)
     except FileNotFoundError:
@@ -68,6 +78,38 @@ RETRY_ATTEMPTS = config.get("retry_attempts", 3)
 RETRY_WAIT = config.get("retry_wait_seconds", 5)
 SCHEDULE_INTERVAL = config.get("schedule_interval_seconds", 10)
 BACKUP_ORIGINAL = config.get("backup_original_video", True)
+QUEUE_DB_FILE = queue_db_path(config)
+QUEUE_NOTIFY_SOCKET = queue_notify_socket_path(config)
+CLEANUP_INTERVAL = 3600
+QUEUE_VISIBILITY_TIMEOUT = config.get("queue_visibility_timeout_seconds", 600)
+QUEUE_MAX_ATTEMPTS = config.get("queue_max_attempts", 5)
+QUEUE_RETRY_DELAY = config.get("queue_retry_delay_seconds", 60)
+CAMERA_CACHE_TTL = config.get("camera_cache_ttl_seconds", 3600)
+CAMERA_CACHE_FILE = config.get("paths", {}).get("camera_cache_file")
+# Events go through a download -> trim -> store pipeline; download threads and
+# trim (ffmpeg/OpenCV) processes have separate limits
+MAX_CONCURRENT_DOWNLOADS = max(1, int(config.get("server", {}).get("max_concurrent_downloads", 2)))
+MAX_CONCURRENT_FFMPEG = max(1, int(config.get("server", {}).get("max_concurrent_ffmpeg", 4)))
+# Video exports running at once over all downloaders and cameras, in total and per console
+MAX_PARALLEL_EXPORTS = max(1, int(config.get("server", {}).get("max_parallel_exports", 4)))
+MAX_EXPORTS_PER_CONSOLE = max(1, int(config.get("server", {}).get("max_exports_per_console", 2)))
+# "threads" or "asyncio" (needs aiohttp, falls back to threads without it)
+DOWNLOAD_BACKEND = config.get("server", {}).get("download_backend", "threads")
+# Events whose video windows overlap share one export, up to this many seconds of
+# footage and this many events (0 seconds disables coalescing)
+COALESCE_MAX_SECONDS = config.get("coalesce_max_seconds", 120)
+COALESCE_MAX_EVENTS = config.get("coalesce_max_events", 20)
+SHARED_EXPORT_DIR = ".shared"
+# Most downloaded groups the DB writer stores in one transaction
+STORE_BATCH_MAX = 32
+# Events older than backlog_age_seconds are drained behind live events, at a limited rate
+BACKLOG_AGE_SECONDS = config.get("backlog_age_seconds", 300)
+BACKLOG_RATE_PER_MINUTE = config.get("backlog_rate_per_minute", 30)
+# How often the backlog size and ETA are stored and logged
+STATUS_INTERVAL = 30
+# Bounds for the back-off while waiting for Protect to finish recording an event (readiness_mode "probe")
+READINESS_MIN_BACKOFF = 1
+READINESS_MAX_BACKOFF = 10
 
 # Create necessary directories
 for path in [LOG_DIR, IMAGE_DIR, os.path.dirname(MYSQL_DB_FILE)]:
@@ -76,7 +118,8 @@ for path in [LOG_DIR, IMAGE_DIR, os.path.dirname(MYSQL_DB_FILE)]:
 # --- Database Setup ---
 def init_db(db_file: str) -> sqlite3.Connection:
     """Initialize SQLite database and create event table."""
-    conn = sqlite3.connect(db_file)
+    # Written by the pipeline's DB writer thread only
+    conn = sqlite3.connect(db_file, check_same_thread=False)
     c = conn.cursor()
     c.execute(
         """CREATE TABLE IF NOT EXISTS event (
@@ -86,10 +129,53 @@ def init_db(db_file: str) -> sqlite3.Connection:
             media_urls TEXT
         )"""
     )
-    c.execute("CREATE INDEX IF NOT EXISTS idx_media_urls ON event (json_extract(media_urls, '$[0]'))")
-    conn.commit()
+    migrate_unique_media_index(conn)
+    init_timing_table(conn)
     return conn
 
+def migrate_unique_media_index(conn: sqlite3.Connection):
+    """Make the primary media path of an event unique, so inserts can be idempotent.
+
+    Older databases only had a plain index and may contain duplicate rows for the same
+    video; those are moved to the event_duplicate_backup table (keeping the first in
+    event) before the unique index is created.
+    """
+    c = conn.cursor()
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_event_media_path'"
+    ).fetchone()
+    if exists:
+        return
+    duplicates = (
+        "json_extract(media_urls, '$[0]') IS NOT NULL AND id NOT IN ("
+        "SELECT MIN(id) FROM event WHERE json_extract(media_urls, '$[0]') IS NOT NULL "
+        "GROUP BY json_extract(media_urls, '$[0]'))"
+    )
+    with conn:
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS event_duplicate_backup (
+                id INTEGER,
+                datetime TEXT,
+                license_plate TEXT,
+                media_urls TEXT,
+                removed_at TEXT
+            )"""
+        )
+        c.execute(
+            "INSERT INTO event_duplicate_backup (id, datetime, license_plate, media_urls, removed_at) "
+            f"SELECT id, datetime, license_plate, media_urls, datetime('now') FROM event WHERE {duplicates}"
+        )
+        c.execute(f"DELETE FROM event WHERE {duplicates}")
+        if c.rowcount:
+            logger.info(
+                f"Moved {c.rowcount} duplicate event rows to table event_duplicate_backup "
+                "before adding the unique media index"
+            )
+        c.execute("DROP INDEX IF EXISTS idx_media_urls")
+        c.execute(
+            "CREATE UNIQUE INDEX idx_event_media_path ON event (json_extract(media_urls, '$[0]'))"
+        )
+
 # Initialize database
 try:
     db_conn = init_db(MYSQL_DB_FILE)
@@ -97,6 +183,50 @@ except sqlite3.Error as e:
     logger.critical(f"Failed to initialize database {MYSQL_DB_FILE}: {e}")
     exit(1)
 
+# Initialize job queue (shared with protectEvent)
+try:
+    event_queue = EventQueue(
+        QUEUE_DB_FILE,
+        visibility_timeout=QUEUE_VISIBILITY_TIMEOUT,
+        max_attempts=QUEUE_MAX_ATTEMPTS,
+    )
+except sqlite3.Error as e:
+    logger.critical(f"Failed to initialize job queue {QUEUE_DB_FILE}: {e}")
+    exit(1)
+
+# --- Protect client ---
+# One client for the whole process: it keeps its API token between events and only
+# logs in again when Protect answers 401. It is rebuilt if the connection settings change.
+# Each download works on a fork() of it that shares the session and camera cache.
+_protect_client: Optional[ProtectClient] = None
+_protect_client_key = None
+_protect_client_lock = threading.Lock()
+
+def get_protect_client(address: str, port: int, not_unifi_os: bool, username: str, password: str, verify_ssl: bool) -> ProtectClient:
+    """Return the process-wide ProtectClient for these connection settings."""
+    key = (address, port, not_unifi_os, username, password, verify_ssl)
+    with _protect_client_lock:
+        return _get_protect_client(key)
+
+def _get_protect_client(key) -> ProtectClient:
+    global _protect_client, _protect_client_key
+    address, port, not_unifi_os, username, password, verify_ssl = key
+    if _protect_client is None or key != _protect_client_key:
+        if _protect_client is not None:
+            logger.info("Protect connection settings changed, creating a new client")
+        _protect_client = ProtectClient(
+            address=address,
+            port=port,
+            not_unifi_os=not_unifi_os,
+            username=username,
+            password=password,
+            verify_ssl=verify_ssl,
+            camera_cache_ttl=CAMERA_CACHE_TTL,
+            camera_cache_file=CAMERA_CACHE_FILE,
+        )
+        _protect_client_key = key
+    return _protect_client
+
 # --- Retry Logic ---
 @tenacity.retry(
     stop=tenacity.stop_after_attempt(RETRY_ATTEMPTS),
@@ -127,47 +257,67 @@ def download(
     disable_splitting: bool,
     create_snapshot: bool,
     use_utc_filenames: bool,
+    skip_cameras: Iterable[str] = (),
+    on_camera_downloaded: Optional[Callable] = None,
+    timer: Optional[StageTimer] = None,
 ) -> ProtectClient:
-    """Download video footage or snapshots from UniFi Protect."""
+    """Download video footage or snapshots from UniFi Protect.
+
+    Footage of cameras whose id is in skip_cameras is not downloaded again;
+    on_camera_downloaded(camera, files) is called after each camera's footage is saved.
+    The auth, camera_list and download stages are timed into timer.
+    """
+    if timer is None:
+        timer = StageTimer()
     if create_snapshot and (start or end):
         logger.warning("Ignoring --start and --end with --snapshot option")
         start = datetime.now(timezone.utc)
 
-    client = ProtectClient(
-        address=address,
-        port=port,
-        not_unifi_os=not_unifi_os,
-        username=username,
-        password=password,
-        verify_ssl=verify_ssl,
-        ignore_failed_downloads=ignore_failed_downloads,
-        destination_path=dest,
-        use_subfolders=use_subfolders,
-        download_wait=download_wait,
-        skip_existing_files=skip_existing_files,
-        touch_files=touch_files,
-        download_timeout=download_timeout,
-        use_utc_filenames=use_utc_filenames,
-    )
+    client = get_protect_client(address, port, not_unifi_os, username, password, verify_ssl).fork(dest)
+    client.ignore_failed_downloads = ignore_failed_downloads
+    client.use_subfolders = use_subfolders
+    client.download_wait = download_wait
+    client.skip_existing_files = skip_existing_files
+    client.touch_files = touch_files
+    client.download_timeout = download_timeout
+    client.use_utc_filenames = use_utc_filenames
 
     try:
-        logger.info("Fetching camera list")
-        camera_list = client.get_camera_list()
         session = client.get_session()
-
-        if cameras != "all":
-            camera_s = set(cameras.split(","))
-            camera_list = [c for c in camera_list if c["id"] in camera_s]
+        with timer.stage("auth"):
+            # Cached token, only logs in when there is none yet
+            session.get_api_token()
+        with timer.stage("camera_list"):
+            # Cached on the client, only fetched from Protect when the TTL expires
+            if cameras != "all":
+                camera_list = client.get_cameras(dict.fromkeys(cameras.split(",")))
+            else:
+                camera_list = client.get_camera_list()
 
         if not create_snapshot:
+            pending = []
             for camera in camera_list:
+                if camera.id in skip_cameras:
+                    logger.info(f"Footage for camera {camera['name']} already downloaded, skipping")
+                    continue
                 logger.info(
                     f"Downloading video files between {start} and {end} from "
                     f"'{session.authority}{session.base_path}/video/export' for camera {camera['name']}"
                 )
-                Downloader.download_footage(
-                    client, start, end, camera, disable_alignment, disable_splitting
+                pending.append((camera, start, end))
+            bytes_before = client.bytes_downloaded
+            download_start = time.monotonic()
+            try:
+                # All cameras' exports at once, within the limits set by set_download_limits
+                Downloader.download_footage_parallel(
+                    client,
+                    pending,
+                    disable_alignment,
+                    disable_splitting,
+                    on_camera_done=on_camera_downloaded,
                 )
+            finally:
+                timer.add("download", time.monotonic() - download_start, client.bytes_downloaded - bytes_before)
         else:
             logger.info(
                 f"Downloading snapshot files for {start.ctime()} "
@@ -183,30 +333,589 @@ def download(
         #return client
         raise
 
-def process_log_file(fpath: str, db_conn: sqlite3.Connection):
-    """Process a single event log file."""
-    # Reload config for every file processed
+class FootageNotReady(Exception):
+    """Protect has not recorded an event's whole video window yet; try again in retry_in seconds."""
+
+    def __init__(self, message: str, retry_in: float):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+def readiness_backoff(time_end: datetime) -> float:
+    """Seconds to wait before probing again, growing with the time already waited."""
+    waited = time.time() - time_end.timestamp()
+    return min(READINESS_MAX_BACKOFF, max(READINESS_MIN_BACKOFF, waited / 2))
+
+def check_footage_ready(client: ProtectClient, cameras: list, time_end: datetime):
+    """Raise FootageNotReady unless every camera has recorded up to time_end.
+
+    Cameras for which Protect does not report a recording end are assumed ready; the
+    short clip check after the download still catches incomplete exports.
+    """
+    for camera in cameras:
+        recording_end = client.get_recording_end(camera.id)
+        if recording_end is not None and recording_end.replace(tzinfo=timezone.utc) < time_end:
+            raise FootageNotReady(
+                f"Camera {camera.name} has recorded up to {recording_end.replace(tzinfo=timezone.utc).astimezone()}, "
+                f"waiting for {time_end}",
+                readiness_backoff(time_end),
+            )
+
+def check_clip_length(downloaded: dict, cameras: list, time_start: datetime, time_end: datetime, min_ratio: float):
+    """Raise FootageNotReady (and remove the files) if the export of any camera is shorter
+    than min_ratio of the requested window, i.e. Protect had not written all of it to disk yet.
+
+    downloaded maps camera ids to their files. Cameras are checked one by one, so a
+    complete export of one camera cannot hide a short one of another.
+    """
+    expected = (time_end - time_start).total_seconds()
+    short = None
+    for camera in cameras:
+        files = downloaded.get(camera.id)
+        durations = [video_duration(path) for path in files or ()]
+        if not files or None in durations:
+            # Nothing to measure; a missing or unreadable file fails later in the pipeline
+            continue
+        if sum(durations) < expected * min_ratio:
+            short = f"Export of camera {camera.name} is {sum(durations):.1f}s long, expected {expected:.0f}s"
+            break
+    if short is None:
+        return
+    for path in (f for files in downloaded.values() for f in files):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    raise FootageNotReady(short, readiness_backoff(time_end))
+
+def download_event(jobs: list) -> dict:
+    """Download the footage for one event, or one shared export for a group of events
+    whose windows overlap (pipeline stage 1).
+
+    Returns the clips to trim per job id as (path, cut) pairs: cut is None for a file
+    downloaded for that event alone, or (shared_file, start_seconds, duration_seconds)
+    for the event's own part of a shared export. result["timer"] holds the stage timings
+    of the export.
+    Cameras already downloaded for the same export by an earlier attempt (a "download"
+    checkpoint whose files still exist) are not downloaded again.
+    Raises ProtectError if the footage could not be downloaded, or FootageNotReady
+    (readiness_mode "probe") if Protect has not recorded the whole window yet.
+    """
+    # Reload config for every event processed (cached, only re-parsed when config.json changes)
     config = load_config(CONFIG_FILE)
     CAMERA_IDS = config.get("camera_ids", "")
     SERVER_ADDRESS = config.get("server", {}).get("address", "127.0.0.1")
     SERVER_PORT = config.get("server", {}).get("port", 443)
     SERVER_USERNAME = os.getenv("SERVER_USERNAME", config.get("server", {}).get("username", "localtest"))
     SERVER_PASSWORD = os.getenv("SERVER_PASSWORD", config.get("server", {}).get("password", "100%wifi100%WIFI"))
-    LOG_DIR = config.get("paths", {}).get("log_dir", "/var/log/protect-lpr")
     IMAGE_DIR = config.get("paths", {}).get("image_dir", "/var/lib/protect-lpr/images")
-    MYSQL_DB_FILE = config.get("sqlite3_db_file", "/var/lib/protect-lpr/mysql/protect-lpr.db")
-    AGE_SECONDS = config.get("age_seconds", 20)
     VIDEO_WINDOW_START = config.get("video_window_start_seconds", -10)
     VIDEO_WINDOW_END = config.get("video_window_end_seconds", 15)
     DOWNLOAD_WAIT = config.get("download_wait", 5)
     DOWNLOAD_TIMEOUT = config.get("download_timeout", 15)
-    LOG_PREFIX = config.get("log_prefix", "event_")
-    LOG_SUFFIX = config.get("log_suffix", ".log")
     BACKUP_ORIGINAL = config.get("backup_original_video", True)
+    READINESS_MODE = config.get("readiness_mode", "fixed")
+    READINESS_MAX_WAIT = config.get("readiness_max_wait_seconds", 60)
+    READINESS_MIN_CLIP_RATIO = config.get("readiness_min_clip_ratio", 0.9)
+
+    windows = {}
+    for job in jobs:
+        logger.info(f"time: {job['log_time']}, license: {job['license_plate']}, event_timestamp: {job['timestamp_ms']}")
+        Path(os.path.join(IMAGE_DIR, job["license_plate"])).mkdir(exist_ok=True)
+        time_start = datetime.utcfromtimestamp(job["timestamp_ms"] / 1000 + VIDEO_WINDOW_START).replace(tzinfo=timezone.utc).astimezone()
+        time_end = time_start + timedelta(seconds=VIDEO_WINDOW_END - VIDEO_WINDOW_START)
+        windows[job["id"]] = (time_start, time_end)
+
+    if len(jobs) == 1:
+        # Download straight into the plate's directory
+        dest = os.path.join(IMAGE_DIR, jobs[0]["license_plate"])
+        time_start, time_end = windows[jobs[0]["id"]]
+    else:
+        # One export covering all windows; every event gets its own sub-clip of it
+        dest = os.path.join(IMAGE_DIR, SHARED_EXPORT_DIR)
+        Path(dest).mkdir(exist_ok=True)
+        time_start = min(start for start, _ in windows.values())
+        time_end = max(end for _, end in windows.values())
+        logger.info(f"Coalesced {len(jobs)} events into one export from {time_start} to {time_end}")
+
+    # Files per camera id already downloaded for this export, from checkpoints of earlier attempts
+    job_ids = [job["id"] for job in jobs]
+    export = {"dest": dest, "start": time_start.isoformat(), "end": time_end.isoformat()}
+    downloaded = {}
+    for job_checkpoints in event_queue.checkpoints(job_ids, "download").values():
+        for camera_id, done in job_checkpoints.items():
+            if all(done.get(key) == value for key, value in export.items()) and all(os.path.exists(f) for f in done["files"]):
+                downloaded[camera_id] = done["files"]
+    if downloaded:
+        logger.info(f"Resuming: footage of {len(downloaded)} camera(s) already downloaded")
+
+    def camera_downloaded(camera, rel_paths):
+        files = [os.path.join(dest, rel_path) for rel_path in rel_paths]
+        downloaded[camera.id] = files
+        event_queue.checkpoint(job_ids, "download", camera.id, dict(export, files=files))
+
+    # In probe mode the job becomes ready when its window has ended; ask Protect whether the
+    # footage is recorded before exporting. Past readiness_max_wait_seconds, export what there is.
+    timer = StageTimer()
+    probing = READINESS_MODE == "probe" and not downloaded and time.time() < time_end.timestamp() + READINESS_MAX_WAIT
+    if probing:
+        with timer.stage("probe"):
+            protect_client = get_protect_client(SERVER_ADDRESS, SERVER_PORT, False, SERVER_USERNAME, SERVER_PASSWORD, False)
+            if CAMERA_IDS != "all":
+                cameras = protect_client.get_cameras(dict.fromkeys(CAMERA_IDS.split(",")))
+            else:
+                cameras = protect_client.get_camera_list()
+            check_footage_ready(protect_client, cameras, time_end)
+
+    download(
+        dest=dest,
+        address=SERVER_ADDRESS,
+        port=SERVER_PORT,
+        not_unifi_os=False,
+        username=SERVER_USERNAME,
+        password=SERVER_PASSWORD,
+        verify_ssl=False,  # Enable SSL verification by default
+        cameras=CAMERA_IDS,
+        download_wait=DOWNLOAD_WAIT,
+        download_timeout=DOWNLOAD_TIMEOUT,
+        use_subfolders=False,
+        touch_files=False,
+        skip_existing_files=False,
+        ignore_failed_downloads=False,
+        start=time_start,
+        end=time_end,
+        disable_alignment=False,
+        # A shared export must be a single file per camera to cut sub-clips from;
+        # the merged window is capped at coalesce_max_seconds
+        disable_splitting=len(jobs) > 1,
+        create_snapshot=False,
+        use_utc_filenames=False,
+        # Also updated by camera_downloaded, so a retried download() skips cameras finished before the error
+        skip_cameras=downloaded,
+        on_camera_downloaded=camera_downloaded,
+        timer=timer,
+    )
+    if probing:
+        check_clip_length(downloaded, cameras, time_start, time_end, READINESS_MIN_CLIP_RATIO)
+    files = [f for camera_files in downloaded.values() for f in camera_files]
+
+    clips = {}
+    if len(jobs) == 1:
+        clips[jobs[0]["id"]] = [(path, None) for path in files]
+        shared_files = []
+    else:
+        # File names are "<camera> - <window start>.mp4", see protect_archiver's download_footage
+        shared_suffix = f" - {time_start.strftime('%Y-%m-%d - %H.%M.%S%z')}.mp4"
+        for job in jobs:
+            job_start, job_end = windows[job["id"]]
+            job_suffix = f" - {job_start.strftime('%Y-%m-%d - %H.%M.%S%z')}.mp4"
+            clips[job["id"]] = []
+            for path in files:
+                name = os.path.basename(path)
+                camera_name = name[:-len(shared_suffix)] if name.endswith(shared_suffix) else os.path.splitext(name)[0]
+                clip_path = os.path.join(IMAGE_DIR, job["license_plate"], camera_name + job_suffix)
+                cut = (path, (job_start - time_start).total_seconds(), (job_end - job_start).total_seconds())
+                clips[job["id"]].append((clip_path, cut))
+        shared_files = files
+
+    return {
+        "clips": clips,
+        "shared_files": shared_files,
+        "image_dir": IMAGE_DIR,
+        "backup_original": BACKUP_ORIGINAL,
+        "timer": timer,
+    }
+
+def trim_video(abs_mp4_path: str, backup_original: bool, cut: Optional[tuple] = None):
+    """Trim and compress one downloaded video (pipeline stage 2, runs in a worker process).
+
+    With cut = (shared_file, start_seconds, duration_seconds) the event's sub-clip is
+    first cut out of a shared export into abs_mp4_path.
+    Returns (produced files, {stage: seconds}).
+    """
+    timings = {}
+    if cut is not None:
+        shared_file, start_seconds, duration_seconds = cut
+        subclip_start = time.monotonic()
+        if not extract_subclip(shared_file, abs_mp4_path, start_seconds, duration_seconds):
+            raise RuntimeError(f"Could not extract sub-clip from {shared_file}")
+        timings["subclip"] = time.monotonic() - subclip_start
+    produced_files = trim_motion_video(
+        abs_mp4_path,
+        abs_mp4_path,
+        motion_threshold=1.0,
+        motion_min_frames=5,
+        ffmpeg_compress=True,
+        backup_original=backup_original,
+        timings=timings
+    )
+    return produced_files, timings
+
+def store_events(rows: list, db_conn: sqlite3.Connection):
+    """Insert (log_time, license_plate, rel_paths) rows into the event table in one
+    transaction (pipeline stage 3).
+
+    Rows whose primary media file is already stored are skipped by the unique index,
+    so storing the same video twice (e.g. after a retry) is harmless.
+    """
+    c = db_conn.cursor()
+    with db_conn:
+        for log_time, license_plate, rel_paths in rows:
+            c.execute(
+                "INSERT INTO event (datetime, license_plate, media_urls) VALUES (?, ?, ?) "
+                "ON CONFLICT DO NOTHING",
+                (log_time, license_plate, json.dumps(rel_paths))
+            )
+            if c.rowcount:
+                logger.info(f"Inserted event for {license_plate} with media {rel_paths} into database")
+            else:
+                logger.info(f"Event with media file {rel_paths[0]} already exists, skipping insert.")
+
+def job_failed(job: dict, e: Exception):
+    """Hand a job back to the queue for a later retry, or give up after max attempts."""
+    if isinstance(e, FootageNotReady):
+        # Not a failure: try again shortly without using up an attempt
+        logger.info(f"Footage for job {job['id']} ({job['license_plate']}) not ready: {e}; retrying in {e.retry_in:.0f} seconds")
+        if event_queue.defer(job, e.retry_in, str(e)):
+            notify_worker(QUEUE_NOTIFY_SOCKET)
+        else:
+            logger.warning(f"Job {job['id']} was leased again after its lease expired, leaving it to that attempt")
+        return
+    if isinstance(e, ProtectError):
+        logger.error(f"Failed to download footage for {job['license_plate']}: {e}")
+    else:
+        logger.error(f"Error processing job {job['id']} for {job['license_plate']}: {e}")
+    retried = event_queue.retry(job, e, QUEUE_RETRY_DELAY)
+    if retried is None:
+        logger.warning(f"Job {job['id']} was leased again after its lease expired, leaving it to that attempt")
+    elif retried:
+        logger.warning(f"Job {job['id']} will be retried in {QUEUE_RETRY_DELAY} seconds")
+    else:
+        logger.error(f"Job {job['id']} failed after {job['attempts']} attempts, giving up")
+
+# Marks "no item carried over" in the DB writer (None is the stop signal)
+_NO_ITEM = object()
+
+class Pipeline:
+    """Downloads, trims and stores queued events in three stages.
+
+    download threads -> trim process pool -> DB writer thread
+
+    The stages are connected by bounded queues, so a slow stage blocks the one in
+    front of it instead of piling up work in memory, and a backlog drains at the
+    speed of the slowest stage. Network I/O and CPU-bound trimming overlap.
+    """
+
+    def __init__(self, downloaders: int, trimmers: int, db_conn: sqlite3.Connection, on_space=None):
+        self.db_conn = db_conn
+        self.on_space = on_space
+        # Jobs finished so far, for throughput reporting
+        self.finished = 0
+        # Leased jobs (lists of jobs whose footage is downloaded together) waiting for a downloader
+        self.download_queue = queue.Queue(maxsize=downloaders)
+        # Downloaded jobs whose videos are being trimmed, in order, for the DB writer
+        self.store_queue = queue.Queue(maxsize=trimmers * 2)
+        # Fork the trim workers now, before any pipeline thread exists
+        self.trim_pool = ProcessPoolExecutor(max_workers=trimmers)
+        self.trim_pool.submit(os.getpid).result()
+        self.downloaders = [
+            threading.Thread(target=self._download_worker, name=f"download-{i}", daemon=True)
+            for i in range(downloaders)
+        ]
+        self.writer = threading.Thread(target=self._store_worker, name="db-writer", daemon=True)
+        for thread in self.downloaders + [self.writer]:
+            thread.start()
+
+    def submit(self, jobs: list):
+        """Queue leased jobs for one download; blocks while the download stage is full."""
+        self.download_queue.put(jobs)
+
+    def full(self) -> bool:
+        return self.download_queue.full()
+
+    def empty(self) -> bool:
+        return self.download_queue.empty()
+
+    def _download_worker(self):
+        while True:
+            jobs = self.download_queue.get()
+            if jobs is None:
+                break
+            try:
+                self._download(jobs)
+            except Exception as e:
+                # Keep the thread alive; the jobs are retried once their leases expire
+                logger.error(f"Download worker failed on jobs {[job['id'] for job in jobs]}: {e!r}")
 
+    def _download(self, jobs: list):
+        if self.on_space:
+            self.on_space()
+        for job in jobs:
+            logger.info(f"Processing job {job['id']} for {job['license_plate']} (attempt {job['attempts']})")
+        picked_at = time.time()
+        try:
+            result = download_event(jobs)
+            result["timers"] = {}
+            for job in jobs:
+                job_timer = StageTimer({"queue_wait": picked_at - job["received_at"]})
+                job_timer.merge(result["timer"])
+                result["timers"][job["id"]] = job_timer
+            trimmed = event_queue.checkpoints([job["id"] for job in jobs], "trim")
+            trims = {
+                job["id"]: [
+                    (path, self._trim(job, path, cut, result["backup_original"], trimmed.get(job["id"], {})))
+                    for path, cut in result["clips"][job["id"]]
+                ]
+                for job in jobs
+            }
+        except Exception as e:
+            # Download failed, or the trim pool was already shut down
+            for job in jobs:
+                job_failed(job, e)
+            return
+        # Blocks while the trim stage is full
+        self.store_queue.put((jobs, result, trims))
+
+    def _trim(self, job: dict, path: str, cut: Optional[tuple], backup_original: bool, trimmed: dict) -> Future:
+        """Submit a clip to the trim pool, unless an earlier attempt already trimmed it
+        (a "trim" checkpoint whose files still exist)."""
+        produced_files = trimmed.get(path)
+        if produced_files and all(os.path.exists(f) for f in produced_files if f):
+            logger.info(f"Resuming: {path} already trimmed")
+            future = Future()
+            future.set_result((produced_files, {}))
+            return future
+
+        def trim_done(future):
+            if not future.cancelled() and future.exception() is None:
+                event_queue.checkpoint([job["id"]], "trim", path, future.result()[0])
+
+        future = self.trim_pool.submit(trim_video, path, backup_original, cut)
+        future.add_done_callback(trim_done)
+        return future
+
+    def _store_worker(self):
+        carry = _NO_ITEM
+        while True:
+            item = self.store_queue.get() if carry is _NO_ITEM else carry
+            carry = _NO_ITEM
+            if item is None:
+                break
+            # Also take the groups behind it whose trims are already finished, so they
+            # are written in the same transaction
+            batch = [item]
+            while len(batch) < STORE_BATCH_MAX:
+                try:
+                    following = self.store_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if following is None or not all(f.done() for trims in following[2].values() for _, f in trims):
+                    carry = following
+                    break
+                batch.append(following)
+            try:
+                self._store_batch(batch)
+            except Exception as e:
+                # Keep the writer alive; unacknowledged jobs are retried once their leases
+                # expire, and storing their events again is a no-op
+                job_ids = [job["id"] for jobs, _, _ in batch for job in jobs]
+                logger.error(f"DB writer failed on jobs {job_ids}: {e!r}")
+
+    def _store_batch(self, batch: list):
+        rows = []
+        stored_jobs = []
+        timers = {}
+        for jobs, result, trims in batch:
+            for job in jobs:
+                job_rows = []
+                try:
+                    for abs_mp4_path, future in trims[job["id"]]:
+                        try:
+                            produced_files, trim_timings = future.result()
+                            result["timers"][job["id"]].merge(trim_timings)
+                            rel_paths = [os.path.relpath(f, result["image_dir"]) for f in produced_files]
+                        except Exception as e:
+                            logger.error(f"Error trimming/compressing video {abs_mp4_path}: {e}")
+                            if not os.path.exists(abs_mp4_path):
+                                # Sub-clip was never cut from the shared export
+                                raise
+                            rel_paths = [os.path.relpath(abs_mp4_path, result["image_dir"])]
+                        job_rows.append((job["log_time"], job["license_plate"], rel_paths))
+                except Exception as e:
+                    job_failed(job, e)
+                    continue
+                rows.extend(job_rows)
+                stored_jobs.append(job)
+                timers[job["id"]] = result["timers"][job["id"]]
+            # All sub-clips have been cut (the futures are done), the shared export can go
+            for shared_file in result["shared_files"]:
+                try:
+                    os.remove(shared_file)
+                except OSError as e:
+                    logger.warning(f"Could not remove shared export {shared_file}: {e}")
+
+        try:
+            insert_start = time.monotonic()
+            store_events(rows, self.db_conn)
+            insert_seconds = time.monotonic() - insert_start
+        except Exception as e:
+            for job in stored_jobs:
+                job_failed(job, e)
+            return
+        try:
+            acked = set(event_queue.ack_many(stored_jobs))
+        except Exception as e:
+            # The events are stored; the jobs are retried after their leases expire and
+            # the unique media index skips the second insert
+            logger.error(f"Could not acknowledge jobs {[job['id'] for job in stored_jobs]}: {e!r}")
+            return
+        for job in stored_jobs:
+            if job["id"] not in acked:
+                # Ran past the visibility timeout and was leased again; that attempt finishes it
+                logger.warning(f"Job {job['id']} was leased again after its lease expired, leaving it to that attempt")
+        stored_jobs = [job for job in stored_jobs if job["id"] in acked]
+        self.finished += len(stored_jobs)
+        finished_at = time.time()
+        for job in stored_jobs:
+            timer = timers[job["id"]]
+            timer.add("db_insert", insert_seconds)
+            timer.add("total", finished_at - job["received_at"])
+            logger.info(f"Finished job {job['id']} for {job['license_plate']} in {timer.seconds['total']:.1f}s")
+        try:
+            store_timings(self.db_conn, [(job["id"], job["license_plate"], timers[job["id"]]) for job in stored_jobs])
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store processing timings: {e}")
+
+    def close(self):
+        """Finish the jobs already handed to the pipeline, then stop all stages."""
+        for _ in self.downloaders:
+            self.download_queue.put(None)
+        for thread in self.downloaders:
+            thread.join()
+        self.store_queue.put(None)
+        self.writer.join()
+        self.trim_pool.shutdown(wait=True)
+
+class Scheduler:
+    """Decides which ready jobs to lease next: live events first, then the backlog.
+
+    Events younger than backlog_age_seconds are live and always go first. Older events
+    (e.g. after an outage) form the backlog, which is only leased when no live job is
+    ready and the download stage is idle, at no more than backlog_rate_per_minute
+    (0 = unlimited). Fresh gate events therefore never wait behind hours of history.
+    """
+
+    def __init__(self, queue: EventQueue, backlog_age_seconds: float, backlog_rate_per_minute: float):
+        self.queue = queue
+        self.backlog_age_seconds = backlog_age_seconds
+        self.backlog_rate = backlog_rate_per_minute / 60.0
+        # Token bucket for the backlog lane, allowing bursts of ~10 seconds worth of jobs
+        self.burst = max(1.0, self.backlog_rate * 10)
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._sample = None
+        self.throughput = None
+        self._next_report = 0.0
+
+    def cutoff_ms(self) -> int:
+        """Events before this timestamp belong to the backlog."""
+        return int((time.time() - self.backlog_age_seconds) * 1000)
+
+    def backlog_wait(self) -> float:
+        """Seconds until the backlog lane may lease the next job."""
+        if not self.backlog_rate:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.backlog_rate)
+        self._refilled_at = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.backlog_rate
+
+    def lease(self, lease_jobs, backlog_allowed: bool) -> list:
+        """Lease the next jobs with lease_jobs(min_timestamp_ms=..., max_timestamp_ms=...)."""
+        cutoff = self.cutoff_ms()
+        jobs = lease_jobs(min_timestamp_ms=cutoff)
+        if jobs or not backlog_allowed or self.backlog_wait() > 0:
+            return jobs
+        jobs = lease_jobs(max_timestamp_ms=cutoff)
+        if self.backlog_rate:
+            self._tokens -= len(jobs)
+        return jobs
+
+    def next_ready_in(self) -> Optional[float]:
+        """Seconds until either lane has a job it may lease, or None if the queue is empty."""
+        cutoff = self.cutoff_ms()
+        live = self.queue.next_ready_in(min_timestamp_ms=cutoff)
+        backlog = self.queue.next_ready_in(max_timestamp_ms=cutoff)
+        if backlog is not None:
+            backlog = max(backlog, self.backlog_wait())
+        waits = [t for t in (live, backlog) if t is not None]
+        return min(waits) if waits else None
+
+    def report(self, finished: int):
+        """Every STATUS_INTERVAL seconds, store the backlog size and estimated time to
+        clear it in the queue database (shown on the webhook's /metrics) and log it."""
+        now = time.monotonic()
+        if now < self._next_report:
+            return
+        self._next_report = now + STATUS_INTERVAL
+        if self._sample is not None:
+            sampled_at, sampled_finished = self._sample
+            rate = (finished - sampled_finished) / (now - sampled_at)
+            self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+        self._sample = (now, finished)
 
-    logger.info(f"Processing log file: {fpath}")
+        backlog = self.queue.depth(max_timestamp_ms=self.cutoff_ms())
+        open_jobs = self.queue.depth()
+        drain_rate = self.throughput
+        if self.backlog_rate and (not drain_rate or drain_rate > self.backlog_rate):
+            drain_rate = self.backlog_rate
+        eta = round(backlog / drain_rate) if backlog and drain_rate else (0 if not backlog else None)
+        self.queue.set_worker_status("storemedia", {
+            "backlog_jobs": backlog,
+            "live_jobs": open_jobs - backlog,
+            "backlog_eta_seconds": eta,
+            "throughput_per_minute": round(self.throughput * 60, 1) if self.throughput is not None else None,
+            "backlog_rate_per_minute": round(self.backlog_rate * 60, 1),
+        })
+        if backlog:
+            eta_text = str(timedelta(seconds=eta)) if eta is not None else "unknown"
+            logger.info(f"Backlog: {backlog} jobs, {open_jobs - backlog} live, estimated time to clear {eta_text}")
+
+def process_queue(pipeline: Pipeline, scheduler: Scheduler) -> bool:
+    """Hand ready jobs to the pipeline, live events first (see Scheduler).
+
+    Only leases as many jobs as the download stage can take, so the rest stay in the
+    queue (and are not leased out long before they run). A downloader picking up a job
+    wakes the main loop to lease the next one. Returns False while the main loop should
+    wait for that instead of the next job's not-before time.
+
+    Jobs whose footage windows overlap the next ready job are leased with it and
+    served from a single export (see EventQueue.lease_overlapping).
+    """
+    config = load_config(CONFIG_FILE)
+    window_start_ms = config.get("video_window_start_seconds", -10) * 1000
+    window_end_ms = config.get("video_window_end_seconds", 15) * 1000
+    max_span_ms = config.get("coalesce_max_seconds", COALESCE_MAX_SECONDS) * 1000
+
+    def lease_jobs(**lane):
+        if max_span_ms > 0:
+            return event_queue.lease_overlapping(window_start_ms, window_end_ms, max_span_ms, COALESCE_MAX_EVENTS, **lane)
+        job = event_queue.lease(**lane)
+        return [job] if job is not None else []
+
+    while not pipeline.full():
+        jobs = scheduler.lease(lease_jobs, backlog_allowed=pipeline.empty())
+        if not jobs:
+            # Backlog jobs wait for an idle download stage
+            return pipeline.empty()
+        pipeline.submit(jobs)
+    return False
+
+def import_log_file(fpath: str):
+    """Move the events of a legacy event_*.log spool file into the job queue."""
+    logger.info(f"Importing log file: {fpath}")
     try:
+        not_before = os.path.getmtime(fpath) + AGE_SECONDS
+        jobs = []
         with open(fpath, "r") as f:
             for line in f:
                 line = line.strip()
@@ -218,78 +927,19 @@ def process_log_file(fpath: str, db_conn: sqlite3.Connection):
                     continue
 
                 log_time, license_plate, event_timestamp = parts
-                logger.info(f"time: {log_time}, license: {license_plate}, event_timestamp: {event_timestamp}")
-                sub_dir = os.path.join(IMAGE_DIR, license_plate)
-                Path(sub_dir).mkdir(exist_ok=True)
-
                 try:
                     event_timestamp_ms = int(event_timestamp)
                 except ValueError as e:
                     logger.error(f"Error parsing event_timestamp '{event_timestamp}': {e}")
                     continue
+                jobs.append((log_time, license_plate, event_timestamp_ms, not_before))
 
-                time_start = datetime.utcfromtimestamp(event_timestamp_ms / 1000 + VIDEO_WINDOW_START).replace(tzinfo=timezone.utc).astimezone()
-                time_end = time_start + timedelta(seconds=VIDEO_WINDOW_END - VIDEO_WINDOW_START)
-
-                try:
-                    client = download(
-                        dest=sub_dir,
-                        address=SERVER_ADDRESS,
-                        port=SERVER_PORT,
-                        not_unifi_os=False,
-                        username=SERVER_USERNAME,
-                        password=SERVER_PASSWORD,
-                        verify_ssl=False,  # Enable SSL verification by default
-                        cameras=CAMERA_IDS,
-                        download_wait=DOWNLOAD_WAIT,
-                        download_timeout=DOWNLOAD_TIMEOUT,
-                        use_subfolders=False,
-                        touch_files=False,
-                        skip_existing_files=False,
-                        ignore_failed_downloads=False,
-                        start=time_start,
-                        end=time_end,
-                        disable_alignment=False,
-                        disable_splitting=False,
-                        create_snapshot=False,
-                        use_utc_filenames=False
-                    )
-
-                    c = db_conn.cursor()
-                    for rel_path in getattr(client, "download_files", []):
-                        abs_mp4_path = os.path.join(sub_dir, rel_path)
-                        try:
-                            produced_files = trim_motion_video(
-                                abs_mp4_path,
-                                abs_mp4_path,
-                                motion_threshold=1.0,
-                                motion_min_frames=5,
-                                ffmpeg_compress=True,
-                                backup_original=BACKUP_ORIGINAL
-                            )
-                            rel_paths = [os.path.relpath(f, IMAGE_DIR) for f in produced_files]
-                        except Exception as e:
-                            logger.error(f"Error trimming/compressing video {abs_mp4_path}: {e}")
-                            rel_paths = [os.path.relpath(abs_mp4_path, IMAGE_DIR)]
-
-                        c.execute(
-                            "SELECT COUNT(*) FROM event WHERE json_extract(media_urls, '$[0]') = ?",
-                            (rel_paths[0],)
-                        )
-                        if c.fetchone()[0] == 0:
-                            c.execute(
-                                "INSERT INTO event (datetime, license_plate, media_urls) VALUES (?, ?, ?)",
-                                (log_time, license_plate, json.dumps(rel_paths))
-                            )
-                            db_conn.commit()
-                            logger.info(f"Inserted event for {license_plate} with media {rel_paths} into database")
-                        else:
-                            logger.info(f"Event with media file {rel_paths[0]} already exists, skipping insert.")
-                except ProtectError as e:
-                    logger.error(f"Failed to download footage for {license_plate}: {e}")
-                    continue
+        # All events of the file in one transaction
+        job_ids = event_queue.enqueue_many(jobs)
+        for (log_time, license_plate, _, _), job_id in zip(jobs, job_ids):
+            logger.info(f"Queued {license_plate} from {fpath} as job {job_id}")
 
-        # Rename processed log file
+        # Rename imported log file
         done_path = fpath + ".done"
         try:
             os.rename(fpath, done_path)
@@ -314,45 +964,108 @@ def cleanup_old_files(directory: str, retention_days: float):
                 except OSError as e:
                     logger.error(f"Error deleting {fpath}: {e}")
 
+def cleanup_part_files(directory: str, retention_days: float):
+    """Remove interrupted downloads (.part files and their recorded sizes) older than retention_days.
+
+    The downloader resumes a .part file when the same export is downloaded again, so they
+    are kept until no retry of their job can come any more.
+    """
+    cutoff = time.time() - retention_days * 86400
+    for dirpath, _, fnames in os.walk(directory):
+        for fname in fnames:
+            if fname.endswith(".part") or fname.endswith(".part.total"):
+                fpath = os.path.join(dirpath, fname)
+                try:
+                    if os.path.getmtime(fpath) < cutoff:
+                        os.remove(fpath)
+                        logger.info(f"Deleted interrupted download: {fpath}")
+                except OSError as e:
+                    logger.error(f"Error deleting {fpath}: {e}")
+
 def find_old_event_logs():
-    """Scan for old event log files and process them in order of creation time (oldest first)."""
-    # Reload config to get IMAGE_DIR, LOG_PREFIX, LOG_SUFFIX, AGE_SECONDS, retention_days
-    config = load_config(CONFIG_FILE)
-    IMAGE_DIR = config.get("paths", {}).get("image_dir", "/var/lib/protect-lpr/images")
-    LOG_PREFIX = config.get("log_prefix", "event_")
-    LOG_SUFFIX = config.get("log_suffix", ".log")
-    AGE_SECONDS = config.get("age_seconds", 20)
+    """Import event log files left behind by an older webhook version into the job queue.
 
-    logger.info("Scanning for event logs")
-    now = time.time()
+    Old events end up in the scheduler's backlog lane, behind live events.
+    """
+    logger.info("Scanning for legacy event logs")
     log_files = []
     for fname in os.listdir(IMAGE_DIR):
         if fname.startswith(LOG_PREFIX) and fname.endswith(LOG_SUFFIX):
-            fpath = os.path.join(IMAGE_DIR, fname)
-            if now - os.path.getmtime(fpath) > AGE_SECONDS:
-                log_files.append(fpath)
+            log_files.append(os.path.join(IMAGE_DIR, fname))
     # Sort log files by creation/modification time (oldest first)
     log_files.sort(key=lambda f: os.path.getmtime(f))
     for fpath in log_files:
-        process_log_file(fpath, db_conn)
-    # Cleanup old .done files
-    cleanup_old_files(IMAGE_DIR, config.get("retention_days", 7))
+        import_log_file(fpath)
+
+def cleanup():
+    """Remove old .done spool files, interrupted downloads, finished jobs and processing timings
+    past their retention period."""
+    config = load_config(CONFIG_FILE)
+    retention_days = config.get("retention_days", 7)
+    cleanup_old_files(IMAGE_DIR, retention_days)
+    cleanup_part_files(IMAGE_DIR, retention_days)
+    removed = event_queue.purge(retention_days * 86400)
+    if removed:
+        logger.info(f"Purged {removed} finished jobs from the queue")
+    # Own connection: db_conn belongs to the pipeline's DB writer thread
+    try:
+        with closing(sqlite3.connect(MYSQL_DB_FILE)) as conn:
+            purge_timings(conn, config.get("timings_retention_days", 30) * 86400)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not purge old processing timings: {e}")
 
 def main():
-    """Main function to schedule log processing."""
+    """Main loop: process ready jobs, then sleep until the next job is due or the webhook wakes us."""
     logger.info("Started protect-lpr-pull script")
-    schedule.every(SCHEDULE_INTERVAL).seconds.do(find_old_event_logs)
-    
+    CONFIG_CACHE.install_sighup_handler()
+    find_old_event_logs()
+    cleanup()
+    next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+    logger.info(f"Queue status: {event_queue.stats()}")
+    # Only one worker runs per queue, so jobs still leased now were cut off by a crash or
+    # restart; resume them from their checkpoints right away
+    released = event_queue.release_leases()
+    if released:
+        logger.info(f"Resuming {released} jobs interrupted by the last shutdown")
+    waker = QueueWaker(QUEUE_NOTIFY_SOCKET)
+    logger.info(
+        f"Starting pipeline with {MAX_CONCURRENT_DOWNLOADS} downloaders "
+        f"and {MAX_CONCURRENT_FFMPEG} trim processes"
+    )
+    Downloader.set_download_limits(MAX_PARALLEL_EXPORTS, MAX_EXPORTS_PER_CONSOLE)
+    Downloader.set_download_backend(DOWNLOAD_BACKEND)
+    pipeline = Pipeline(
+        MAX_CONCURRENT_DOWNLOADS,
+        MAX_CONCURRENT_FFMPEG,
+        db_conn,
+        on_space=lambda: notify_worker(QUEUE_NOTIFY_SOCKET),
+    )
+    scheduler = Scheduler(event_queue, BACKLOG_AGE_SECONDS, BACKLOG_RATE_PER_MINUTE)
+
     try:
         while True:
-            schedule.run_pending()
-            time.sleep(1)
+            pipeline_idle = process_queue(pipeline, scheduler)
+            scheduler.report(pipeline.finished)
+            if time.monotonic() >= next_cleanup:
+                cleanup()
+                next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+            # Sleep until the earliest job's not-before time (or the backlog lane's next turn); a
+            # notification from the webhook cuts this short. SCHEDULE_INTERVAL is only a safety net
+            # for missed notifications. While the pipeline is busy, only a downloader taking a job
+            # (or a new event) is worth waking up for.
+            next_ready = scheduler.next_ready_in() if pipeline_idle else None
+            timeout = SCHEDULE_INTERVAL if next_ready is None else min(next_ready, SCHEDULE_INTERVAL)
+            waker.wait(timeout)
     except KeyboardInterrupt:
         logger.info("Terminated by KeyboardInterrupt")
     except Exception as e:
         logger.critical(f"Terminated due to unexpected error: {e}")
     finally:
+        # Let the jobs already in the pipeline finish before closing the databases
+        pipeline.close()
+        waker.close()
         db_conn.close()
+        event_queue.close()
         logger.info("Closed database connection")
 
 if __name__ == "__main__":
@@ -210,6 +210,37 @@ from protect_archiver.utils import print_download_stats
     envvar="PROTECT_CREATE_SNAPSHOT",
     show_envvar=True,
 )
+@click.option(
+    "--max-parallel-downloads",
+    default=Config.MAX_PARALLEL_DOWNLOADS,
+    show_default=True,
+    help="Maximum number of video files downloaded at the same time",
+    envvar="PROTECT_MAX_PARALLEL_DOWNLOADS",
+    show_envvar=True,
+)
+@click.option(
+    "--max-downloads-per-console",
+    default=Config.MAX_DOWNLOADS_PER_CONSOLE,
+    show_default=True,
+    help=(
+        "Maximum number of video files downloaded at the same time from one Protect console. "
+        "Each download is an export the console has to prepare, so keep this low."
+    ),
+    envvar="PROTECT_MAX_DOWNLOADS_PER_CONSOLE",
+    show_envvar=True,
+)
+@click.option(
+    "--download-backend",
+    type=click.Choice(["threads", "asyncio"]),
+    default=Config.DOWNLOAD_BACKEND,
+    show_default=True,
+    help=(
+        "Download video files with a thread per download (requests) or from one "
+        "event loop (asyncio, requires aiohttp)"
+    ),
+    envvar="PROTECT_DOWNLOAD_BACKEND",
+    show_envvar=True,
+)
 @click.option(
     "--use-utc-filenames",
     is_flag=True,
@@ -240,6 +271,9 @@ def download(
     disable_splitting: bool,
     create_snapshot: bool,
     use_utc_filenames: bool,
+    max_parallel_downloads: int,
+    max_downloads_per_console: int,
+    download_backend: str,
 ) -> None:
     # check the provided command line arguments
     # TODO(danielfernau): remove exit codes 1 (path invalid) and 6 (start/end/snapshot) from docs: no longer valid
@@ -271,25 +305,28 @@ def download(
     try:
         # get camera list
         click.echo("Getting camera list")
-        camera_list = client.get_camera_list()
-        session = client.get_session()
-
         if cameras != "all":
-            camera_s = set(cameras.split(","))
-            camera_list = [c for c in camera_list if c["id"] in camera_s]
+            camera_list = client.get_cameras(dict.fromkeys(cameras.split(",")))
+        else:
+            camera_list = client.get_camera_list()
+        session = client.get_session()
 
         if not create_snapshot:
-            for camera in camera_list:
-                # noinspection PyUnboundLocalVariable
-                click.echo(
-                    f"Downloading video files between {start} and {end} from"
-                    f" '{session.authority}{session.base_path}/video/export' for camera"
-                    f" {camera.name}"
-                )
+            # noinspection PyUnboundLocalVariable
+            click.echo(
+                f"Downloading video files between {start} and {end} from"
+                f" '{session.authority}{session.base_path}/video/export' for camera(s)"
+                f" {', '.join(camera.name for camera in camera_list)}"
+            )
 
-                Downloader.download_footage(
-                    client, start, end, camera, disable_alignment, disable_splitting
-                )
+            Downloader.set_download_limits(max_parallel_downloads, max_downloads_per_console)
+            Downloader.set_download_backend(download_backend)
+            Downloader.download_footage_parallel(
+                client,
+                [(camera, start, end) for camera in camera_list],
+                disable_alignment,
+                disable_splitting,
+            )
         else:
             click.echo(
                 f"Downloading snapshot files for {start.ctime()}"
@@ -5,6 +5,7 @@ import click
 from protect_archiver.cli.base import cli
 from protect_archiver.client import ProtectClient
 from protect_archiver.config import Config
+from protect_archiver.downloader import Downloader
 from protect_archiver.sync import ProtectSync
 from protect_archiver.utils import print_download_stats
 
@@ -93,6 +94,37 @@ from protect_archiver.utils import print_download_stats
     envvar="PROTECT_USE_UTC",
     show_envvar=True,
 )
+@click.option(
+    "--max-parallel-downloads",
+    default=Config.MAX_PARALLEL_DOWNLOADS,
+    show_default=True,
+    help="Maximum number of video files downloaded at the same time",
+    envvar="PROTECT_MAX_PARALLEL_DOWNLOADS",
+    show_envvar=True,
+)
+@click.option(
+    "--max-downloads-per-console",
+    default=Config.MAX_DOWNLOADS_PER_CONSOLE,
+    show_default=True,
+    help=(
+        "Maximum number of video files downloaded at the same time from one Protect console. "
+        "Each download is an export the console has to prepare, so keep this low."
+    ),
+    envvar="PROTECT_MAX_DOWNLOADS_PER_CONSOLE",
+    show_envvar=True,
+)
+@click.option(
+    "--download-backend",
+    type=click.Choice(["threads", "asyncio"]),
+    default=Config.DOWNLOAD_BACKEND,
+    show_default=True,
+    help=(
+        "Download video files with a thread per download (requests) or from one "
+        "event loop (asyncio, requires aiohttp)"
+    ),
+    envvar="PROTECT_DOWNLOAD_BACKEND",
+    show_envvar=True,
+)
 @click.option(
     "--statefile",
     default="sync.state",
@@ -121,6 +153,9 @@ def sync(
     ignore_failed_downloads: bool,
     cameras: str,
     use_utc_filenames: bool,
+    max_parallel_downloads: int,
+    max_downloads_per_console: int,
+    download_backend: str,
 ) -> None:
     # normalize path to destination directory and check if it exists
     dest = path.abspath(dest)
@@ -143,12 +178,13 @@ def sync(
 
     # get camera list
     print("Getting camera list")
-    camera_list = client.get_camera_list()
-
     if cameras != "all":
-        camera_ids = set(cameras.split(","))
-        camera_list = [c for c in camera_list if c.id in camera_ids]
+        camera_list = client.get_cameras(dict.fromkeys(cameras.split(",")))
+    else:
+        camera_list = client.get_camera_list()
 
+    Downloader.set_download_limits(max_parallel_downloads, max_downloads_per_console)
+    Downloader.set_download_backend(download_backend)
     process = ProtectSync(client=client, destination_path=dest, statefile=statefile)
     process.run(camera_list, ignore_state=ignore_state)
 
@@ -1,9 +1,15 @@
+import copy
+import threading
+
 from datetime import datetime
 from os import path
 from typing import Any
+from typing import Iterable
 from typing import List
 from typing import Optional
 
+from protect_archiver.client.async_session import AsyncProtectSession
+from protect_archiver.client.camera_cache import CameraCache
 from protect_archiver.client.legacy import LegacyClient
 from protect_archiver.client.unifi_os import UniFiOSClient
 from protect_archiver.config import Config
@@ -30,6 +36,8 @@ class ProtectClient:
         # aka read_timeout - time to wait until a socket read response happens
         download_timeout: float = Config.DOWNLOAD_TIMEOUT,
         use_utc_filenames: bool = Config.USE_UTC_FILENAMES,
+        camera_cache_ttl: float = Config.CAMERA_CACHE_TTL,
+        camera_cache_file: Optional[str] = None,
     ) -> None:
         self.protocol = protocol
         self.address = address
@@ -60,6 +68,8 @@ class ProtectClient:
 
         # Store downloaded filenames
         self.download_files = []
+        # guards the counters above when files are downloaded in parallel
+        self.stats_lock = threading.Lock()
 
         if not_unifi_os:
             self.port = 7443
@@ -86,8 +96,45 @@ class ProtectClient:
                 self.verify_ssl,
             )
 
-    def get_camera_list(self) -> List[Any]:
-        return Downloader.get_camera_list(self.session)
+        self.camera_cache = CameraCache(
+            camera_cache_ttl, camera_cache_file, authority=self.session.authority
+        )
+
+    def reset_stats(self) -> None:
+        # reset per-run counters so a long-lived client can be reused for the next download
+        self.files_downloaded = 0
+        self.bytes_downloaded = 0
+        self.files_skipped = 0
+        self.files_failed = 0
+        self.download_files = []
+
+    def fork(self, destination_path: Optional[str] = None) -> "ProtectClient":
+        # copy that shares the authenticated session and camera cache, but has its own
+        # destination and download counters so parallel downloads don't mix up their files
+        clone = copy.copy(self)
+        clone.stats_lock = threading.Lock()
+        clone.reset_stats()
+        if destination_path is not None:
+            clone.destination_path = path.abspath(destination_path)
+        return clone
+
+    def get_camera_list(self, force_refresh: bool = False) -> List[Any]:
+        return self.camera_cache.get(
+            lambda: Downloader.get_camera_list(self.session), force_refresh=force_refresh
+        )
+
+    def get_cameras(self, camera_ids: Iterable[str]) -> List[Any]:
+        # look up cameras by id in the cached camera list
+        return self.camera_cache.get_by_ids(
+            lambda: Downloader.get_camera_list(self.session), camera_ids
+        )
+
+    def invalidate_camera_cache(self) -> None:
+        self.camera_cache.invalidate()
+
+    def get_recording_end(self, camera_id: str) -> Optional[datetime]:
+        # end of the footage recorded so far (UTC), or None if Protect does not report it
+        return Downloader.get_recording_end(self.session, camera_id, self.download_timeout)
 
     def get_motion_event_list(
         self, start: datetime, end: datetime, camera_list: List[Any]
@@ -97,6 +144,21 @@ class ProtectClient:
     def get_session(self) -> Any:
         return self.session
 
+    def create_async_session(self) -> AsyncProtectSession:
+        # aiohttp session to the same console for the asyncio download backend, starts with
+        # the token of the blocking session if it has one, otherwise it logs in on its first
+        # request (use with "async with")
+        return AsyncProtectSession(
+            self.protocol,
+            self.address,
+            self.port,
+            self.username,
+            self.password,  # type: ignore[arg-type]
+            self.verify_ssl,
+            not_unifi_os=self.not_unifi_os,
+            api_token=self.session.cached_api_token(),
+        )
+
 
 # TODO
 # class ProtectError(object):
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+
+from contextlib import asynccontextmanager
+from typing import Any
+from typing import AsyncIterator
+from typing import Dict
+from typing import Optional
+
+from protect_archiver.config import Config
+from protect_archiver.errors import ProtectError
+
+try:
+    import aiohttp
+
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+
+class AsyncProtectSession:
+    # asyncio counterpart of UniFiOSClient / LegacyClient for the asyncio download backend:
+    # one aiohttp connection pool per console, logs in again once on a 401
+    # use as "async with AsyncProtectSession(...) as session:", aiohttp needs a running loop
+    def __init__(
+        self,
+        protocol: str,
+        address: str,
+        port: int,
+        username: str,
+        password: str,
+        verify_ssl: bool,
+        not_unifi_os: bool = False,
+        api_token: Optional[str] = None,
+        pool_size: int = Config.HTTP_POOL_SIZE,
+    ) -> None:
+        if not AIOHTTP_AVAILABLE:
+            raise RuntimeError(
+                "The asyncio download backend requires aiohttp "
+                "(pip install -r requirements-asyncio.txt)"
+            )
+
+        self.protocol = protocol
+        self.address = address
+        self.port = port
+        self.username = username
+        self.password = password
+        self.verify_ssl = verify_ssl
+        self.not_unifi_os = not_unifi_os
+        self.pool_size = pool_size
+
+        # token of the blocking session can be reused, saves a login per run
+        self._api_token = api_token
+        self._token_lock: Optional[asyncio.Lock] = None
+        self.http: Any = None
+
+        self.authority = f"{self.protocol}://{self.address}:{self.port}"
+        self.base_path = "/api" if not_unifi_os else "/proxy/protect/api"
+
+    async def __aenter__(self) -> "AsyncProtectSession":
+        self._token_lock = asyncio.Lock()
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, ssl=None if self.verify_ssl else False),
+            # the token is sent explicitly with each request, see auth_kwargs()
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.http.close()
+
+    async def fetch_api_token(self) -> str:
+        # UniFi OS: session cookie from /api/auth/login, legacy: bearer token from /api/auth
+        auth_uri = f"{self.authority}/api/auth" if self.not_unifi_os else f"{self.authority}/api/auth/login"
+
+        async with self.http.post(
+            auth_uri, json={"username": self.username, "password": self.password}
+        ) as response:
+            if response.status != 200:
+                logging.error(
+                    f"Authentication as user {self.username} failed "
+                    f"with status {response.status} {response.reason}"
+                )
+                raise ProtectError(2)
+
+            if self.not_unifi_os:
+                token = response.headers.get("Authorization")
+            else:
+                cookie = response.cookies.get("TOKEN")
+                token = cookie.value if cookie is not None else None
+
+        logging.debug(f"Successfully authenticated as user {self.username}")
+
+        assert token
+        return token
+
+    async def get_api_token(self, force: bool = False, stale_token: Optional[str] = None) -> str:
+        # stale_token: the token a request was rejected with, see PooledSessionMixin.request
+        assert self._token_lock is not None, "use AsyncProtectSession as an async context manager"
+        async with self._token_lock:
+            if force or (stale_token is not None and self._api_token == stale_token):
+                self._api_token = None
+            if self._api_token is None:
+                self._api_token = await self.fetch_api_token()
+            return self._api_token
+
+    def auth_kwargs(self, token: str) -> Dict[str, Any]:
+        if self.not_unifi_os:
+            return {"headers": {"Authorization": f"Bearer {token}"}}
+        return {"cookies": {"TOKEN": token}}
+
+    def api_uri(self, path: str) -> str:
+        return path if "://" in path else f"{self.authority}{self.base_path}{path}"
+
+    def _with_auth(self, token: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # merge the auth headers/cookies with the caller's (e.g. a Range header)
+        request_kwargs = dict(kwargs)
+        for key, value in self.auth_kwargs(token).items():
+            request_kwargs[key] = {**request_kwargs.get(key, {}), **value}
+        return request_kwargs
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> Any:
+        # returns an aiohttp.ClientResponse, which the caller has to release
+        uri = self.api_uri(path)
+        token = await self.get_api_token()
+        response = await self.http.request(method, uri, **self._with_auth(token, kwargs))
+        if response.status == 401:
+            # cached api token expired - log in again once, shared by concurrent requests
+            response.release()
+            response = await self.http.request(
+                method, uri, **self._with_auth(await self.get_api_token(stale_token=token), kwargs)
+            )
+        return response
+
+    @asynccontextmanager
+    async def get(self, path: str, **kwargs: Any) -> AsyncIterator[Any]:
+        response = await self.request("GET", path, **kwargs)
+        try:
+            yield response
+        finally:
+            response.release()
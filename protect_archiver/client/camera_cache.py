@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from datetime import datetime
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from protect_archiver.dataclasses import Camera
+
+
+class CameraCache:
+    """Camera list cached for `ttl` seconds, with an id -> Camera map.
+
+    Camera sets rarely change, so the list is fetched once and reused until the TTL
+    expires or invalidate() is called. If `cache_file` is set the list is also saved
+    to disk, so a restarted process does not need to fetch it again.
+    """
+
+    def __init__(self, ttl: float, cache_file: Optional[str] = None, authority: str = "") -> None:
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.authority = authority
+        self._lock = threading.Lock()
+        self._cameras: List[Camera] = []
+        self._by_id: Dict[str, Camera] = {}
+        self._fetched_at: Optional[float] = None
+        if cache_file:
+            self._load()
+
+    def _is_fresh(self) -> bool:
+        return self._fetched_at is not None and time.time() - self._fetched_at < self.ttl
+
+    def _set(self, cameras: List[Camera], fetched_at: float) -> None:
+        self._cameras = list(cameras)
+        self._by_id = {camera.id: camera for camera in cameras}
+        self._fetched_at = fetched_at
+
+    def _load(self) -> None:
+        try:
+            with open(self.cache_file) as fp:  # type: ignore[arg-type]
+                data = json.load(fp)
+            if data.get("authority") != self.authority:
+                return
+            cameras = [
+                Camera(
+                    id=camera["id"],
+                    name=camera["name"],
+                    recording_start=datetime.fromisoformat(camera["recording_start"]),
+                )
+                for camera in data["cameras"]
+            ]
+            self._set(cameras, float(data["fetched_at"]))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable camera cache {self.cache_file}: {e}")
+
+    def _save(self) -> None:
+        data = {
+            "authority": self.authority,
+            "fetched_at": self._fetched_at,
+            "cameras": [
+                {
+                    "id": camera.id,
+                    "name": camera.name,
+                    "recording_start": camera.recording_start.isoformat(),
+                }
+                for camera in self._cameras
+            ],
+        }
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, "w") as fp:
+                json.dump(data, fp)
+            os.replace(tmp_file, self.cache_file)  # type: ignore[arg-type]
+        except OSError as e:
+            logging.warning(f"Could not save camera cache {self.cache_file}: {e}")
+
+    def get(self, fetch: Callable[[], List[Camera]], force_refresh: bool = False) -> List[Camera]:
+        with self._lock:
+            if force_refresh or not self._is_fresh():
+                cameras = fetch()
+                if not cameras:
+                    # fetching failed (or there really are no cameras) - keep what we had
+                    return list(self._cameras)
+                self._set(cameras, time.time())
+                if self.cache_file:
+                    self._save()
+            return list(self._cameras)
+
+    def get_by_ids(
+        self, fetch: Callable[[], List[Camera]], camera_ids: Iterable[str]
+    ) -> List[Camera]:
+        self.get(fetch)
+        cameras = []
+        for camera_id in camera_ids:
+            camera = self._by_id.get(camera_id)
+            if camera is None:
+                logging.warning(f"Camera {camera_id} not found in camera list")
+            else:
+                cameras.append(camera)
+        return cameras
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._fetched_at = None
@@ -0,0 +1,66 @@
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from protect_archiver.config import Config
+
+
+def create_http_session(verify_ssl: bool, pool_size: int = Config.HTTP_POOL_SIZE) -> requests.Session:
+    # one keep-alive connection pool per console instead of a new TCP+TLS handshake per request
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    http.verify = verify_ssl
+    return http
+
+
+class PooledSessionMixin:
+    # shared by UniFiOSClient and LegacyClient: API requests go through the pooled self.http
+    # session with the API token added by auth_kwargs(), logging in again once on a 401
+    http: requests.Session
+    authority: str
+    base_path: str
+    verify_ssl: bool
+    _api_token: Optional[str]
+
+    def auth_kwargs(self, token: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def cached_api_token(self) -> Optional[str]:
+        # the current api token without logging in, None if there is none yet
+        return self._api_token
+
+    def api_uri(self, path: str) -> str:
+        return path if "://" in path else f"{self.authority}{self.base_path}{path}"
+
+    def _with_auth(self, token: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # merge the auth headers/cookies with the caller's (e.g. a Range header)
+        request_kwargs = dict(kwargs)
+        for key, value in self.auth_kwargs(token).items():
+            request_kwargs[key] = {**request_kwargs.get(key, {}), **value}
+        return request_kwargs
+
+    def request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        uri = self.api_uri(path)
+        # per request, otherwise REQUESTS_CA_BUNDLE would override the session's verify setting
+        kwargs.setdefault("verify", self.verify_ssl)
+        token = self.get_api_token()  # type: ignore[attr-defined]
+        response = self.http.request(method, uri, **self._with_auth(token, kwargs))
+        if response.status_code == 401:
+            # cached api token expired - log in again once; threads rejected with the
+            # same token share a single login
+            response.close()
+            response = self.http.request(
+                method,
+                uri,
+                **self._with_auth(self.get_api_token(stale_token=token), kwargs),  # type: ignore[attr-defined]
+            )
+        return response
+
+    def get(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", path, **kwargs)
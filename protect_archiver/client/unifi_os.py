@@ -1,13 +1,16 @@
 import logging
+import threading
 
+from typing import Any
+from typing import Dict
 from typing import Optional
 
-import requests
-
+from protect_archiver.client.pooled_session import PooledSessionMixin
+from protect_archiver.client.pooled_session import create_http_session
 from protect_archiver.errors import ProtectError
 
 
-class UniFiOSClient:
+class UniFiOSClient(PooledSessionMixin):
     def __init__(
         self,
         protocol: str,
@@ -26,6 +29,10 @@ class UniFiOSClient:
 
         self._access_key: Optional[str] = None
         self._api_token: Optional[str] = None
+        # one login at a time when the session is shared between download threads
+        self._token_lock = threading.Lock()
+        # pooled keep-alive connections, shared by all requests of this client
+        self.http = create_http_session(verify_ssl)
 
         self.authority = f"{self.protocol}://{self.address}:{self.port}"
         self.base_path = "/proxy/protect/api"
@@ -33,7 +40,7 @@ class UniFiOSClient:
     def fetch_session_cookie_token(self) -> str:
         auth_uri = f"{self.protocol}://{self.address}:{self.port}/api/auth/login"
 
-        response = requests.post(
+        response = self.http.post(
             auth_uri,
             json={"username": self.username, "password": self.password},
             verify=self.verify_ssl,
@@ -53,7 +60,18 @@ class UniFiOSClient:
         assert session_cookie_token
         return session_cookie_token
 
-    def get_api_token(self, force: bool = False) -> str:
+    def auth_kwargs(self, token: str) -> Dict[str, Any]:
+        return {"cookies": {"TOKEN": token}}
+
+    def get_api_token(self, force: bool = False, stale_token: Optional[str] = None) -> str:
+        # stale_token: the token a request was rejected with, replaced unless another
+        # thread already logged in again since
+        with self._token_lock:
+            if stale_token is not None and self._api_token == stale_token:
+                force = True
+            return self._get_api_token(force)
+
+    def _get_api_token(self, force: bool) -> str:
         if force:
             self._api_token = None
 
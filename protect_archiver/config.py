@@ -24,4 +24,12 @@ class Config:
         60.0  # aka read_timeout - time to wait until a socket read response happens
     )
     MAX_RETRIES: int = 3
+    HTTP_POOL_SIZE: int = 10  # keep-alive connections kept open to the console
+    MAX_PARALLEL_DOWNLOADS: int = 4  # video exports downloaded at the same time, in total
+    MAX_DOWNLOADS_PER_CONSOLE: int = 2  # video exports downloaded at the same time per console
+    DOWNLOAD_BACKEND: str = "threads"  # "threads" (requests) or "asyncio" (aiohttp)
+    DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024  # bytes read from the socket and written at a time
+    DOWNLOAD_PREALLOCATE: bool = True  # posix_fallocate the file when its size is known
+    DOWNLOAD_PROGRESS_INTERVAL: float = 10.0  # seconds between progress/throughput log lines
+    CAMERA_CACHE_TTL: float = 3600.0  # seconds to reuse the camera list before fetching it again
     USE_UTC_FILENAMES: bool = False
@@ -1,14 +1,28 @@
 from datetime import datetime
 from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import Optional
+from typing import Tuple
 
 from protect_archiver.config import Config
+from protect_archiver.downloader.async_downloader import download_file_async
+from protect_archiver.downloader.async_downloader import download_footage_async
+from protect_archiver.downloader.async_downloader import download_footage_with_backend
+from protect_archiver.downloader.async_downloader import get_camera_list_async
+from protect_archiver.downloader.async_downloader import get_motion_event_list_async
+from protect_archiver.downloader.async_downloader import set_download_backend
 from protect_archiver.downloader.download_file import download_file
 from protect_archiver.downloader.download_footage import download_footage
+from protect_archiver.downloader.download_footage_parallel import DOWNLOAD_LIMITER
 from protect_archiver.downloader.download_motion_event import download_motion_event
 from protect_archiver.downloader.download_snapshot import download_snapshot
 from protect_archiver.downloader.get_camera_list import get_camera_list
 from protect_archiver.downloader.get_motion_event_list import get_motion_event_list
+from protect_archiver.downloader.get_recording_end import get_recording_end
 
 
 class Downloader:
@@ -32,16 +46,38 @@ class Downloader:
     def get_camera_list(session: Any) -> List[Any]:
         return get_camera_list(session)
 
+    @staticmethod
+    def get_camera_list_async(session: Any) -> Awaitable[List[Any]]:
+        return get_camera_list_async(session)
+
+    @staticmethod
+    def get_recording_end(
+        session: Any, camera_id: str, timeout: float = Config.DOWNLOAD_TIMEOUT
+    ) -> Optional[datetime]:
+        return get_recording_end(session, camera_id, timeout)
+
     @staticmethod
     def get_motion_event_list(
         session: Any, start: datetime, end: datetime, camera_list: List[Any]
     ) -> List[Any]:
         return get_motion_event_list(session, start, end, camera_list)
 
+    @staticmethod
+    def get_motion_event_list_async(
+        session: Any, start: datetime, end: datetime, camera_list: List[Any]
+    ) -> Awaitable[List[Any]]:
+        return get_motion_event_list_async(session, start, end, camera_list)
+
     @staticmethod
     def download_file(client: Any, video_export_query: str, filename: str) -> Any:
         return download_file(client, video_export_query, filename)
 
+    @staticmethod
+    def download_file_async(
+        client: Any, session: Any, video_export_query: str, filename: str
+    ) -> Awaitable[bool]:
+        return download_file_async(client, session, video_export_query, filename)
+
     @staticmethod
     def download_footage(
         client: Any,
@@ -53,6 +89,57 @@ class Downloader:
     ) -> Any:
         return download_footage(client, start, end, camera, disable_alignment, disable_splitting)
 
+    @staticmethod
+    def download_footage_parallel(
+        client: Any,
+        downloads: Iterable[Tuple[Any, datetime, datetime]],
+        disable_alignment: bool = Config.DISABLE_ALIGNMENT,
+        disable_splitting: bool = Config.DISABLE_SPLITTING,
+        on_progress: Optional[Callable[[Any, datetime], None]] = None,
+        on_camera_done: Optional[Callable[[Any, List[str]], None]] = None,
+        raise_errors: bool = True,
+    ) -> Dict[str, List[str]]:
+        # thread pool or asyncio, see set_download_backend
+        return download_footage_with_backend(
+            client,
+            downloads,
+            disable_alignment,
+            disable_splitting,
+            on_progress,
+            on_camera_done,
+            raise_errors,
+        )
+
+    @staticmethod
+    def download_footage_async(
+        client: Any,
+        downloads: Iterable[Tuple[Any, datetime, datetime]],
+        disable_alignment: bool = Config.DISABLE_ALIGNMENT,
+        disable_splitting: bool = Config.DISABLE_SPLITTING,
+        on_progress: Optional[Callable[[Any, datetime], None]] = None,
+        on_camera_done: Optional[Callable[[Any, List[str]], None]] = None,
+        raise_errors: bool = True,
+        session: Any = None,
+    ) -> Awaitable[Dict[str, List[str]]]:
+        return download_footage_async(
+            client,
+            downloads,
+            disable_alignment,
+            disable_splitting,
+            on_progress,
+            on_camera_done,
+            raise_errors,
+            session,
+        )
+
+    @staticmethod
+    def set_download_backend(backend: str) -> None:
+        set_download_backend(backend)
+
+    @staticmethod
+    def set_download_limits(max_total: int, max_per_console: int) -> None:
+        DOWNLOAD_LIMITER.configure(max_total, max_per_console)
+
     @staticmethod
     def download_snapshot(client: Any, start: datetime, camera: Any) -> Any:
         return download_snapshot(client, start, camera)
@@ -0,0 +1,398 @@
+# asyncio download backend: the camera list, events list and footage downloads on aiohttp,
+# so one thread can keep many exports in flight across several consoles
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+
+from datetime import datetime
+from typing import Any
+from typing import BinaryIO
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from protect_archiver.config import Config
+from protect_archiver.dataclasses import Camera
+from protect_archiver.dataclasses import MotionEvent
+from protect_archiver.downloader.download_file import DISK_ERRNOS
+from protect_archiver.downloader.download_file import ThroughputReporter
+from protect_archiver.downloader.download_file import content_range_total
+from protect_archiver.downloader.download_file import open_part_file
+from protect_archiver.downloader.download_file import read_part_total
+from protect_archiver.downloader.download_file import remove_part_file
+from protect_archiver.downloader.download_file import write_part_total
+from protect_archiver.downloader.download_footage import prepare_footage_interval
+from protect_archiver.downloader.download_footage_parallel import DOWNLOAD_LIMITER
+from protect_archiver.downloader.download_footage_parallel import FootageProgress
+from protect_archiver.downloader.download_footage_parallel import download_footage_parallel
+from protect_archiver.downloader.get_camera_list import cameras_from_json
+from protect_archiver.downloader.get_motion_event_list import motion_events_from_json
+from protect_archiver.downloader.get_motion_event_list import motion_events_query
+from protect_archiver.errors import DownloadIncomplete
+from protect_archiver.errors import ProtectError
+from protect_archiver.utils import format_bytes
+from protect_archiver.utils import print_download_stats
+
+try:
+    import aiohttp
+
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+DOWNLOAD_BACKENDS = ("threads", "asyncio")
+
+_download_backend = Config.DOWNLOAD_BACKEND
+
+
+def set_download_backend(backend: str) -> None:
+    # backend used by Downloader.download_footage_parallel, falls back to threads without aiohttp
+    global _download_backend
+    if backend not in DOWNLOAD_BACKENDS:
+        raise ValueError(f"Unknown download backend '{backend}', use one of {DOWNLOAD_BACKENDS}")
+    if backend == "asyncio" and not AIOHTTP_AVAILABLE:
+        logging.warning("aiohttp is not installed - using the threads download backend")
+        backend = "threads"
+    _download_backend = backend
+
+
+def get_download_backend() -> str:
+    return _download_backend
+
+
+async def get_camera_list_async(session: Any) -> List[Camera]:
+    async with session.get("/cameras") as response:
+        if response.status != 200:
+            print(f"Error while loading camera list: {response.status}")
+            return []
+        cameras = await response.json(content_type=None)
+
+    logging.info(f"Successfully retrieved data from {session.api_uri('/cameras')}")
+    return cameras_from_json(cameras)
+
+
+async def get_motion_event_list_async(
+    session: Any, start: datetime, end: datetime, camera_list: List[Camera]
+) -> List[MotionEvent]:
+    query = motion_events_query(start, end)
+    async with session.get(query) as response:
+        if response.status != 200:
+            print(f"Error while loading motion events list: {response.status}")
+            return []
+        motion_events = await response.json(content_type=None)
+
+    logging.info(f"Successfully retrieved data from {session.api_uri(query)}")
+    return motion_events_from_json(motion_events, start, end, camera_list)
+
+
+def _remove(filename: str) -> None:
+    if os.path.exists(filename):
+        os.remove(filename)
+
+
+def _close_part_file(fp: BinaryIO) -> None:
+    # drop the preallocated space after the data actually received
+    try:
+        fp.truncate(fp.tell())
+    finally:
+        fp.close()
+
+
+async def download_file_async(client: Any, session: Any, query: str, filename: str) -> bool:
+    # asyncio version of download_file, same .part / Range resume / retry behavior:
+    # returns True if the file was downloaded, False if it was skipped or failed
+    # (with --ignore-failed-downloads)
+    # writing the file (open/fallocate, write, rename) runs in worker threads, a slow or
+    # full disk must not stall the other downloads on the event loop
+    exit_code = 1
+    retry_delay = max(client.download_wait, 3)
+    part_filename = f"{filename}.part"
+    timeout = aiohttp.ClientTimeout(sock_read=client.download_timeout)
+
+    # skip downloading files that already exist on disk if argument --skip-existing-files is present
+    if bool(client.skip_existing_files) and os.path.exists(filename):
+        logging.info(
+            f"File {filename} already exists on disk and argument '--skip-existing-files' "
+            "is present - skipping download \n"
+        )
+        with client.stats_lock:
+            client.files_skipped += 1
+        return False  # skip the download
+
+    # a .part file left by an earlier call is only resumed if its export size is known,
+    # see download_file
+    expected_total = await asyncio.to_thread(read_part_total, part_filename)
+    if expected_total is None:
+        await asyncio.to_thread(remove_part_file, part_filename)
+    start = time.monotonic()
+    cur_bytes = 0  # bytes received over all attempts
+
+    for retry_num in range(client.max_retries):
+        try:
+            offset = os.path.getsize(part_filename) if os.path.exists(part_filename) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            async with session.get(query, headers=headers, timeout=timeout) as response:
+                if offset and response.status == 416:
+                    # the .part file does not fit this export (any more) - start over
+                    await asyncio.to_thread(remove_part_file, part_filename)
+                    raise DownloadIncomplete(f"Range request for {part_filename} not satisfiable")
+
+                if response.status not in (200, 206):
+                    error_message = (await response.text()) or "(no information available)"
+                    logging.error(
+                        f"Download failed with status {response.status} {response.reason}:\n"
+                        f"{error_message}"
+                    )
+                    # a .part file of an earlier attempt cannot be resumed any more
+                    await asyncio.to_thread(remove_part_file, part_filename)
+                    with client.stats_lock:
+                        client.files_failed += 1
+                    return False
+
+                if response.status == 206:
+                    try:
+                        content_range = response.headers.get("Content-Range")
+                        total_bytes = (
+                            content_range_total(content_range, offset, expected_total) or 0
+                        )
+                    except DownloadIncomplete:
+                        # the .part file does not fit this export - start over
+                        await asyncio.to_thread(remove_part_file, part_filename)
+                        raise
+                    logging.info(f"Resuming download of {filename} at {format_bytes(offset)}")
+                else:
+                    if offset:
+                        logging.info("Range requests not supported - restarting download")
+                    offset = 0
+                    total_bytes = int(response.headers.get("Content-Length") or 0)
+                    expected_total = total_bytes or None
+                    await asyncio.to_thread(write_part_total, part_filename, total_bytes)
+
+                # skip download if remote file is smaller than 300b
+                if total_bytes and total_bytes < 300:
+                    logging.warning(
+                        "File is smaller than 300 bytes (empty video clip) - skipping download"
+                    )
+                    await asyncio.to_thread(remove_part_file, part_filename)
+                    with client.stats_lock:
+                        client.files_skipped += 1
+                    return False
+
+                # fixed-size chunks, see download_file
+                throughput = ThroughputReporter(filename, offset, total_bytes)
+                fp = await asyncio.to_thread(open_part_file, part_filename, offset, total_bytes)
+                try:
+                    async for chunk in response.content.iter_chunked(Config.DOWNLOAD_CHUNK_SIZE):
+                        cur_bytes += len(chunk)
+                        await asyncio.to_thread(fp.write, chunk)
+                        throughput.add(len(chunk))
+                finally:
+                    await asyncio.to_thread(_close_part_file, fp)
+
+            file_bytes = os.path.getsize(part_filename)
+            if total_bytes and file_bytes != total_bytes:
+                if file_bytes > total_bytes:
+                    await asyncio.to_thread(remove_part_file, part_filename)
+                raise DownloadIncomplete(
+                    f"Received {format_bytes(file_bytes)} of {format_bytes(total_bytes)}"
+                )
+            await asyncio.to_thread(os.replace, part_filename, filename)
+            await asyncio.to_thread(_remove, f"{part_filename}.total")
+
+            elapsed = time.monotonic() - start
+            logging.info(
+                f"Download successful after {int(elapsed)}s ({format_bytes(file_bytes)}, "
+                f"{format_bytes(int(cur_bytes // elapsed))}ps)"
+            )
+            # Add the downloaded file (relative to destination_path) to download_files
+            rel_path = os.path.relpath(filename, client.destination_path)
+            with client.stats_lock:
+                client.files_downloaded += 1
+                client.bytes_downloaded += cur_bytes
+                client.download_files.append(rel_path)
+            return True
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as request_exception:
+            # keep the .part file, the next attempt resumes it
+            logging.error(f"Download failed: {request_exception!r}")
+            exit_code = 5
+        except DownloadIncomplete as e:
+            logging.warning(f"Download of {filename} incomplete: {e}")
+            exit_code = 5
+        except OSError as e:
+            if e.errno not in DISK_ERRNOS:
+                # connection error, keep the .part file, see download_file
+                logging.error(f"Download failed: {e!r}")
+                exit_code = 5
+            else:
+                # the .part file cannot be written (e.g. ENOSPC), see download_file
+                logging.error(f"Could not write {part_filename}: {e}")
+                await asyncio.to_thread(remove_part_file, part_filename)
+                exit_code = 4
+                break
+
+        logging.warning(f"Retrying in {retry_delay} second(s)...")
+        await asyncio.sleep(retry_delay)
+
+    # a .part file left now is resumed by the next call for this file
+    if not client.ignore_failed_downloads:
+        logging.info(
+            "To skip failed downloads and continue with next file, add argument"
+            " '--ignore-failed-downloads'"
+        )
+        print_download_stats(client)
+        raise ProtectError(exit_code)
+    else:
+        logging.info(
+            "Argument '--ignore-failed-downloads' is present, continue downloading files..."
+        )
+        with client.stats_lock:
+            client.files_skipped += 1
+        return False
+
+
+async def download_footage_async(
+    client: Any,
+    downloads: Iterable[Tuple[Camera, datetime, datetime]],
+    disable_alignment: bool = False,
+    disable_splitting: bool = False,
+    on_progress: Optional[Callable[[Camera, datetime], None]] = None,
+    on_camera_done: Optional[Callable[[Camera, List[str]], None]] = None,
+    raise_errors: bool = True,
+    session: Any = None,
+) -> Dict[str, List[str]]:
+    # asyncio version of download_footage_parallel (same arguments, callbacks and result);
+    # gather several of these, one per ProtectClient, to download from several consoles at once
+    # pass an open AsyncProtectSession to reuse its connections, otherwise one is opened for this call
+    if session is None:
+        async with client.create_async_session() as session:
+            return await download_footage_async(
+                client,
+                downloads,
+                disable_alignment,
+                disable_splitting,
+                on_progress,
+                on_camera_done,
+                raise_errors,
+                session,
+            )
+
+    progress = FootageProgress(
+        client,
+        downloads,
+        disable_alignment,
+        disable_splitting,
+        on_progress,
+        on_camera_done,
+        raise_errors,
+    )
+    console = client.session.authority
+
+    async def run(index: int) -> None:
+        camera, interval_start, interval_end = progress.tasks[index]
+        if progress.skip(index):
+            return
+        try:
+            async with DOWNLOAD_LIMITER.async_slot(console):
+                if progress.skip(index):
+                    return
+                video_export_query, filename = prepare_footage_interval(
+                    client, camera, interval_start, interval_end
+                )
+                downloaded = await download_file_async(client, session, video_export_query, filename)
+        except Exception as e:
+            progress.failed(index, e)
+            return
+        progress.succeeded(
+            index, os.path.relpath(filename, client.destination_path) if downloaded else None
+        )
+
+    if progress.tasks:
+        logging.info(
+            f"Downloading {len(progress.tasks)} file(s) for {len(progress.per_camera)} camera(s), "
+            f"up to {DOWNLOAD_LIMITER.max_per_console} at a time from {console} (asyncio)"
+        )
+        # wait n seconds before the first download (if parameter is set), like download_footage
+        if client.download_wait != 0 and client.files_downloaded == 0:
+            await asyncio.sleep(int(client.download_wait))
+        await asyncio.gather(*(run(index) for index in range(len(progress.tasks))))
+
+    return progress.finish()
+
+
+class AsyncBackend:
+    # event loop of the asyncio backend for blocking callers (download_footage_with_backend):
+    # one loop thread for the process and one AsyncProtectSession (connection pool and api
+    # token) per console, both kept between calls instead of a new loop, pool and login each
+    # time; callers on several threads share the loop, within the limits of DOWNLOAD_LIMITER
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # by the blocking session of the client, which forks of a client share
+        self._sessions: Dict[Any, Any] = {}
+        atexit.register(self.close)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="download-asyncio", daemon=True
+                ).start()
+            return self._loop
+
+    async def _session(self, client: Any) -> Any:
+        # runs on the loop thread
+        session = self._sessions.get(client.session)
+        if session is None:
+            session = await client.create_async_session().__aenter__()
+            self._sessions[client.session] = session
+        return session
+
+    def run(self, client: Any, *args: Any) -> Dict[str, List[str]]:
+        # download_footage_async(client, *args) on the shared loop, blocks until it is done
+        async def download() -> Dict[str, List[str]]:
+            return await download_footage_async(client, *args, session=await self._session(client))
+
+        return asyncio.run_coroutine_threadsafe(download(), self._get_loop()).result()
+
+    def close(self) -> None:
+        # close the sessions and stop the loop (also at exit), the next run() starts a new one
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def close_sessions() -> None:
+            sessions, self._sessions = self._sessions, {}
+            for session in sessions.values():
+                await session.__aexit__(None, None, None)
+
+        asyncio.run_coroutine_threadsafe(close_sessions(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+ASYNC_BACKEND = AsyncBackend()
+
+
+def download_footage_with_backend(
+    client: Any,
+    downloads: Iterable[Tuple[Camera, datetime, datetime]],
+    disable_alignment: bool = False,
+    disable_splitting: bool = False,
+    on_progress: Optional[Callable[[Camera, datetime], None]] = None,
+    on_camera_done: Optional[Callable[[Camera, List[str]], None]] = None,
+    raise_errors: bool = True,
+) -> Dict[str, List[str]]:
+    # blocking entry point of Downloader.download_footage_parallel: the thread pool, or the
+    # shared event loop of ASYNC_BACKEND with the asyncio backend
+    args = (client, downloads, disable_alignment, disable_splitting, on_progress, on_camera_done, raise_errors)
+    if _download_backend == "asyncio":
+        return ASYNC_BACKEND.run(*args)
+    return download_footage_parallel(*args)
@@ -1,23 +1,141 @@
 # file downloader
+import errno
 import json
 import logging
 import os
+import re
 import time
 
 from typing import Any
+from typing import BinaryIO
+from typing import Optional
 
 import requests
 
+from protect_archiver.config import Config
 from protect_archiver.errors import DownloadFailed
+from protect_archiver.errors import DownloadIncomplete
 from protect_archiver.errors import ProtectError
 from protect_archiver.utils import format_bytes
 from protect_archiver.utils import print_download_stats
 
+# errors writing the .part file that a retry cannot fix (shared with the asyncio backend);
+# other OSErrors are connection errors and retried
+DISK_ERRNOS = frozenset(
+    getattr(errno, name) for name in ("ENOSPC", "EDQUOT", "EROFS") if hasattr(errno, name)
+)
 
-def download_file(client: Any, query: str, filename: str) -> None:
+
+def content_range_total(
+    content_range: str, offset: int, expected_total: Optional[int] = None
+) -> Optional[int]:
+    # total size from "Content-Range: bytes <offset>-<last>/<total>" of a 206 response,
+    # raises DownloadIncomplete if the range does not continue the .part file or the export
+    # is not the size the .part file was started for (shared with the asyncio backend)
+    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", content_range or "")
+    if not match or int(match.group(1)) != offset:
+        raise DownloadIncomplete(f"Unexpected Content-Range '{content_range}' for offset {offset}")
+    total = None if match.group(2) == "*" else int(match.group(2))
+    if expected_total is not None and total != expected_total:
+        raise DownloadIncomplete(
+            f"Export is {total} bytes, the .part file was started for {expected_total} bytes"
+        )
+    return total
+
+
+def read_part_total(part_filename: str) -> Optional[int]:
+    # size of the export a .part file was started for (None: unknown or no .part file);
+    # kept next to it in <part_filename>.total, so a later call or run can check that a
+    # resumed export is still the same one (shared with the asyncio backend)
+    if not os.path.exists(part_filename):
+        return None
+    try:
+        with open(f"{part_filename}.total") as fp:
+            return int(fp.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write_part_total(part_filename: str, total_bytes: int) -> None:
+    # records the size of a new .part file's export, see read_part_total
+    if total_bytes:
+        with open(f"{part_filename}.total", "w") as fp:
+            fp.write(str(total_bytes))
+    else:
+        _remove(f"{part_filename}.total")
+
+
+def remove_part_file(part_filename: str) -> None:
+    # removes a .part file and its recorded size (shared with the asyncio backend)
+    _remove(part_filename)
+    _remove(f"{part_filename}.total")
+
+
+def open_part_file(part_filename: str, offset: int, total_bytes: int) -> BinaryIO:
+    # opens the .part file for writing at offset (0: a new file), buffered in chunk-size blocks
+    # if the final size is known the rest of the file is preallocated (posix_fallocate), so a
+    # long export is written without fragmentation and a full disk fails the download right away;
+    # the caller truncates the file to the data received (shared with the asyncio backend)
+    fp = open(part_filename, "r+b" if offset else "wb", buffering=Config.DOWNLOAD_CHUNK_SIZE)
+    fp.seek(offset)
+    if Config.DOWNLOAD_PREALLOCATE and total_bytes > offset and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fp.fileno(), offset, total_bytes - offset)
+        except OSError as e:
+            if e.errno in DISK_ERRNOS:
+                fp.close()
+                raise
+            # not supported by the file system - write without preallocation
+            logging.debug(f"Could not preallocate {part_filename}: {e}")
+    return fp
+
+
+class ThroughputReporter:
+    # logs the progress and speed of a download every DOWNLOAD_PROGRESS_INTERVAL seconds
+    # (shared with the asyncio backend)
+    def __init__(self, filename: str, offset: int, total_bytes: int) -> None:
+        self.filename = filename
+        self.offset = offset
+        self.total_bytes = total_bytes
+        self.received = 0
+        self.start = self.last_report = time.monotonic()
+
+    def add(self, nbytes: int) -> None:
+        self.received += nbytes
+        now = time.monotonic()
+        if now - self.last_report < Config.DOWNLOAD_PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        done = self.offset + self.received
+        of_total = (
+            f" of {format_bytes(self.total_bytes)} ({done * 100 // self.total_bytes}%)"
+            if self.total_bytes
+            else ""
+        )
+        logging.info(
+            f"{os.path.basename(self.filename)}: {format_bytes(done)}{of_total}, "
+            f"{format_bytes(int(self.received // (now - self.start)))}ps"
+        )
+
+
+def _remove(filename: str) -> None:
+    if os.path.exists(filename):
+        os.remove(filename)
+
+
+def download_file(client: Any, query: str, filename: str) -> bool:
+    # returns True if the file was downloaded, False if it was skipped or failed
+    # (with --ignore-failed-downloads)
+    # counters are updated under client.stats_lock, files may be downloaded in parallel
+    # the file is written to <filename>.part and renamed once its size matches content-length,
+    # so filename never holds a partial download; a retry continues the .part file with a
+    # Range request if the console supports it, as does a later call for the same file (e.g.
+    # after a restart) if the export still has the size recorded for the .part file
     exit_code = 1
+    downloaded = False
     retry_delay = max(client.download_wait, 3)
     uri = f"{client.session.authority}{client.session.base_path}{query}"
+    part_filename = f"{filename}.part"
 
     # skip downloading files that already exist on disk if argument --skip-existing-files is present
     # TODO(dcramer): sanity check on filesize would be valuable here
@@ -26,59 +144,42 @@ def download_file(client: Any, query: str, filename: str) -> None:
             f"File {filename} already exists on disk and argument '--skip-existing-files' "
             "is present - skipping download \n"
         )
-        client.files_skipped += 1
-        return  # skip the download
+        with client.stats_lock:
+            client.files_skipped += 1
+        return False  # skip the download
+
+    # a .part file left by an earlier call is only resumed if its export size is known: the
+    # export of a time range that was still being recorded has a different size by now
+    expected_total = read_part_total(part_filename)
+    if expected_total is None:
+        remove_part_file(part_filename)
+    start = time.monotonic()
+    cur_bytes = 0  # bytes received over all attempts
 
     for retry_num in range(client.max_retries):
         # make the GET request to retrieve the video file or snapshot
+        response = None
         try:
-            start = time.monotonic()
-            response = (
-                requests.get(
-                    uri,
-                    cookies={"TOKEN": client.session.get_api_token()},
-                    verify=client.verify_ssl,
-                    timeout=client.download_timeout,
-                    stream=True,
-                )
-                if client.session.__class__.__name__ == "UniFiOSClient"
-                else requests.get(
-                    uri,
-                    headers={"Authorization": f"Bearer {client.session.get_api_token()}"},
-                    verify=client.verify_ssl,
-                    timeout=client.download_timeout,
-                    stream=True,
-                )
+            offset = os.path.getsize(part_filename) if os.path.exists(part_filename) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            # pooled keep-alive session; on a 401 (expired api token) it logs in again once,
+            # consecutive auth failures are not retried
+            response = client.session.get(
+                uri,
+                verify=client.verify_ssl,
+                timeout=client.download_timeout,
+                stream=True,
+                headers=headers,
             )
 
-            if response.status_code == 401:
-                # invalid current api token - we special case this
-                # as we dont want to retry on consecutive auth failures
-                # TODO: refactor this
-                start = time.monotonic()
-                response = (
-                    requests.get(
-                        uri,
-                        cookies={"TOKEN": client.session.get_api_token(force=True)},
-                        verify=client.verify_ssl,
-                        timeout=client.download_timeout,
-                        stream=True,
-                    )
-                    if client.session.__class__.__name__ == "UniFiOSClient"
-                    else requests.get(
-                        uri,
-                        headers={
-                            "Authorization": f"Bearer {client.session.get_api_token(force=True)}"
-                        },
-                        verify=client.verify_ssl,
-                        timeout=client.download_timeout,
-                        stream=True,
-                    )
-                )
+            if offset and response.status_code == 416:
+                # the .part file does not fit this export (any more) - start over
+                remove_part_file(part_filename)
+                raise DownloadIncomplete(f"Range request for {part_filename} not satisfiable")
 
-            # write file to disk if response.status_code is 200,
+            # write file to disk if response.status_code is 200 (206 when resuming),
             # otherwise log error and then either exit or skip the download
-            if response.status_code != 200:
+            if response.status_code not in (200, 206):
                 try:
                     data = json.loads(response.content)
                     error_message = data.get("error") or data or "(no information available)"
@@ -91,7 +192,10 @@ def download_file(client: Any, query: str, filename: str) -> None:
                     f"Download failed with status {response.status_code} {response.reason}:\n"
                     f"{error_message}"
                 )
-                client.files_failed += 1
+                # a .part file of an earlier attempt cannot be resumed any more
+                remove_part_file(part_filename)
+                with client.stats_lock:
+                    client.files_failed += 1
                 # if response.status_code == 401:
                 #     cls = Errors.AuthorizationFailed
                 # else:
@@ -101,65 +205,109 @@ def download_file(client: Any, query: str, filename: str) -> None:
                 # )
 
             else:
-                total_bytes = int(response.headers.get("content-length") or 0)
-                cur_bytes = 0
-                if not total_bytes:
-                    with open(filename, "wb") as fp:
-                        content = response.content
-                        cur_bytes = len(content)
-                        total_bytes = cur_bytes
-                        fp.write(content)
-
-                else:
-                    # skip download if remote file is smaller than 300b
-                    if total_bytes < 300:
-                        logging.warning(
-                            "File is smaller than 300 bytes (empty video clip) - skipping download"
+                if response.status_code == 206:
+                    try:
+                        content_range = response.headers.get("content-range")
+                        total_bytes = (
+                            content_range_total(content_range, offset, expected_total) or 0
                         )
+                    except DownloadIncomplete:
+                        # the .part file does not fit this export - start over
+                        remove_part_file(part_filename)
+                        raise
+                    logging.info(f"Resuming download of {filename} at {format_bytes(offset)}")
+                else:
+                    if offset:
+                        logging.info("Range requests not supported - restarting download")
+                    offset = 0
+                    total_bytes = int(response.headers.get("content-length") or 0)
+                    expected_total = total_bytes or None
+                    write_part_total(part_filename, total_bytes)
+
+                # skip download if remote file is smaller than 300b
+                if total_bytes and total_bytes < 300:
+                    logging.warning(
+                        "File is smaller than 300 bytes (empty video clip) - skipping download"
+                    )
+                    remove_part_file(part_filename)
+                    with client.stats_lock:
                         client.files_skipped += 1
-                        return
+                    return False
 
-                    with open(filename, "wb") as fp:
-                        for chunk in response.iter_content(None):
+                # fixed-size chunks, so memory use does not depend on the length of the export,
+                # also when Protect sends no content-length
+                throughput = ThroughputReporter(filename, offset, total_bytes)
+                with open_part_file(part_filename, offset, total_bytes) as fp:
+                    try:
+                        for chunk in response.iter_content(Config.DOWNLOAD_CHUNK_SIZE):
                             cur_bytes += len(chunk)
                             fp.write(chunk)
-                            # TODO
-                            # done = int(50 * cur_bytes / total_bytes)
-                            # sys.stdout.write("\r[%s%s] %sps" % ('=' * done, ' ' * (50-done),
-                            #   format_bytes(cur_bytes//(time.monotonic() - start))))
-                            # print('')
+                            throughput.add(len(chunk))
+                    finally:
+                        # drop the preallocated space after the data actually received
+                        fp.truncate(fp.tell())
+
+                file_bytes = os.path.getsize(part_filename)
+                if total_bytes and file_bytes != total_bytes:
+                    if file_bytes > total_bytes:
+                        remove_part_file(part_filename)
+                    raise DownloadIncomplete(
+                        f"Received {format_bytes(file_bytes)} of {format_bytes(total_bytes)}"
+                    )
+                os.replace(part_filename, filename)
+                _remove(f"{part_filename}.total")
 
                 elapsed = time.monotonic() - start
                 logging.info(
-                    f"Download successful after {int(elapsed)}s ({format_bytes(cur_bytes)}, "
+                    f"Download successful after {int(elapsed)}s ({format_bytes(file_bytes)}, "
                     f"{format_bytes(int(cur_bytes // elapsed))}ps)"
                 )
-                client.files_downloaded += 1
-                client.bytes_downloaded += cur_bytes
                 # Add the downloaded file (relative to destination_path) to download_files
                 rel_path = os.path.relpath(filename, client.destination_path)
-                client.download_files.append(rel_path)
+                with client.stats_lock:
+                    client.files_downloaded += 1
+                    client.bytes_downloaded += cur_bytes
+                    client.download_files.append(rel_path)
+                downloaded = True
 
         except requests.exceptions.RequestException as request_exception:
-            # clean up
-            if os.path.exists(filename):
-                os.remove(filename)
+            # keep the .part file, the next attempt resumes it
             logging.exception(f"Download failed: {request_exception}")
             exit_code = 5
+        except DownloadIncomplete as e:
+            logging.warning(f"Download of {filename} incomplete: {e}")
+            exit_code = 5
         except DownloadFailed:
             # clean up
-            if os.path.exists(filename):
-                os.remove(filename)
+            remove_part_file(part_filename)
             logging.exception(
-                f"Download failed with status {response.status_code} {response.reason}"
+                f"Download failed with status {response.status_code} {response.reason}"  # type: ignore[union-attr]
             )
             exit_code = 4
+        except OSError as e:
+            if e.errno not in DISK_ERRNOS:
+                # connection error that is not wrapped in a RequestException, keep the
+                # .part file, the next attempt resumes it
+                logging.exception(f"Download failed: {e}")
+                exit_code = 5
+            else:
+                # the .part file cannot be written (e.g. ENOSPC when preallocating) -
+                # retrying would fail the same way
+                logging.error(f"Could not write {part_filename}: {e}")
+                remove_part_file(part_filename)
+                exit_code = 4
+                break
         else:
-            return
+            return downloaded
+        finally:
+            # hand the connection back to the pool
+            if response is not None:
+                response.close()
 
         logging.warning(f"Retrying in {retry_delay} second(s)...")
         time.sleep(retry_delay)
 
+    # a .part file left now is resumed by the next call for this file
     if not client.ignore_failed_downloads:
         logging.info(
             "To skip failed downloads and continue with next file, add argument"
@@ -171,4 +319,6 @@ def download_file(client: Any, query: str, filename: str) -> None:
         logging.info(
             "Argument '--ignore-failed-downloads' is present, continue downloading files..."
         )
-        client.files_skipped += 1
+        with client.stats_lock:
+            client.files_skipped += 1
+        return False
@@ -5,6 +5,8 @@ from datetime import datetime
 from datetime import timezone
 from os import path
 from typing import Any
+from typing import Optional
+from typing import Tuple
 
 from protect_archiver.dataclasses import Camera
 from protect_archiver.downloader.download_file import download_file
@@ -21,9 +23,6 @@ def download_footage(
     disable_alignment: bool = False,
     disable_splitting: bool = False,
 ) -> None:
-    # make camera name safe for use in file name
-    camera_name_fs_safe = make_camera_name_fs_safe(camera)
-
     logging.info(f"Downloading footage for camera '{camera.name}' ({camera.id})")
 
     # split requested time frame into chunks of 1 hour or less and download them one by one
@@ -33,46 +32,82 @@ def download_footage(
         disable_alignment,
         disable_splitting,
     ):
-        # wait n seconds before starting next download (if parameter is set)
-        if client.download_wait != 0 and client.files_downloaded == 0:
-            logging.debug(
-                "Command line argument '--wait-between-downloads' is set to"
-                f" {client.download_wait} second(s)... \n"
-            )
-            time.sleep(int(client.download_wait))
-
-        # start and end time of the video segment to be downloaded
-        js_timestamp_range_start = int(interval_start.timestamp() * 1e3)
-        js_timestamp_range_end = int(interval_end.timestamp() * 1e3)
-
-        # support selection between local time zone and UTC for file names
-        interval_start_tz = (
-            interval_start.astimezone(timezone.utc) if client.use_utc_filenames else interval_start
-        )
+        download_footage_interval(client, camera, interval_start, interval_end)
 
-        download_dir = build_download_dir(
-            use_subfolders=client.use_subfolders,
-            destination_path=client.destination_path,
-            interval_start_tz=interval_start_tz,
-            camera_name_fs_safe=camera_name_fs_safe,
-        )
 
-        # file name for download
-        filename_timestamp = interval_start_tz.strftime("%Y-%m-%d - %H.%M.%S%z")
-        filename = f"{download_dir}/{camera_name_fs_safe} - {filename_timestamp}.mp4"
+def download_footage_interval(
+    client: Any,
+    camera: Camera,
+    interval_start: datetime,
+    interval_end: datetime,
+    wait: bool = True,
+) -> Optional[str]:
+    # download one interval (1 hour or less) of footage, returns the file name relative to
+    # the destination path if the file was downloaded
+    # wait=False skips the download wait, for callers that did it already
+
+    if wait:
+        wait_before_download(client)
+
+    video_export_query, filename = prepare_footage_interval(
+        client, camera, interval_start, interval_end
+    )
+
+    # download the file
+    if download_file(client, video_export_query, filename):
+        return path.relpath(filename, client.destination_path)
+    return None
 
-        logging.info(
-            f"Downloading video for time range {interval_start} - {interval_end} to {filename}"
+
+def wait_before_download(client: Any) -> None:
+    # wait n seconds before starting next download (if parameter is set)
+    if client.download_wait != 0 and client.files_downloaded == 0:
+        logging.debug(
+            "Command line argument '--wait-between-downloads' is set to"
+            f" {client.download_wait} second(s)... \n"
         )
+        time.sleep(int(client.download_wait))
+
+
+def prepare_footage_interval(
+    client: Any, camera: Camera, interval_start: datetime, interval_end: datetime
+) -> Tuple[str, str]:
+    # returns the export query and the file name for one interval of footage
+    # (shared with the asyncio backend)
+    # make camera name safe for use in file name
+    camera_name_fs_safe = make_camera_name_fs_safe(camera)
+
+    # start and end time of the video segment to be downloaded
+    js_timestamp_range_start = int(interval_start.timestamp() * 1e3)
+    js_timestamp_range_end = int(interval_end.timestamp() * 1e3)
+
+    # support selection between local time zone and UTC for file names
+    interval_start_tz = (
+        interval_start.astimezone(timezone.utc) if client.use_utc_filenames else interval_start
+    )
+
+    download_dir = build_download_dir(
+        use_subfolders=client.use_subfolders,
+        destination_path=client.destination_path,
+        interval_start_tz=interval_start_tz,
+        camera_name_fs_safe=camera_name_fs_safe,
+    )
+
+    # file name for download
+    filename_timestamp = interval_start_tz.strftime("%Y-%m-%d - %H.%M.%S%z")
+    filename = f"{download_dir}/{camera_name_fs_safe} - {filename_timestamp}.mp4"
+
+    logging.info(
+        f"Downloading video for time range {interval_start} - {interval_end} to {filename}"
+    )
 
-        # create file without content if argument --touch-files is present
-        # XXX(dcramer): would be nice to document why you'd ever want this
-        if bool(client.touch_files) and not path.exists(filename):
-            logging.debug(f"Argument '--touch-files' is present. Creating file at {filename}")
-            open(filename, "a").close()
+    # create file without content if argument --touch-files is present
+    # XXX(dcramer): would be nice to document why you'd ever want this
+    if bool(client.touch_files) and not path.exists(filename):
+        logging.debug(f"Argument '--touch-files' is present. Creating file at {filename}")
+        open(filename, "a").close()
 
-        # build video export query
-        video_export_query = f"/video/export?camera={camera.id}&start={js_timestamp_range_start}&end={js_timestamp_range_end}"
+    # build video export query
+    video_export_query = f"/video/export?camera={camera.id}&start={js_timestamp_range_start}&end={js_timestamp_range_end}"
 
-        # download the file
-        download_file(client, video_export_query, filename)
+    return video_export_query, filename
@@ -0,0 +1,254 @@
+# bounded-parallel footage download across cameras and intervals
+import asyncio
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from protect_archiver.config import Config
+from protect_archiver.dataclasses import Camera
+from protect_archiver.downloader.download_footage import download_footage_interval
+from protect_archiver.downloader.download_footage import wait_before_download
+from protect_archiver.utils import calculate_intervals
+
+class DownloadLimiter:
+    # caps the number of exports running at the same time, in total and per console,
+    # for all downloads of the process (several clients, threads or event loops may download at once)
+    # threads wait on a condition, coroutines on a future of their own event loop; both are
+    # woken when a slot is freed, so neither blocks an event loop nor polls
+    def __init__(self, max_total: int, max_per_console: int) -> None:
+        self._lock = threading.Lock()
+        self._freed = threading.Condition(self._lock)
+        self._running = 0
+        self._running_per_console: Dict[str, int] = {}
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = []
+        self.configure(max_total, max_per_console)
+
+    def configure(self, max_total: int, max_per_console: int) -> None:
+        # running exports keep their slots, higher limits let waiting ones start right away
+        with self._lock:
+            self.max_total = max(1, max_total)
+            self.max_per_console = max(1, max_per_console)
+            self._wake_waiters()
+
+    def _try_acquire(self, console: str) -> bool:
+        # called with lock held
+        running = self._running_per_console.get(console, 0)
+        if self._running >= self.max_total or running >= self.max_per_console:
+            return False
+        self._running += 1
+        self._running_per_console[console] = running + 1
+        return True
+
+    def _release(self, console: str) -> None:
+        with self._lock:
+            self._running -= 1
+            self._running_per_console[console] -= 1
+            self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        # called with lock held; the woken waiters check for a free slot again
+        self._freed.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve, future)
+
+    @contextmanager
+    def slot(self, console: str) -> Iterator[None]:
+        with self._lock:
+            while not self._try_acquire(console):
+                self._freed.wait()
+        try:
+            yield
+        finally:
+            self._release(console)
+
+    @asynccontextmanager
+    async def async_slot(self, console: str) -> AsyncIterator[None]:
+        # same slots as slot(), waits without blocking the event loop
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire(console):
+                    break
+                freed = loop.create_future()
+                self._async_waiters.append((loop, freed))
+            await freed
+        try:
+            yield
+        finally:
+            self._release(console)
+
+
+def _resolve(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+DOWNLOAD_LIMITER = DownloadLimiter(Config.MAX_PARALLEL_DOWNLOADS, Config.MAX_DOWNLOADS_PER_CONSOLE)
+
+
+class FootageProgress:
+    # bookkeeping of a parallel footage download, shared by the thread and asyncio engines:
+    # splits the (camera, start, end) ranges into intervals (tasks), tracks which are done
+    # and calls the on_progress / on_camera_done callbacks
+    def __init__(
+        self,
+        client: Any,
+        downloads: Iterable[Tuple[Camera, datetime, datetime]],
+        disable_alignment: bool,
+        disable_splitting: bool,
+        on_progress: Optional[Callable[[Camera, datetime], None]],
+        on_camera_done: Optional[Callable[[Camera, List[str]], None]],
+        raise_errors: bool,
+    ) -> None:
+        self.client = client
+        self.on_progress = on_progress
+        self.on_camera_done = on_camera_done
+        self.raise_errors = raise_errors
+
+        self.tasks: List[Tuple[Camera, datetime, datetime]] = []
+        self.per_camera: Dict[str, List[int]] = {}
+        for camera, start, end in downloads:
+            for interval_start, interval_end in calculate_intervals(
+                start, end, disable_alignment, disable_splitting
+            ):
+                self.per_camera.setdefault(camera.id, []).append(len(self.tasks))
+                self.tasks.append((camera, interval_start, interval_end))
+
+        self.results: List[Optional[str]] = [None] * len(self.tasks)
+        self.finished = [False] * len(self.tasks)
+        self.failed_cameras: Dict[str, BaseException] = {}
+        # completed intervals at the start of each camera's list, as last reported
+        self.reported: Dict[str, int] = {}
+        self.abort = threading.Event()
+        self.lock = threading.Lock()
+        self.downloaded_before = len(client.download_files)
+
+    def skip(self, index: int) -> bool:
+        # True if the task should not be started (any more)
+        return self.abort.is_set() or self.tasks[index][0].id in self.failed_cameras
+
+    def succeeded(self, index: int, rel_path: Optional[str]) -> None:
+        camera = self.tasks[index][0]
+        with self.lock:
+            self.results[index] = rel_path
+            self.finished[index] = True
+            self._report(camera)
+
+    def failed(self, index: int, error: BaseException) -> None:
+        camera, interval_start, interval_end = self.tasks[index]
+        logging.error(
+            f"Download of camera {camera.name} for {interval_start} - {interval_end} failed: {error}"
+        )
+        with self.lock:
+            self.failed_cameras.setdefault(camera.id, error)
+        if self.raise_errors:
+            self.abort.set()
+
+    def _report(self, camera: Camera) -> None:
+        # called with lock held
+        indexes = self.per_camera[camera.id]
+        done = 0
+        while done < len(indexes) and self.finished[indexes[done]]:
+            done += 1
+        if done == self.reported.get(camera.id, 0):
+            return
+        self.reported[camera.id] = done
+        if self.on_progress is not None:
+            self.on_progress(camera, self.tasks[indexes[done - 1]][2])
+        if done == len(indexes) and self.on_camera_done is not None:
+            self.on_camera_done(camera, [self.results[i] for i in indexes if self.results[i]])  # type: ignore[misc]
+
+    def finish(self) -> Dict[str, List[str]]:
+        # keep the order of the requested intervals, not the order downloads finished in
+        order = {rel_path: i for i, rel_path in enumerate(self.results) if rel_path}
+        with self.client.stats_lock:
+            self.client.download_files[self.downloaded_before:] = sorted(
+                self.client.download_files[self.downloaded_before:],
+                key=lambda f: order.get(f, len(order)),
+            )
+
+        if self.raise_errors and self.failed_cameras:
+            raise next(iter(self.failed_cameras.values()))
+
+        return {
+            camera_id: [self.results[i] for i in indexes if self.results[i]]  # type: ignore[misc]
+            for camera_id, indexes in self.per_camera.items()
+        }
+
+
+def download_footage_parallel(
+    client: Any,
+    downloads: Iterable[Tuple[Camera, datetime, datetime]],
+    disable_alignment: bool = False,
+    disable_splitting: bool = False,
+    on_progress: Optional[Callable[[Camera, datetime], None]] = None,
+    on_camera_done: Optional[Callable[[Camera, List[str]], None]] = None,
+    raise_errors: bool = True,
+) -> Dict[str, List[str]]:
+    # Downloads the footage of several (camera, start, end) ranges at once. All intervals
+    # of all cameras are queued and run within the limits of DOWNLOAD_LIMITER.
+    #  - on_progress(camera, done_until) is called whenever a camera's footage is complete
+    #    up to done_until (the end of the last interval without gaps before it)
+    #  - on_camera_done(camera, files) is called when all intervals of a camera are done
+    # Returns the downloaded files (relative to the destination path) per camera id, in
+    # interval order. client.download_files is ordered the same way.
+    # The first error is raised after the running downloads finished; the remaining ones
+    # are not started. With raise_errors=False a camera stops at its first failed interval
+    # and the other cameras continue.
+    progress = FootageProgress(
+        client,
+        downloads,
+        disable_alignment,
+        disable_splitting,
+        on_progress,
+        on_camera_done,
+        raise_errors,
+    )
+    console = client.session.authority
+
+    def run(index: int) -> None:
+        camera, interval_start, interval_end = progress.tasks[index]
+        if progress.skip(index):
+            return
+        try:
+            with DOWNLOAD_LIMITER.slot(console):
+                if progress.skip(index):
+                    return
+                rel_path = download_footage_interval(
+                    client, camera, interval_start, interval_end, wait=False
+                )
+        except Exception as e:
+            progress.failed(index, e)
+            return
+        progress.succeeded(index, rel_path)
+
+    if progress.tasks:
+        logging.info(
+            f"Downloading {len(progress.tasks)} file(s) for {len(progress.per_camera)} camera(s), "
+            f"up to {DOWNLOAD_LIMITER.max_per_console} at a time from {console}"
+        )
+        # wait once before the first download, not in every task while it holds a slot
+        wait_before_download(client)
+        with ThreadPoolExecutor(
+            max_workers=min(len(progress.tasks), DOWNLOAD_LIMITER.max_total),
+            thread_name_prefix="footage-download",
+        ) as executor:
+            # consume the results so exceptions from the callbacks are not lost
+            list(executor.map(run, range(len(progress.tasks))))
+
+    return progress.finish()
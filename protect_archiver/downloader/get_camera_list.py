@@ -5,35 +5,25 @@ from datetime import datetime
 from typing import Any
 from typing import List
 
-import requests
-
 from protect_archiver.dataclasses import Camera
 
 
 def get_camera_list(session: Any) -> List[Camera]:
     cameras_uri = f"{session.authority}{session.base_path}/cameras"
 
-    response = (
-        requests.get(
-            cameras_uri,
-            cookies={"TOKEN": session.get_api_token()},
-            verify=session.verify_ssl,
-        )
-        if session.__class__.__name__ == "UniFiOSClient"
-        else requests.get(
-            cameras_uri,
-            headers={"Authorization": f"Bearer {session.get_api_token()}"},
-            verify=session.verify_ssl,
-        )
-    )
+    # pooled session, logs in again once if the cached api token expired
+    response = session.get("/cameras")
 
     if response.status_code != 200:
         print(f"Error while loading camera list: {response.status_code}")
         return []
 
     logging.info(f"Successfully retrieved data from {cameras_uri}")
-    cameras = response.json()
+    return cameras_from_json(response.json())
+
 
+def cameras_from_json(cameras: List[Any]) -> List[Camera]:
+    # shared with the asyncio backend (get_camera_list_async)
     camera_list = []
     for camera in cameras:
         camera_data = Camera(id=camera["id"], name=camera["name"], recording_start=datetime.min)
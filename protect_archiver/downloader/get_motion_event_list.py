@@ -6,48 +6,46 @@ from typing import Any
 from typing import Counter
 from typing import List
 
-import requests
-
 from protect_archiver.dataclasses import Camera
 from protect_archiver.dataclasses import MotionEvent
 
 
-def get_motion_event_list(
-    session: Any, start: datetime, end: datetime, camera_list: List[Camera]
-) -> List[MotionEvent]:
-    motion_events_uri = (
+def motion_events_query(start: datetime, end: datetime) -> str:
+    # shared with the asyncio backend (get_motion_event_list_async)
+    return (
         # TODO: REMARK 2024-Jan-29 @danielfernau #388
         # TODO: The API has been updated and now uses 'type' multiple times instead of a list.
         # TODO: The query parameters documented below are mostly still correct but need to be checked.
         # TODO: Param "withoutDescriptions=true" should be present to avoid unnecessary data in the response.
-        f"{session.authority}{session.base_path}/events?"
+        "/events?"
         "type=motion&type=smartDetectZone&type=smartDetectLine&type=smartAudioDetect&type=ring&"
         "type=doorAccess&smartDetectType=licensePlate&withoutDescriptions=true"
         f"&start={int(start.timestamp()) * 1000}&end={int(end.timestamp()) * 1000}"
         f"&start={int(start.timestamp()) * 1000}&end={int(end.timestamp()) * 1000}"
     )
 
-    response = (
-        requests.get(
-            motion_events_uri,
-            cookies={"TOKEN": session.get_api_token()},
-            verify=session.verify_ssl,
-        )
-        if session.__class__.__name__ == "UniFiOSClient"
-        else requests.get(
-            motion_events_uri,
-            headers={"Authorization": f"Bearer {session.get_api_token()}"},
-            verify=session.verify_ssl,
-        )
-    )
+
+def get_motion_event_list(
+    session: Any, start: datetime, end: datetime, camera_list: List[Camera]
+) -> List[MotionEvent]:
+    motion_events_uri = f"{session.authority}{session.base_path}{motion_events_query(start, end)}"
+
+    response = session.get(motion_events_uri)
 
     if response.status_code != 200:
         print(f"Error while loading motion events list: {response.status_code}")
         return []
 
     logging.info(f"Successfully retrieved data from {motion_events_uri}")
+    return motion_events_from_json(response.json(), start, end, camera_list)
+
+
+def motion_events_from_json(
+    motion_events: List[Any], start: datetime, end: datetime, camera_list: List[Camera]
+) -> List[MotionEvent]:
+    # shared with the asyncio backend (get_motion_event_list_async)
     # filter ongoing event with no end date https://github.com/danielfernau/unifi-protect-video-downloader/issues/65
-    motion_events = filter(lambda motion_event: motion_event["end"], response.json())
+    motion_events = list(filter(lambda motion_event: motion_event["end"], motion_events))
 
     motion_event_list = []
     for motion_event in motion_events:
@@ -0,0 +1,38 @@
+# get the end of the recorded footage of a camera
+import logging
+
+from datetime import datetime
+from typing import Any
+from typing import Optional
+
+import requests
+
+from protect_archiver.config import Config
+
+
+def get_recording_end(
+    session: Any, camera_id: str, timeout: float = Config.DOWNLOAD_TIMEOUT
+) -> Optional[datetime]:
+    # cheap readiness probe: footage up to this time can be exported
+    # pooled session, logs in again once if the cached api token expired
+    try:
+        response = session.get(f"/cameras/{camera_id}", timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Error while probing camera {camera_id}: {e!r}")
+        return None
+
+    if response.status_code != 200:
+        logging.warning(f"Error while probing camera {camera_id}: {response.status_code}")
+        return None
+
+    try:
+        camera = response.json()
+    except ValueError as e:
+        # e.g. an HTML error page from a proxy in front of the console
+        logging.warning(f"Error while probing camera {camera_id}: invalid response: {e}")
+        return None
+
+    recording_end = camera.get("stats", {}).get("video", {}).get("recordingEnd")
+    if not recording_end:
+        return None
+    return datetime.utcfromtimestamp(recording_end / 1000)
@@ -34,6 +34,16 @@ class DownloadFailed(Error):
     pass
 
 
+class DownloadIncomplete(DownloadFailed):
+    """Signifies that a download ended before the whole file was received.
+
+    The partial data is kept in the `.part` file, so the next attempt can resume it
+    with an HTTP Range request instead of starting from the first byte.
+    """
+
+    pass
+
+
 class AuthorizationFailed(Error):
     """Represents failures in the authorization or authentication process.
 
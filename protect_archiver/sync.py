@@ -7,8 +7,8 @@ from os import path
 import dateutil.parser
 
 from .client import ProtectClient
+from .dataclasses import Camera
 from .downloader import Downloader
-from .utils import calculate_intervals
 from .utils import json_encode
 
 
@@ -40,33 +40,36 @@ class ProtectSync:
             state = self.readstate()
         else:
             state = {"cameras": {}}
+        downloads = []
         for camera in camera_list:
-            try:
-                camera_state = state["cameras"].setdefault(camera.id, {})
-                start = (
-                    dateutil.parser.parse(camera_state["last"]).replace(
-                        minute=0, second=0, microsecond=0
-                    )
-                    if "last" in camera_state
-                    else camera.recording_start.replace(minute=0, second=0, microsecond=0)
+            camera_state = state["cameras"].setdefault(camera.id, {})
+            start = (
+                dateutil.parser.parse(camera_state["last"]).replace(
+                    minute=0, second=0, microsecond=0
                 )
-                end = datetime.now().replace(minute=0, second=0, microsecond=0)
-                for interval_start, interval_end in calculate_intervals(start, end):
-                    Downloader.download_footage(
-                        self.client,
-                        interval_start,
-                        interval_end,
-                        camera,
-                        disable_alignment=False,
-                        disable_splitting=False,
-                    )
-                    state["cameras"][camera.id] = {
-                        "last": interval_end,
-                        "name": camera.name,
-                    }
-            except Exception:
-                logging.exception(
-                    f"Failed to sync camera {camera.name} - continuing to next device"
-                )
-            finally:
-                self.writestate(state)
+                if "last" in camera_state
+                else camera.recording_start.replace(minute=0, second=0, microsecond=0)
+            )
+            end = datetime.now().replace(minute=0, second=0, microsecond=0)
+            downloads.append((camera, start, end))
+
+        def on_progress(camera: Camera, done_until: datetime) -> None:
+            # intervals finish out of order - only everything up to done_until is complete
+            state["cameras"][camera.id] = {
+                "last": done_until,
+                "name": camera.name,
+            }
+            self.writestate(state)
+
+        try:
+            # a failed camera is logged and skipped, the other cameras continue
+            Downloader.download_footage_parallel(
+                self.client,
+                downloads,
+                disable_alignment=False,
+                disable_splitting=False,
+                on_progress=on_progress,
+                raise_errors=False,
+            )
+        finally:
+            self.writestate(state)
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import threading
+import time
+
+from datetime import datetime
+from datetime import timezone
+from typing import Any
+from typing import Dict
+
+import pytest
+
+from protect_archiver.client import ProtectClient
+from protect_archiver.config import Config
+from protect_archiver.dataclasses import Camera
+from protect_archiver.downloader import Downloader
+from protect_archiver.downloader import async_downloader
+from protect_archiver.downloader.download_footage_parallel import DownloadLimiter
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+# not affected by no_retry_delay
+_sleep = asyncio.sleep
+
+
+class FakeProtect:
+    # console answering logins and video exports, see export() for the cameras
+    def __init__(self) -> None:
+        self.logins = 0
+        self.ranges = []
+        self.app = web.Application()
+        self.app.router.add_post("/api/auth/login", self.login)
+        self.app.router.add_get("/proxy/protect/api/video/export", self.export)
+
+    async def login(self, request: Any) -> Any:
+        self.logins += 1
+        response = web.json_response({})
+        response.set_cookie("TOKEN", "token")
+        return response
+
+    async def export(self, request: Any) -> Any:
+        if request.cookies.get("TOKEN") != "token":
+            return web.Response(status=401)
+        camera = request.query["camera"]
+        byte_range = request.headers.get("Range")
+        self.ranges.append(byte_range)
+        if camera == "error":
+            return web.json_response({"error": "export failed"}, status=500)
+        if camera == "resume" and byte_range is None:
+            # connection drops after the first half of the file
+            response = web.StreamResponse(headers={"Content-Length": "640"})
+            await response.prepare(request)
+            await response.write(b"a" * 320)
+            # let the client read it, data still buffered when the connection drops is lost
+            await _sleep(0.1)
+            request.transport.close()
+            return response
+        if byte_range is not None:
+            return web.Response(
+                status=206, body=b"b" * 320, headers={"Content-Range": "bytes 320-639/640"}
+            )
+        return web.Response(body=b"a" * 640)
+
+
+def _client(port: int, destination_path: str) -> ProtectClient:
+    client = ProtectClient(
+        address="127.0.0.1", protocol="http", password="secret", destination_path=destination_path
+    )
+    # UniFi OS consoles are always on port 443
+    client.port = port
+    return client
+
+
+async def _download(client: Any, camera: str, filename: str) -> bool:
+    async with client.create_async_session() as session:
+        return await async_downloader.download_file_async(
+            client, session, f"/video/export?camera={camera}&start=0&end=1", filename
+        )
+
+
+@pytest.fixture
+def no_retry_delay(monkeypatch: Any) -> None:
+    async def no_delay(delay: float, *args: Any, **kwargs: Any) -> Any:
+        return await _sleep(0, *args, **kwargs)
+
+    monkeypatch.setattr(asyncio, "sleep", no_delay)
+
+
+def test_download_file_async_resumes_part_file(
+    tmp_path: Any, monkeypatch: Any, no_retry_delay: Any
+) -> None:
+    # a dropped connection loses the chunk being read, keep them small
+    monkeypatch.setattr(Config, "DOWNLOAD_CHUNK_SIZE", 64)
+    protect = FakeProtect()
+    filename = str(tmp_path / "export.mp4")
+
+    async def run() -> bool:
+        async with TestServer(protect.app) as server:
+            return await _download(_client(server.port, str(tmp_path)), "resume", filename)
+
+    assert asyncio.run(run())
+    assert protect.ranges == [None, "bytes=320-"]
+    with open(filename, "rb") as fp:
+        assert fp.read() == b"a" * 320 + b"b" * 320
+    assert not os.path.exists(f"{filename}.part")
+    assert protect.logins == 1
+
+
+def test_download_file_async_error_status(tmp_path: Any) -> None:
+    protect = FakeProtect()
+    filename = str(tmp_path / "export.mp4")
+    # left over from an earlier attempt
+    with open(f"{filename}.part", "wb") as fp:
+        fp.write(b"a" * 320)
+    client: Dict[str, Any] = {}
+
+    async def run() -> bool:
+        async with TestServer(protect.app) as server:
+            client["client"] = _client(server.port, str(tmp_path))
+            return await _download(client["client"], "error", filename)
+
+    assert not asyncio.run(run())
+    assert client["client"].files_failed == 1
+    assert not os.path.exists(filename)
+    assert not os.path.exists(f"{filename}.part")
+
+
+def test_asyncio_backend_keeps_loop_and_session(tmp_path: Any) -> None:
+    protect = FakeProtect()
+    # the server runs on a loop of its own, the downloads on the backend's loop thread
+    loop = asyncio.new_event_loop()
+    server = TestServer(protect.app)
+    loop.run_until_complete(server.start_server())
+    serving = threading.Thread(target=loop.run_forever, daemon=True)
+    serving.start()
+    camera = Camera(id="full", name="Full", recording_start=datetime.min)
+    start = datetime(2020, 1, 8, 22, 30, 0, tzinfo=timezone.utc)
+    end = datetime(2020, 1, 8, 22, 59, 0, tzinfo=timezone.utc)
+    backend = async_downloader.get_download_backend()
+    try:
+        Downloader.set_download_backend("asyncio")
+        client = _client(server.port, str(tmp_path))
+        for _ in range(2):
+            results = Downloader.download_footage_parallel(
+                client, [(camera, start, end)], disable_splitting=True
+            )
+            assert results == {"full": ["Full (full) - 2020-01-08 - 22.30.00+0000.mp4"]}
+    finally:
+        Downloader.set_download_backend(backend)
+        async_downloader.ASYNC_BACKEND.close()
+        loop.call_soon_threadsafe(loop.stop)
+        serving.join(5)
+        loop.run_until_complete(server.close())
+        loop.close()
+
+    assert len(protect.ranges) == 2
+    assert protect.logins == 1
+    assert client.files_downloaded == 2
+
+
+def test_async_slot_waits_for_a_thread_to_release() -> None:
+    limiter = DownloadLimiter(max_total=1, max_per_console=1)
+    released = threading.Event()
+
+    def hold_slot() -> None:
+        with limiter.slot("console"):
+            time.sleep(0.1)
+            released.set()
+
+    async def run() -> bool:
+        thread = threading.Thread(target=hold_slot)
+        thread.start()
+        await asyncio.sleep(0.01)
+        async with limiter.async_slot("console"):
+            done = released.is_set()
+        thread.join()
+        return done
+
+    assert asyncio.run(run())
@@ -1,12 +1,21 @@
+import errno
 import os
+import re
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from datetime import timedelta
 from datetime import timezone
 from typing import Any
 
 import pytest
+import requests
 
+from protect_archiver.config import Config
 from protect_archiver.downloader import Downloader
+from protect_archiver.downloader.download_footage_parallel import DOWNLOAD_LIMITER
+from protect_archiver.errors import ProtectError
 
 
 @pytest.fixture(autouse=True)
@@ -94,3 +103,337 @@ def test_download_footage(
             "e1d02d3942f029bec370e7d12bd62bec347b373c66bccced3a1071fc69cef311"
             "d19e46501c94273a42fb72f694ddbf1fcb22c257970b206e981dab011915aa42"
         )
+
+
+def test_get_camera_list_is_cached(responses: Any, client: Any) -> None:
+    first = client.get_camera_list()
+    second = client.get_camera_list()
+
+    assert [c.id for c in second] == [c.id for c in first]
+    camera_calls = [call for call in responses.calls if call.request.url.endswith("/cameras")]
+    assert len(camera_calls) == 1
+
+    client.invalidate_camera_cache()
+    client.get_camera_list()
+    camera_calls = [call for call in responses.calls if call.request.url.endswith("/cameras")]
+    assert len(camera_calls) == 2
+
+
+def test_get_cameras_by_id(client: Any) -> None:
+    results = client.get_cameras(["testCameraId", "unknownCameraId", "exteriorCameraId"])
+
+    assert [c.id for c in results] == ["testCameraId", "exteriorCameraId"]
+
+
+def test_get_recording_end(responses: Any, client: Any) -> None:
+    responses.add(
+        responses.GET,
+        "https://unifi:443/proxy/protect/api/cameras/exteriorCameraId",
+        json={"id": "exteriorCameraId", "stats": {"video": {"recordingEnd": 1578525969586}}},
+    )
+    responses.add(
+        responses.GET,
+        "https://unifi:443/proxy/protect/api/cameras/offlineCameraId",
+        json={"id": "offlineCameraId", "stats": {"video": {"recordingEnd": None}}},
+    )
+
+    assert client.get_recording_end("exteriorCameraId") == datetime(2020, 1, 8, 23, 26, 9, 586000)
+    assert client.get_recording_end("offlineCameraId") is None
+
+
+def test_get_recording_end_times_out(responses: Any, client: Any) -> None:
+    client.download_timeout = 2.5
+    responses.add(
+        responses.GET,
+        "https://unifi:443/proxy/protect/api/cameras/exteriorCameraId",
+        body=requests.exceptions.ReadTimeout("read timed out"),
+    )
+
+    assert client.get_recording_end("exteriorCameraId") is None
+    assert responses.calls[-1].request.req_kwargs["timeout"] == 2.5
+
+
+def test_get_recording_end_invalid_response(responses: Any, client: Any) -> None:
+    responses.add(
+        responses.GET,
+        "https://unifi:443/proxy/protect/api/cameras/exteriorCameraId",
+        body="<html><body>502 Bad Gateway</body></html>",
+        content_type="text/html",
+    )
+    responses.add(responses.GET, "https://unifi:443/proxy/protect/api/cameras/testCameraId", body="")
+
+    assert client.get_recording_end("exteriorCameraId") is None
+    assert client.get_recording_end("testCameraId") is None
+
+
+def test_api_request_logs_in_again_once_on_401(responses: Any, client: Any) -> None:
+    camera_uri = "https://unifi:443/proxy/protect/api/cameras/exteriorCameraId"
+    responses.add(responses.GET, camera_uri, status=401)
+    responses.add(responses.GET, camera_uri, json={"id": "exteriorCameraId"})
+
+    response = client.session.get("/cameras/exteriorCameraId")
+
+    assert response.status_code == 200
+    login_calls = [call for call in responses.calls if call.request.url.endswith("/api/auth/login")]
+    assert len(login_calls) == 2
+
+
+def test_concurrent_401s_log_in_again_once(responses: Any, client: Any) -> None:
+    camera_uri = "https://unifi:443/proxy/protect/api/cameras/exteriorCameraId"
+    threads = 4
+    # every thread is rejected with the expired token before any of them logs in again
+    rejected = threading.Barrier(threads)
+
+    def camera(request: Any) -> Any:
+        if "TOKEN=expired" in request.headers.get("Cookie", ""):
+            rejected.wait(5)
+            return 401, {}, ""
+        return 200, {}, '{"id": "exteriorCameraId"}'
+
+    responses.add_callback(responses.GET, camera_uri, callback=camera)
+    client.session._api_token = "expired"
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        statuses = list(
+            executor.map(
+                lambda _: client.session.get("/cameras/exteriorCameraId").status_code,
+                range(threads),
+            )
+        )
+
+    assert statuses == [200] * threads
+    login_calls = [call for call in responses.calls if call.request.url.endswith("/api/auth/login")]
+    assert len(login_calls) == 1
+
+
+def test_download_footage_parallel(
+    responses: Any, client: Any, sample_camera: Any, test_output_dest: Any
+) -> None:
+    responses.add(
+        responses.GET,
+        re.compile(r"https://unifi:443/proxy/protect/api/video/export\?camera=exteriorCameraId.*"),
+        body="0" * 320,
+        headers={"Content-Type": "video/mp4", "Content-Length": "320"},
+    )
+
+    start = datetime(2020, 1, 8, 22, 30, 0, tzinfo=timezone.utc)
+    end = datetime(2020, 1, 9, 0, 59, 0, tzinfo=timezone.utc)
+    progress = []
+    done = []
+
+    results = Downloader.download_footage_parallel(
+        client,
+        [(sample_camera, start, end)],
+        on_progress=lambda camera, done_until: progress.append(done_until),
+        on_camera_done=lambda camera, files: done.append(files),
+    )
+
+    expected = [
+        f"Exterior (raId) - 2020-01-{day} - {time}+0000.mp4"
+        for day, time in (("08", "22.30.00"), ("08", "23.00.00"), ("09", "00.00.00"))
+    ]
+    assert results == {"exteriorCameraId": expected}
+    assert client.download_files == expected
+    assert done == [expected]
+    assert progress == sorted(progress)
+    assert progress[-1] == end - timedelta(milliseconds=1)
+    assert client.files_downloaded == 3
+    assert client.bytes_downloaded == 3 * 320
+    assert all(os.path.exists(os.path.join(test_output_dest, f)) for f in expected)
+
+
+def test_download_footage_parallel_waits_outside_slots(
+    responses: Any, client: Any, sample_camera: Any, monkeypatch: Any
+) -> None:
+    running_while_waiting = []
+    monkeypatch.setattr(
+        "time.sleep", lambda seconds: running_while_waiting.append(DOWNLOAD_LIMITER._running)
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r"https://unifi:443/proxy/protect/api/video/export\?camera=exteriorCameraId.*"),
+        body="0" * 320,
+        headers={"Content-Type": "video/mp4", "Content-Length": "320"},
+    )
+    client.download_wait = 5
+
+    start = datetime(2020, 1, 8, 22, 30, 0, tzinfo=timezone.utc)
+    end = datetime(2020, 1, 9, 0, 59, 0, tzinfo=timezone.utc)
+    Downloader.download_footage_parallel(client, [(sample_camera, start, end)])
+
+    # once for the call, before any slot is taken
+    assert running_while_waiting == [0]
+    assert client.files_downloaded == 3
+
+
+def test_download_file_resumes_part_file(
+    responses: Any, client: Any, test_output_dest: Any, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    # a dropped connection loses the chunk being read, keep them small
+    monkeypatch.setattr(Config, "DOWNLOAD_CHUNK_SIZE", 64)
+    uri = "https://unifi:443/proxy/protect/api/video/export?camera=exteriorCameraId&start=0&end=1"
+    # connection drops after the first half of the file
+    responses.add(
+        responses.GET,
+        uri,
+        body="a" * 320,
+        headers={"Content-Type": "video/mp4", "Content-Length": "640"},
+        auto_calculate_content_length=False,
+    )
+    responses.add(
+        responses.GET,
+        uri,
+        status=206,
+        body="b" * 320,
+        headers={"Content-Type": "video/mp4", "Content-Range": "bytes 320-639/640"},
+    )
+    file_name = os.path.join(test_output_dest, "export.mp4")
+
+    assert Downloader.download_file(client, "/video/export?camera=exteriorCameraId&start=0&end=1", file_name)
+
+    export_calls = [call for call in responses.calls if call.request.url == uri]
+    assert "Range" not in export_calls[0].request.headers
+    assert export_calls[1].request.headers["Range"] == "bytes=320-"
+    with open(file_name) as fp:
+        assert fp.read() == "a" * 320 + "b" * 320
+    assert not os.path.exists(f"{file_name}.part")
+    assert client.bytes_downloaded == 640
+
+
+def test_download_file_resumes_part_file_of_earlier_call(
+    responses: Any, client: Any, test_output_dest: Any, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    monkeypatch.setattr(Config, "DOWNLOAD_CHUNK_SIZE", 64)
+    uri = "https://unifi:443/proxy/protect/api/video/export?camera=exteriorCameraId&start=0&end=1"
+    # the first call gives up after the connection dropped halfway
+    client.max_retries = 1
+    client.ignore_failed_downloads = True
+    responses.add(
+        responses.GET,
+        uri,
+        body="a" * 320,
+        headers={"Content-Type": "video/mp4", "Content-Length": "640"},
+        auto_calculate_content_length=False,
+    )
+    responses.add(
+        responses.GET,
+        uri,
+        status=206,
+        body="b" * 320,
+        headers={"Content-Type": "video/mp4", "Content-Range": "bytes 320-639/640"},
+    )
+    file_name = os.path.join(test_output_dest, "export.mp4")
+    query = "/video/export?camera=exteriorCameraId&start=0&end=1"
+
+    assert not Downloader.download_file(client, query, file_name)
+    assert os.path.getsize(f"{file_name}.part") == 320
+
+    assert Downloader.download_file(client, query, file_name)
+
+    export_calls = [call for call in responses.calls if call.request.url == uri]
+    assert export_calls[1].request.headers["Range"] == "bytes=320-"
+    with open(file_name) as fp:
+        assert fp.read() == "a" * 320 + "b" * 320
+    assert not os.path.exists(f"{file_name}.part")
+    assert not os.path.exists(f"{file_name}.part.total")
+
+
+def test_download_file_restarts_part_file_of_other_export(
+    responses: Any, client: Any, test_output_dest: Any, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    uri = "https://unifi:443/proxy/protect/api/video/export?camera=exteriorCameraId&start=0&end=1"
+    file_name = os.path.join(test_output_dest, "export.mp4")
+    # left by an earlier run, when the export was still 600 bytes long
+    with open(f"{file_name}.part", "w") as fp:
+        fp.write("a" * 320)
+    with open(f"{file_name}.part.total", "w") as fp:
+        fp.write("600")
+    responses.add(
+        responses.GET,
+        uri,
+        status=206,
+        body="b" * 320,
+        headers={"Content-Type": "video/mp4", "Content-Range": "bytes 320-639/640"},
+    )
+    responses.add(responses.GET, uri, body="c" * 640, headers={"Content-Type": "video/mp4"})
+
+    assert Downloader.download_file(client, "/video/export?camera=exteriorCameraId&start=0&end=1", file_name)
+
+    export_calls = [call for call in responses.calls if call.request.url == uri]
+    assert export_calls[0].request.headers["Range"] == "bytes=320-"
+    assert "Range" not in export_calls[1].request.headers
+    with open(file_name) as fp:
+        assert fp.read() == "c" * 640
+
+
+def test_download_file_drops_part_file_on_failed_resume(
+    responses: Any, client: Any, test_output_dest: Any, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    monkeypatch.setattr(Config, "DOWNLOAD_CHUNK_SIZE", 64)
+    uri = "https://unifi:443/proxy/protect/api/video/export?camera=exteriorCameraId&start=0&end=1"
+    responses.add(
+        responses.GET,
+        uri,
+        body="a" * 320,
+        headers={"Content-Type": "video/mp4", "Content-Length": "640"},
+        auto_calculate_content_length=False,
+    )
+    responses.add(responses.GET, uri, status=500, json={"error": "export failed"})
+    file_name = os.path.join(test_output_dest, "export.mp4")
+
+    assert not Downloader.download_file(
+        client, "/video/export?camera=exteriorCameraId&start=0&end=1", file_name
+    )
+
+    assert not os.path.exists(f"{file_name}.part")
+    assert not os.path.exists(file_name)
+    assert client.files_failed == 1
+
+
+def test_download_file_fails_on_full_disk(
+    responses: Any, client: Any, test_output_dest: Any, monkeypatch: Any
+) -> None:
+    def no_space(*args: Any) -> None:
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    monkeypatch.setattr(os, "posix_fallocate", no_space, raising=False)
+    uri = "https://unifi:443/proxy/protect/api/video/export?camera=exteriorCameraId&start=0&end=1"
+    responses.add(
+        responses.GET,
+        uri,
+        body="a" * 640,
+        headers={"Content-Type": "video/mp4", "Content-Length": "640"},
+        auto_calculate_content_length=False,
+    )
+    file_name = os.path.join(test_output_dest, "export.mp4")
+
+    with pytest.raises(ProtectError):
+        Downloader.download_file(client, "/video/export?camera=exteriorCameraId&start=0&end=1", file_name)
+    assert len([call for call in responses.calls if call.request.url == uri]) == 1
+    assert not os.path.exists(f"{file_name}.part")
+
+    client.ignore_failed_downloads = True
+    assert not Downloader.download_file(
+        client, "/video/export?camera=exteriorCameraId&start=0&end=1", file_name
+    )
+    assert client.files_skipped == 1
+
+
+def test_download_file_retries_connection_oserror(
+    responses: Any, client: Any, test_output_dest: Any, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    uri = "https://unifi:443/proxy/protect/api/video/export?camera=exteriorCameraId&start=0&end=1"
+    responses.add(
+        responses.GET, uri, body=ConnectionResetError(errno.ECONNRESET, "Connection reset by peer")
+    )
+    responses.add(responses.GET, uri, body="a" * 640, headers={"Content-Type": "video/mp4"})
+    file_name = os.path.join(test_output_dest, "export.mp4")
+
+    assert Downloader.download_file(client, "/video/export?camera=exteriorCameraId&start=0&end=1", file_name)
+    assert len([call for call in responses.calls if call.request.url == uri]) == 2
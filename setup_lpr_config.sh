@@ -533,7 +533,8 @@ if [ ! -f "$CONFIG_FILE" ]; then
     },
     "server": {
         "port": 1025,
-        "max_concurrent_ffmpeg": 4
+        "max_concurrent_ffmpeg": 4,
+        "max_concurrent_downloads": 2
     }
 }
 EOF
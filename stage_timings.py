@@ -0,0 +1,139 @@
+import math
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# Per-event processing timings of protectStoremedia.py, stored in the event database
+# (table event_timing) and summarized on the web UI's /stats/timings.
+#
+# Stages, in pipeline order:
+#   queue_wait   webhook received -> a downloader picks the event up (includes the
+#                deliberate age_seconds / readiness delay)
+#   auth         making sure the Protect API token is valid (a login when it expired)
+#   camera_list  looking up the cameras (cached, see camera_cache_ttl_seconds)
+#   probe        readiness probe (readiness_mode "probe")
+#   download     video export download, with bytes for MB/s
+#   subclip      cutting the event's clip out of a shared export
+#   motion_scan  OpenCV motion scan
+#   ffmpeg_trim  ffmpeg trim of the motionless start and end
+#   thumbnails   center frame and thumbnails
+#   db_insert    the event table transaction
+#   total        webhook received -> event stored
+#
+# Stages that run once per camera or clip are summed over the event's cameras/clips.
+STAGES = (
+    "queue_wait", "auth", "camera_list", "probe", "download", "subclip",
+    "motion_scan", "ffmpeg_trim", "thumbnails", "db_insert", "total",
+)
+
+
+class StageTimer:
+    """Collects the seconds (and bytes moved) per stage for one event or export."""
+
+    def __init__(self, seconds=None, nbytes=None):
+        self.seconds = dict(seconds or {})
+        self.bytes = dict(nbytes or {})
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    def add(self, name, seconds, nbytes=None):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        if nbytes is not None:
+            self.bytes[name] = self.bytes.get(name, 0) + nbytes
+
+    def merge(self, other):
+        """Add the stages of another StageTimer (or a plain {stage: seconds} dict)."""
+        if isinstance(other, StageTimer):
+            for name, seconds in other.seconds.items():
+                self.add(name, seconds, other.bytes.get(name))
+        else:
+            for name, seconds in other.items():
+                self.add(name, seconds)
+
+
+def init_timing_table(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS event_timing (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            finished_at REAL NOT NULL,
+            job_id INTEGER,
+            license_plate TEXT,
+            stage TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            bytes INTEGER
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_event_timing_finished_at ON event_timing (finished_at)")
+    conn.commit()
+
+
+def store_timings(conn, events):
+    """Insert the timings of (job_id, license_plate, StageTimer) events in one transaction."""
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT INTO event_timing (finished_at, job_id, license_plate, stage, seconds, bytes) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (now, job_id, license_plate, stage, round(seconds, 4), timer.bytes.get(stage))
+                for job_id, license_plate, timer in events
+                for stage, seconds in timer.seconds.items()
+            ],
+        )
+
+
+def purge_timings(conn, older_than_seconds):
+    with conn:
+        return conn.execute(
+            "DELETE FROM event_timing WHERE finished_at < ?", (time.time() - older_than_seconds,)
+        ).rowcount
+
+
+def _percentile(sorted_values, pct):
+    # nearest-rank percentile, as in bench_webhook.py
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_timings(conn, since):
+    """Return per-stage statistics for events finished after since (epoch seconds).
+
+    One dict per stage that has samples, in pipeline order: count, avg/p50/p95/max in
+    seconds and, for stages that moved data, MB/s over all samples.
+    """
+    try:
+        rows = conn.execute(
+            "SELECT stage, seconds, bytes FROM event_timing WHERE finished_at >= ?", (since,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # No timings recorded yet (table is created by protectStoremedia.py)
+        return []
+    samples = {}
+    for stage, seconds, nbytes in rows:
+        entry = samples.setdefault(stage, ([], [0, 0.0]))
+        entry[0].append(seconds)
+        if nbytes is not None:
+            entry[1][0] += nbytes
+            entry[1][1] += seconds
+    summary = []
+    for stage in STAGES + tuple(sorted(set(samples) - set(STAGES))):
+        if stage not in samples:
+            continue
+        values, (total_bytes, byte_seconds) = samples[stage]
+        values.sort()
+        summary.append({
+            "stage": stage,
+            "count": len(values),
+            "avg": round(sum(values) / len(values), 3),
+            "p50": round(_percentile(values, 50), 3),
+            "p95": round(_percentile(values, 95), 3),
+            "max": round(values[-1], 3),
+            "mb_per_s": round(total_bytes / byte_seconds / 1e6, 2) if total_bytes and byte_seconds else None,
+        })
+    return summary
@@ -0,0 +1,89 @@
+import pytest
+
+import dedup_cache
+from dedup_cache import DedupCache, delivery_key
+from event_queue import EventQueue
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(dedup_cache.time, "time", clock)
+    return clock
+
+
+def test_delivery_key() -> None:
+    assert delivery_key({"eventId": "e1", "device": "cam", "value": "AB123C"}) == "e1|cam|AB123C"
+    assert delivery_key({"device": "cam", "value": "AB123C"}) is None
+
+
+def test_duplicate_within_ttl(clock) -> None:
+    cache = DedupCache(ttl=60)
+
+    assert not cache.check_and_add("a")
+    clock.now += 59
+    assert cache.check_and_add("a")
+
+
+def test_ttl_expiry(clock) -> None:
+    cache = DedupCache(ttl=60)
+
+    assert not cache.check_and_add("a")
+    clock.now += 60
+    assert not cache.check_and_add("a")
+
+
+def test_lru_eviction(clock) -> None:
+    cache = DedupCache(ttl=60, max_entries=2)
+    cache.check_and_add("a")
+    cache.check_and_add("b")
+    # a hit refreshes a, so b is the least recently used entry
+    assert cache.check_and_add("a")
+
+    cache.check_and_add("c")
+
+    assert len(cache) == 2
+    assert cache.check_and_add("a")
+    assert not cache.check_and_add("b")
+
+
+def test_persisted_across_restart(clock, tmp_path) -> None:
+    db_file = str(tmp_path / "queue.db")
+    queue = EventQueue(db_file)
+    cache = DedupCache(ttl=60, store=queue)
+    cache.check_and_add("a")
+    cache.check_and_add("b")
+    queue.close()
+
+    clock.now += 30
+    queue = EventQueue(db_file)
+    cache = DedupCache(ttl=60, store=queue)
+    assert len(cache) == 2
+    assert cache.check_and_add("a")
+
+    # past the TTL nothing is loaded
+    clock.now += 31
+    restarted = DedupCache(ttl=60, store=queue)
+    assert not restarted.check_and_add("b")
+    queue.close()
+
+
+def test_discard(clock, tmp_path) -> None:
+    db_file = str(tmp_path / "queue.db")
+    queue = EventQueue(db_file)
+    cache = DedupCache(ttl=60, store=queue)
+    cache.check_and_add("a")
+
+    cache.discard("a")
+
+    assert not cache.check_and_add("a", persist=False)
+    assert len(DedupCache(ttl=60, store=queue)) == 0
+    queue.close()
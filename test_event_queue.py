@@ -0,0 +1,122 @@
+import pytest
+
+from event_queue import DONE, FAILED, LEASED, PENDING, EventQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = EventQueue(str(tmp_path / "queue.db"), visibility_timeout=600, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def _status(queue, job_id):
+    return queue.conn.execute("SELECT * FROM event_queue WHERE id = ?", (job_id,)).fetchone()
+
+
+def test_lease_returns_leased_job(queue) -> None:
+    job_id = queue.enqueue("2026-10-17 12:00:00", "AB-123-C", 1000, not_before=50)
+
+    assert queue.lease(now=10) is None
+    job = queue.lease(now=100)
+
+    assert job["id"] == job_id
+    assert job["status"] == LEASED
+    assert job["attempts"] == 1
+    assert job["leased_at"] == 100
+    assert job["not_before"] == 700
+    assert dict(_status(queue, job_id)) == job
+    # leased jobs are invisible until the visibility timeout expires
+    assert queue.lease(now=699) is None
+
+
+def test_lease_overlapping_returns_leased_jobs(queue) -> None:
+    first = queue.enqueue("t", "A", 10_000, not_before=0)
+    second = queue.enqueue("t", "B", 12_000, not_before=0)
+    queue.enqueue("t", "C", 90_000, not_before=0)
+
+    jobs = queue.lease_overlapping(-5_000, 5_000, 20_000, now=100)
+
+    assert [job["id"] for job in jobs] == [first, second]
+    for job in jobs:
+        assert job["status"] == LEASED
+        assert job["leased_at"] == 100
+        assert dict(_status(queue, job["id"])) == job
+
+
+def test_visibility_timeout_expiry_makes_job_ready_again(queue) -> None:
+    job_id = queue.enqueue("t", "A", 1000, not_before=0)
+    queue.lease(now=100)
+
+    job = queue.lease(now=700)
+
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+
+
+def test_retry_backs_off_and_gives_up(queue) -> None:
+    job_id = queue.enqueue("t", "A", 1000, not_before=0)
+    job = queue.lease()
+
+    assert queue.retry(job, "boom", delay=60)
+    row = _status(queue, job_id)
+    assert row["status"] == PENDING
+    assert row["last_error"] == "boom"
+    assert queue.lease(now=row["not_before"] - 1) is None
+
+    job = queue.lease(now=row["not_before"])
+    assert not queue.retry(job, "boom again")
+    assert _status(queue, job_id)["status"] == FAILED
+
+
+def test_defer_does_not_count_the_attempt(queue) -> None:
+    job_id = queue.enqueue("t", "A", 1000, not_before=0)
+    job = queue.lease()
+
+    queue.defer(job, 60, "footage not ready")
+
+    row = _status(queue, job_id)
+    assert row["status"] == PENDING
+    assert row["attempts"] == 0
+    assert row["last_error"] == "footage not ready"
+    assert queue.lease(now=row["not_before"] - 1) is None
+
+
+def test_release_leases(queue) -> None:
+    queue.enqueue("t", "A", 1000, not_before=0)
+    queue.enqueue("t", "B", 2000, not_before=0)
+    queue.lease()
+
+    assert queue.release_leases() == 1
+    assert {queue.lease()["license_plate"], queue.lease()["license_plate"]} == {"A", "B"}
+
+
+def test_ack_many_finishes_jobs_and_drops_checkpoints(queue) -> None:
+    job_ids = queue.enqueue_many([("t", "A", 1000, 0), ("t", "B", 2000, 0)])
+    jobs = queue.lease_overlapping(-5_000, 5_000, 20_000)
+    queue.checkpoint(job_ids, "download", "camera1", ["a.mp4"])
+
+    assert queue.ack_many(jobs) == job_ids
+
+    assert [_status(queue, job_id)["status"] for job_id in job_ids] == [DONE, DONE]
+    assert queue.checkpoints(job_ids, "download") == {}
+    assert queue.depth() == 0
+
+
+def test_job_that_outlives_its_lease(queue) -> None:
+    job_id = queue.enqueue("t", "A", 1000, not_before=0)
+    stale = queue.lease(now=100)
+    # still running when the visibility timeout expires, the job is leased again
+    current = queue.lease(now=700)
+    queue.checkpoint([job_id], "download", "camera1", ["a.mp4"])
+
+    assert queue.retry(stale, "boom") is None
+    assert not queue.defer(stale, 60)
+    assert queue.ack_many([stale]) == []
+    row = _status(queue, job_id)
+    assert row["status"] == LEASED
+    assert row["leased_at"] == 700
+    assert queue.checkpoints([job_id], "download") != {}
+
+    assert queue.ack(current)
+    assert _status(queue, job_id)["status"] == DONE
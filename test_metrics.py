@@ -0,0 +1,33 @@
+import metrics
+
+
+def test_cached_callback_runs_once_per_scrape() -> None:
+    calls = []
+
+    def stats():
+        calls.append(1)
+        return {"pending": 3, "oldest": 12.5}
+
+    shared = metrics.cached(stats)
+    registry = metrics.Registry()
+    registry.gauge("jobs", "Jobs.", lambda: shared()["pending"])
+    registry.gauge("oldest", "Oldest job.", lambda: shared()["oldest"])
+
+    output = registry.render()
+
+    assert "jobs 3\n" in output
+    assert "oldest 12.5\n" in output
+    assert len(calls) == 1
+
+
+def test_cached_expires(monkeypatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(metrics.time, "monotonic", lambda: now[0])
+    values = iter([1, 2])
+    read = metrics.cached(lambda: next(values), max_age=1.0)
+
+    assert read() == 1
+    now[0] += 0.5
+    assert read() == 1
+    now[0] += 0.5
+    assert read() == 2
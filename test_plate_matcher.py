@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from plate_matcher import PlateMatcher, normalize_pattern, normalize_plate
+
+
+def test_normalization() -> None:
+    assert normalize_plate("AB-123 c") == "ab123c"
+    assert normalize_pattern(" ab-12* %x ") == "ab12*%x"
+
+
+def test_exact() -> None:
+    matcher = PlateMatcher(["AB-123-C"])
+
+    assert matcher.matches("ab 123 c")
+    assert "AB123C" in matcher
+    assert not matcher.matches("AB123")
+    assert not matcher.matches("AB123CD")
+
+
+def test_prefix() -> None:
+    matcher = PlateMatcher(["ab12*", "X*"])
+
+    assert matcher.matches("AB-12-XY")
+    assert matcher.matches("AB12")
+    assert matcher.matches("x-999")
+    assert not matcher.matches("AB1")
+    assert not matcher.matches("ZAB12")
+
+
+def test_regex() -> None:
+    matcher = PlateMatcher(["*12%", "a%c"])
+
+    assert matcher.matches("XY-12-Z")
+    assert not matcher.matches("XY-12")
+    assert matcher.matches("A-B-C")
+    assert not matcher.matches("ABBC")
+
+
+def test_empty_and_match_all_patterns_are_ignored() -> None:
+    matcher = PlateMatcher(["", "*", "--", "**"])
+
+    assert not matcher
+    assert len(matcher) == 0
+    assert not matcher.matches("AB123C")
+    assert not matcher.matches("")
+
+
+def test_matching_patterns() -> None:
+    matcher = PlateMatcher(["AB-123-C", "AB*", "ab1*", "*3%", "ZZ*"])
+
+    assert sorted(matcher.matching_patterns("ab 123 c")) == sorted(["AB-123-C", "AB*", "ab1*", "*3%"])
+    assert matcher.matching_patterns("ZZ-1") == ["ZZ*"]
+    assert matcher.matching_patterns("Q") == []
+
+
+def test_count_matching_events(tmp_path) -> None:
+    pytest.importorskip("flask")
+    from web_config_page import count_matching_events
+
+    db_path = str(tmp_path / "lpr.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE event (license_plate TEXT)")
+    conn.executemany(
+        "INSERT INTO event (license_plate) VALUES (?)",
+        [("AB-123-C",), ("AB123C",), ("ab 999 x",), ("XY-1",), (None,)],
+    )
+    conn.commit()
+    conn.close()
+
+    assert count_matching_events(db_path, PlateMatcher(["ab123c"])) == {"ab123c": 2}
+    assert count_matching_events(db_path, PlateMatcher(["AB*", "x%-1"])) == {"AB*": 3, "x%-1": 1}
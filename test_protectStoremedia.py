@@ -0,0 +1,131 @@
+import importlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("tenacity")
+
+
+@pytest.fixture(scope="module")
+def storemedia(tmp_path_factory):
+    # protectStoremedia sets itself up from config.json at import time
+    root = tmp_path_factory.mktemp("storemedia")
+    config_file = root / "config.json"
+    config_file.write_text(json.dumps({
+        "sqlite3_db_file": str(root / "lpr.db"),
+        "paths": {
+            "log_dir": str(root / "log"),
+            "log_file": str(root / "storemedia.log"),
+            "image_dir": str(root / "images"),
+            "queue_db_file": str(root / "queue.db"),
+            "queue_notify_socket": str(root / "queue.sock"),
+        },
+    }))
+    previous = os.environ.get("CONFIG_FILE")
+    os.environ["CONFIG_FILE"] = str(config_file)
+    sys.modules.pop("protectStoremedia", None)
+    try:
+        yield importlib.import_module("protectStoremedia")
+    finally:
+        sys.modules.pop("protectStoremedia", None)
+        if previous is None:
+            os.environ.pop("CONFIG_FILE", None)
+        else:
+            os.environ["CONFIG_FILE"] = previous
+
+
+def _downloaded(storemedia, job, image_dir):
+    path = os.path.join(image_dir, f"{job['license_plate']}.mp4")
+    future = Future()
+    future.set_result(([path], {}))
+    result = {
+        "timers": {job["id"]: storemedia.StageTimer()},
+        "image_dir": image_dir,
+        "shared_files": [],
+    }
+    return [job], result, {job["id"]: [(path, future)]}
+
+
+def test_db_writer_survives_failing_ack(storemedia, tmp_path, monkeypatch) -> None:
+    queue = storemedia.event_queue
+    first_id, second_id = queue.enqueue_many([("t1", "AB1", 1000, 0), ("t2", "AB2", 2000, 0)])
+    first, second = queue.lease(), queue.lease()
+
+    ack_many = queue.ack_many
+    ack_failed = threading.Event()
+
+    def failing_ack_many(jobs):
+        if not ack_failed.is_set():
+            ack_failed.set()
+            raise sqlite3.OperationalError("database is locked")
+        return ack_many(jobs)
+
+    monkeypatch.setattr(queue, "ack_many", failing_ack_many)
+    db_conn = storemedia.init_db(str(tmp_path / "events.db"))
+    pipeline = storemedia.Pipeline(downloaders=1, trimmers=1, db_conn=db_conn)
+    try:
+        pipeline.store_queue.put(_downloaded(storemedia, first, str(tmp_path)))
+        assert ack_failed.wait(10)
+        pipeline.store_queue.put(_downloaded(storemedia, second, str(tmp_path)))
+    finally:
+        pipeline.close()
+
+    status = {
+        row["id"]: row["status"]
+        for row in queue.conn.execute("SELECT id, status FROM event_queue WHERE id IN (?, ?)", (first_id, second_id))
+    }
+    # The first job stays leased and is retried after its visibility timeout
+    assert status == {first_id: "leased", second_id: "done"}
+    assert pipeline.finished == 1
+    assert db_conn.execute("SELECT COUNT(*) FROM event").fetchone()[0] == 2
+
+
+def test_unique_media_migration_backs_up_duplicates(storemedia, tmp_path) -> None:
+    conn = sqlite3.connect(str(tmp_path / "old.db"))
+    conn.execute("CREATE TABLE event (id INTEGER PRIMARY KEY AUTOINCREMENT, datetime TEXT, license_plate TEXT, media_urls TEXT)")
+    conn.executemany(
+        "INSERT INTO event (datetime, license_plate, media_urls) VALUES (?, ?, ?)",
+        [("t1", "AB1", '["a.mp4"]'), ("t2", "AB1", '["a.mp4", "a.jpg"]'), ("t3", "AB2", '["b.mp4"]')],
+    )
+    conn.commit()
+
+    storemedia.migrate_unique_media_index(conn)
+
+    assert conn.execute("SELECT id FROM event ORDER BY id").fetchall() == [(1,), (3,)]
+    assert conn.execute(
+        "SELECT id, license_plate, media_urls FROM event_duplicate_backup"
+    ).fetchall() == [(2, "AB1", '["a.mp4", "a.jpg"]')]
+    conn.close()
+
+
+def test_check_clip_length_per_camera(storemedia, monkeypatch) -> None:
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+
+    durations = {"front.mp4": 30.0, "back-1.mp4": 20.0, "back-2.mp4": 10.0, "side.mp4": 5.0}
+    monkeypatch.setattr(storemedia, "video_duration", durations.get)
+    removed = []
+    monkeypatch.setattr(storemedia.os, "remove", removed.append)
+    front, back, side = (SimpleNamespace(id=name, name=name) for name in ("front", "back", "side"))
+    start = datetime.now()
+    end = start + timedelta(seconds=30)
+
+    # split exports of one camera add up
+    storemedia.check_clip_length(
+        {"front": ["front.mp4"], "back": ["back-1.mp4", "back-2.mp4"]}, [front, back], start, end, 0.9
+    )
+    assert removed == []
+
+    # 65s over three cameras would pass a check of the total
+    with pytest.raises(storemedia.FootageNotReady, match="camera side"):
+        storemedia.check_clip_length(
+            {"front": ["front.mp4"], "back": ["back-1.mp4", "back-2.mp4"], "side": ["side.mp4"]},
+            [front, back, side], start, end, 0.7,
+        )
+    assert sorted(removed) == sorted(durations)
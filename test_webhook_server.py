@@ -0,0 +1,53 @@
+import http.client
+import threading
+import time
+
+from webhook_server import PooledHTTPServer, PooledRequestHandler
+
+
+class EchoHandler(PooledRequestHandler):
+    idle_timeout = 15
+
+    def do_GET(self):
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if self.should_close():
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _get(conn):
+    conn.request('GET', '/')
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.read() == b'ok'
+
+
+def test_idle_keepalive_connections_do_not_starve_new_clients() -> None:
+    server = PooledHTTPServer(('127.0.0.1', 0), EchoHandler, workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_address[1]
+
+    # more idle keep-alive connections than workers
+    idle = [http.client.HTTPConnection('127.0.0.1', port, timeout=5) for _ in range(3)]
+    try:
+        for conn in idle:
+            _get(conn)
+
+        start = time.monotonic()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        _get(conn)
+        conn.close()
+        assert time.monotonic() - start < 2
+    finally:
+        for conn in idle:
+            conn.close()
+        server.begin_shutdown()
+        thread.join(5)
+        server.server_close()
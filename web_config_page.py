@@ -1,5 +1,7 @@
-# File version: 1.1.0
+# File version: 1.2.1
 # Version history:
+# 1.2.1 - Count events for a single plate pattern the same way as the plate list. (2026-10-17)
+# 1.2.0 - Count events for ignored plate patterns with the shared plate matcher. (2026-10-16)
 # 1.1.0 - Add "Restart Protect Services" button and endpoint. (2024-06-09)
 # 1.0.0 - Add version history and file version header. (2024-06-09)
 
@@ -11,6 +13,8 @@ import logging
 import re
 import subprocess
 import sqlite3
+from config_cache import ConfigCache
+from plate_matcher import PlateMatcher
 
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'protect-lpr-secret')
@@ -24,6 +28,9 @@ config_bp = Blueprint('config_bp', __name__, url_prefix='/config')
 CONFIG_FILE = "config.json"
 USERS_FILE = "users.json"
 
+# Shared with protectEvent: the ignored-plates matcher is rebuilt only when config.json changes
+CONFIG_CACHE = ConfigCache(CONFIG_FILE, logger=logger)
+
 def load_config():
     if not os.path.exists(CONFIG_FILE):
         logger.error(f"Config file '{CONFIG_FILE}' not found. Exiting.")
@@ -69,6 +76,24 @@ def password_is_complex(pw):
         requirements.append("minimaal 1 speciaal teken (!@#$%^&* etc.)")
     return requirements
 
+def count_matching_events(db_path, matcher):
+    """Return {pattern: number of events} for the patterns of a PlateMatcher.
+
+    Entries may be patterns (fleet prefixes, * and %), so count with the same
+    matcher protectEvent uses: one pass over the distinct plates in the database.
+    """
+    counts = {pattern: 0 for pattern in matcher.patterns}
+    conn = sqlite3.connect(db_path)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT license_plate, COUNT(*) FROM event GROUP BY license_plate")
+        for license_plate, count in c.fetchall():
+            for pattern in matcher.matching_patterns(license_plate or ""):
+                counts[pattern] += count
+    finally:
+        conn.close()
+    return counts
+
 @config_bp.route('/', methods=['GET', 'POST'])
 def config_page():
     config = load_config()
@@ -89,13 +114,11 @@ def config_page():
         normalized_plates.append({"plate": plate_value, "comment": comment})
         plate_comments[plate_value] = comment
     try:
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        for plate_obj in normalized_plates:
-            plate = plate_obj["plate"]
-            c.execute("SELECT COUNT(*) FROM event WHERE license_plate = ?", (plate,))
-            plate_event_counts[plate] = c.fetchone()[0]
-        conn.close()
+        CONFIG_CACHE.get()
+        plate_event_counts = {plate_obj["plate"]: 0 for plate_obj in normalized_plates}
+        for pattern, count in count_matching_events(db_path, CONFIG_CACHE.ignored_plates).items():
+            if pattern in plate_event_counts:
+                plate_event_counts[pattern] += count
     except Exception:
         plate_event_counts = {plate_obj["plate"]: 0 for plate_obj in normalized_plates}
     # ---
@@ -191,12 +214,8 @@ def event_count():
     count = 0
     if plate:
         try:
-            import sqlite3
-            conn = sqlite3.connect(db_path)
-            c = conn.cursor()
-            c.execute("SELECT COUNT(*) FROM event WHERE license_plate = ?", (plate,))
-            count = c.fetchone()[0]
-            conn.close()
+            # Same normalization and wildcards as the counts on the config page
+            count = count_matching_events(db_path, PlateMatcher([plate])).get(plate, 0)
         except Exception:
             count = 0
     return jsonify({'count': count})
@@ -8,6 +8,9 @@ from flask import send_file, request, Response
 import io
 import csv
 import configparser
+import time
+from flask import jsonify
+from stage_timings import summarize_timings
 
 stats_bp = Blueprint('stats_bp', __name__, url_prefix='/stats')
 
@@ -295,6 +298,21 @@ def stats_page():
 
     return render_template_string(STATS_TEMPLATE, stats=stats)
 
+@stats_bp.route("/timings")
+def timings():
+    """Per-stage media processing timings (see stage_timings.py) over the last ?hours= (default 24)."""
+    db_file = current_app.config.get("DB_FILE") or "/var/lib/protect-lpr/mysql/protect-lpr.db"
+    try:
+        hours = float(request.args.get("hours", 24))
+    except ValueError:
+        return jsonify({"error": "hours must be a number"}), 400
+    conn = sqlite3.connect(db_file)
+    try:
+        stages = summarize_timings(conn, time.time() - hours * 3600)
+    finally:
+        conn.close()
+    return jsonify({"hours": hours, "stages": stages})
+
 @stats_bp.route("/download_events")
 def download_events():
     db_file = current_app.config.get("DB_FILE") or "/var/lib/protect-lpr/mysql/protect-lpr.db"
@@ -0,0 +1,148 @@
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Pooled HTTP/1.1 server for the webhook receiver (protectEvent.py).
+#
+# Each connection is served by one of a fixed number of worker threads. Between two
+# requests on a kept-alive connection the worker waits for the next request with
+# select(), and gives the connection up as soon as the pool is saturated (a new
+# connection is waiting for a worker) or the server shuts down. Idle keep-alive
+# clients therefore never make a new client wait for the keep-alive timeout.
+
+
+class PooledRequestHandler(BaseHTTPRequestHandler):
+    """Keep-alive request handler for PooledHTTPServer.
+
+    `timeout` bounds reading a request; `idle_timeout` is how long a connection may
+    sit idle between requests while the pool has free workers.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    timeout = 15
+    idle_timeout = 15
+    # Headers and body are written separately; without TCP_NODELAY a kept-alive
+    # connection stalls ~40ms per response on Nagle + delayed ACK
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.wait_for_request():
+            self.handle_one_request()
+
+    def should_close(self):
+        """True if this connection should be closed after its current response."""
+        return getattr(self.server, 'shutting_down', False) or getattr(self.server, 'saturated', False)
+
+    def _buffered_or_available(self):
+        # Bytes of the next request already read into rfile, or readable right now.
+        # Non-blocking, so an empty result means nothing yet or end of stream.
+        self.connection.setblocking(False)
+        try:
+            return self.rfile.peek(1)
+        except (BlockingIOError, ConnectionError):
+            return b''
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def wait_for_request(self):
+        """Wait until the next request arrives on this keep-alive connection.
+
+        Returns False (close the connection) when the client disconnects, the idle
+        timeout expires, or the server needs this worker for another connection.
+        """
+        deadline = time.monotonic() + self.idle_timeout
+        wake = getattr(self.server, 'wake_socket', None)
+        while True:
+            if self._buffered_or_available():
+                return True
+            remaining = deadline - time.monotonic()
+            if self.should_close() or remaining <= 0:
+                return False
+            waiting_on = [self.connection] + ([wake] if wake is not None else [])
+            readable, _, _ = select.select(waiting_on, [], [], remaining)
+            if self.connection in readable:
+                # Readable without data means the client closed the connection
+                return bool(self._buffered_or_available())
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that serves each connection on a bounded pool of worker threads."""
+
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers=8):
+        super().__init__(server_address, handler_class)
+        self.workers = max(1, int(workers))
+        self.shutting_down = False
+        self.saturated = False
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='webhook')
+        # One slot per worker: when all workers are busy the accept loop blocks and new
+        # connections wait in the listen backlog instead of queueing up in memory.
+        self._slots = threading.BoundedSemaphore(self.workers)
+        # Idle keep-alive connections select() on wake_socket; a byte written to the
+        # other end tells them to give their worker back
+        self.wake_socket, self._wake_writer = socket.socketpair()
+        self.wake_socket.setblocking(False)
+        self._wake_writer.setblocking(False)
+
+    def _wake_idle_connections(self):
+        try:
+            self._wake_writer.send(b'x')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _clear_wake(self):
+        try:
+            while self.wake_socket.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            # All workers are busy: idle keep-alive connections are closed right away and
+            # busy ones after their current response, so the waiting client gets a turn
+            self.saturated = True
+            self._wake_idle_connections()
+            self._slots.acquire()
+            self.saturated = False
+            self._clear_wake()
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Executor already shut down
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def begin_shutdown(self):
+        """Stop accepting connections; safe to call from a signal handler."""
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+        self._wake_idle_connections()
+        # shutdown() blocks until serve_forever() returns, so it must run on another thread
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def server_close(self):
+        super().server_close()
+        # Let in-flight requests finish; idle keep-alive connections close right away
+        self.shutting_down = True
+        self._wake_idle_connections()
+        self._executor.shutdown(wait=True)
+        self.wake_socket.close()
+        self._wake_writer.close()